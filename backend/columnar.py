@@ -0,0 +1,88 @@
+"""
+Shared layout of the memory-mapped columnar files (market snapshots, dump cache).
+
+All integers little-endian::
+
+    offset 0   8 bytes   magic (one per file kind)
+    offset 8   uint32    format version
+    offset 12  uint32    header length H
+    offset 16  H bytes   header, UTF-8 JSON; ``columns`` is
+                         {name: {"dtype": numpy dtype str, "offset": absolute byte offset, "length": values}}
+    then       the columns, each starting on a 64-byte boundary
+
+Files are written to a temporary name and published with ``os.replace``, so a
+reader never sees a partial file and keeps its existing mapping valid.
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+ALIGNMENT = 64
+PREAMBLE = struct.Struct("<8sII")
+
+
+class FormatError(ValueError):
+    pass
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write(path, magic, version, header, columns, error=FormatError):
+    """Write ``header`` (a JSON-able dict) and the ``columns`` {name: array} to ``path``."""
+    header = dict(header, columns={})
+    columns = {name: np.ascontiguousarray(values) for name, values in columns.items()}
+
+    # Column offsets depend on the header length, which depends on the offsets:
+    # lay out with a placeholder, then pad the header to the reserved size.
+    for _ in range(2):
+        encoded = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        offset = _align(PREAMBLE.size + len(encoded) + 16)
+        for name, values in columns.items():
+            header["columns"][name] = {"dtype": values.dtype.str, "offset": offset, "length": len(values)}
+            offset = _align(offset + values.nbytes)
+    encoded = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    first_column = min((spec["offset"] for spec in header["columns"].values()),
+                       default=PREAMBLE.size + len(encoded))
+    if PREAMBLE.size + len(encoded) > first_column:
+        raise error("Header does not fit its reserved space")
+    encoded = encoded.ljust(first_column - PREAMBLE.size, b" ")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "wb") as f:
+        f.write(PREAMBLE.pack(magic, version, len(encoded)))
+        f.write(encoded)
+        for name, values in columns.items():
+            f.seek(header["columns"][name]["offset"])
+            f.write(values.tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+def read(path, magic, version, error=FormatError):
+    """Memory-map ``path``; returns (header, {name: read-only NumPy view}).
+
+    Raises ``error`` for another magic or version.
+    """
+    mapped = np.memmap(path, dtype=np.uint8, mode="r")
+    if len(mapped) < PREAMBLE.size:
+        raise error(f"{path} is truncated")
+    file_magic, file_version, header_len = PREAMBLE.unpack(bytes(mapped[:PREAMBLE.size]))
+    if file_magic != magic:
+        raise error(f"{path} has the wrong magic")
+    if file_version != version:
+        raise error(f"{path} has format version {file_version}, expected {version}")
+    header = json.loads(bytes(mapped[PREAMBLE.size:PREAMBLE.size + header_len]))
+
+    columns = {}
+    for name, spec in header["columns"].items():
+        dtype = np.dtype(spec["dtype"])
+        start = spec["offset"]
+        length = spec.get("length", header.get("rows"))
+        columns[name] = mapped[start:start + length * dtype.itemsize].view(dtype)
+    return header, columns
@@ -1,17 +1,135 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+import sqlite3
+
+from . import bonuses
 
 # Connect to the same DB as the scraper
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "metin2.db")
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "database", "schema.sql")
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
 
+# Seconds a connection waits for a lock before raising "database is locked"
+BUSY_TIMEOUT_SECONDS = 30
+
+# Applied to every connection of the API, scraper and scheduler. WAL lets
+# dashboard reads continue while a scrape is committing.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA cache_size=-65536",    # 64 MB
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def apply_pragmas(conn):
+    cursor = conn.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def get_connection(path: str = DB_PATH) -> sqlite3.Connection:
+    """Open a tuned raw sqlite3 connection (used by the scraper and scheduler)."""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS)
+    apply_pragmas(conn)
+    return conn
+
+
+# Columns added to existing tables after their first release: {table: {column: type}}
+ADDED_COLUMNS = {
+    "items": {"vnum": "INTEGER"},
+    "listings": {"outlier_reason": "TEXT", "vnum": "INTEGER", "bonus_digest": "TEXT"},
+    "listing_snapshots": {"outlier_reason": "TEXT"},
+    "item_price_aggregates": {"scrape_count": "INTEGER NOT NULL DEFAULT 1", "bottom_count": "INTEGER"},
+}
+
+# Indexes on added columns, created once the columns exist
+ADDED_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_items_vnum ON items(vnum)",
+)
+
+
+def add_missing_columns(cursor):
+    """ALTER TABLE ... ADD COLUMN for every entry of ADDED_COLUMNS not present yet,
+    then create ADDED_INDEXES."""
+    for table, columns in ADDED_COLUMNS.items():
+        present = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()}
+        for name, column_type in columns.items():
+            if name not in present:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+    for statement in ADDED_INDEXES:
+        cursor.execute(statement)
+
+
+def schema_statements():
+    """The statements of schema.sql, one by one."""
+    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines(keepends=True)
+    statements, pending = [], ""
+    for line in lines:
+        pending += line
+        if sqlite3.complete_statement(pending):
+            statements.append(pending.strip())
+            pending = ""
+    return statements
+
+
+def migrate_schema(conn):
+    """Create and upgrade all tables of schema.sql in one write transaction.
+
+    Both the scheduler (scraper.init_db) and the API (main.lifespan) call this
+    on startup; BEGIN IMMEDIATE makes the second one wait and then find an
+    up-to-date database, so neither sees a half-migrated table.
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # Bonuses used to be stored as rendered text; move that table aside first
+        text_bonuses = bonuses.detach_text_bonuses(cursor)
+        for statement in schema_statements():
+            cursor.execute(statement)
+        add_missing_columns(cursor)
+        if text_bonuses:
+            converted, dropped = bonuses.convert_text_bonuses(cursor)
+            print(f"Converted {converted} listing bonuses to attribute ids ({dropped} unrecognized dropped).")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def bump_scrape_generation(cursor):
+    """Advance the scrape generation; call inside the transaction that changes market data."""
+    cursor.execute("""
+        INSERT INTO scrape_state (id, generation) VALUES (1, 1)
+        ON CONFLICT(id) DO UPDATE SET generation = generation + 1
+    """)
+
+
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT_SECONDS}
 )
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    apply_pragmas(dbapi_connection)
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def get_scrape_generation() -> int:
+    """Current scrape generation (0 before the first scrape)."""
+    with engine.connect() as conn:
+        row = conn.exec_driver_sql("SELECT generation FROM scrape_state WHERE id = 1").first()
+    return row[0] if row else 0
+
+
 Base = declarative_base()
 
 def get_db():
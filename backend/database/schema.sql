@@ -10,6 +10,7 @@ CREATE TABLE IF NOT EXISTS items (
     name TEXT NOT NULL,
     category TEXT,
     image_url TEXT,
+    vnum INTEGER, -- game item id the name belongs to (see vnum_names.py)
     UNIQUE(name)
 );
 
@@ -18,22 +19,25 @@ CREATE TABLE IF NOT EXISTS listings (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     server_id INTEGER,
     item_id INTEGER,
+    vnum INTEGER,
     seller_name TEXT,
     quantity INTEGER,
     price_won INTEGER DEFAULT 0,
     price_yang INTEGER DEFAULT 0,
     total_price_yang BIGINT, -- Calculated total value for sorting
+    bonus_digest TEXT, -- hash of the bonus pairs, part of the listing signature (scraper.bonus_digest)
     seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    outlier_reason TEXT, -- NULL, 'price', 'seller' or 'fake' (see outliers.py)
     FOREIGN KEY(server_id) REFERENCES servers(id),
     FOREIGN KEY(item_id) REFERENCES items(id)
 );
 
--- Item Bonuses/Attributes (e.g., "Ortalama Zarar 45%")
+-- Item Bonuses/Attributes as raw integers (72, 15 -> "Durchschn. Schaden 15%", see bonuses.py)
 CREATE TABLE IF NOT EXISTS listing_bonuses (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     listing_id INTEGER,
-    bonus_name TEXT NOT NULL,
-    bonus_value TEXT,
+    attr_id INTEGER NOT NULL,
+    attr_value INTEGER NOT NULL,
     FOREIGN KEY(listing_id) REFERENCES listings(id)
 );
 
@@ -78,15 +82,101 @@ CREATE TABLE IF NOT EXISTS listing_snapshots (
     price_yang INTEGER DEFAULT 0,
     total_price_yang BIGINT NOT NULL,
     unit_price BIGINT NOT NULL,
-    scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    outlier_reason TEXT
+);
+
+-- Per-scrape price aggregates (materialized at ingestion, outliers and fake sellers excluded)
+CREATE TABLE IF NOT EXISTS item_price_aggregates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    server_name TEXT NOT NULL,
+    item_name TEXT NOT NULL,
+    scraped_at TIMESTAMP NOT NULL,
+    listing_count INTEGER NOT NULL,
+    min_price BIGINT,
+    max_price BIGINT,
+    avg_price BIGINT,
+    avg_bottom20_price BIGINT,
+    p10_price BIGINT,
+    median_price BIGINT,
+    p90_price BIGINT,
+    scrape_count INTEGER NOT NULL DEFAULT 1, -- scrapes merged into the row (retention.py)
+    bottom_count INTEGER, -- listings behind avg_bottom20_price, set on rolled-up rows
+    UNIQUE(server_name, item_name, scraped_at)
+);
+
+-- Per-server item ranking (rewritten by the scraper for each server it ingests)
+CREATE TABLE IF NOT EXISTS server_item_stats (
+    server_id INTEGER NOT NULL,
+    item_id INTEGER NOT NULL,
+    listing_count INTEGER NOT NULL,
+    total_quantity INTEGER NOT NULL,
+    min_unit_price BIGINT,
+    prev_min_unit_price BIGINT,
+    updated_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (server_id, item_id),
+    FOREIGN KEY(server_id) REFERENCES servers(id),
+    FOREIGN KEY(item_id) REFERENCES items(id)
+);
+
+-- Per-seller outlier history (drives the automatic "seller" verdict)
+CREATE TABLE IF NOT EXISTS seller_outlier_stats (
+    server_name TEXT NOT NULL,
+    seller_name TEXT NOT NULL,
+    listing_count REAL NOT NULL DEFAULT 0, -- decayed counts, see outliers.py
+    outlier_count REAL NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (server_name, seller_name)
+);
+
+-- Scrape generation (single row, bumped on every market data commit; API cache key)
+CREATE TABLE IF NOT EXISTS scrape_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    generation INTEGER NOT NULL DEFAULT 0
+);
+
+-- Localized item names by vnum, refreshed when the CDN copy changes (vnum_names.py)
+CREATE TABLE IF NOT EXISTS item_names (
+    lang TEXT NOT NULL,
+    vnum INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (lang, vnum)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS item_name_versions (
+    lang TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    checked_at REAL NOT NULL -- unix time of the last revalidation
+);
+
+-- How far each retention tier has rolled up item_price_aggregates (retention.py)
+CREATE TABLE IF NOT EXISTS retention_state (
+    tier TEXT PRIMARY KEY,
+    rolled_until TIMESTAMP NOT NULL
+);
+
+-- SHA-256 of the store dump last ingested per server (unchanged dumps are skipped)
+CREATE TABLE IF NOT EXISTS ingested_dumps (
+    server_name TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    ingested_at TIMESTAMP
 );
 
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_listings_item_server ON listings(item_id, server_id);
 CREATE INDEX IF NOT EXISTS idx_listings_seen_at ON listings(seen_at);
+DROP INDEX IF EXISTS idx_listings_server;
+CREATE INDEX IF NOT EXISTS idx_listings_server_seen ON listings(server_id, seen_at, id);
+CREATE INDEX IF NOT EXISTS idx_listings_server_price ON listings(server_id, total_price_yang, id);
+CREATE INDEX IF NOT EXISTS idx_listings_price ON listings(total_price_yang, id);
+CREATE INDEX IF NOT EXISTS idx_listing_bonuses_listing ON listing_bonuses(listing_id);
+CREATE INDEX IF NOT EXISTS idx_listing_bonuses_attr ON listing_bonuses(attr_id, attr_value);
 CREATE INDEX IF NOT EXISTS idx_price_history_item ON price_history(item_name);
 CREATE INDEX IF NOT EXISTS idx_price_history_timestamp ON price_history(timestamp);
 CREATE INDEX IF NOT EXISTS idx_fake_sellers_name ON fake_sellers(seller_name);
 CREATE INDEX IF NOT EXISTS idx_listing_snapshots_item ON listing_snapshots(item_name);
 CREATE INDEX IF NOT EXISTS idx_listing_snapshots_time ON listing_snapshots(scraped_at);
-CREATE INDEX IF NOT EXISTS idx_listing_snapshots_seller ON listing_snapshots(seller_name);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_listing_snapshots_seller ON listing_snapshots(seller_name);
+CREATE INDEX IF NOT EXISTS idx_item_price_aggregates_item_time ON item_price_aggregates(item_name, scraped_at);
+CREATE INDEX IF NOT EXISTS idx_item_price_aggregates_time ON item_price_aggregates(scraped_at);
+CREATE INDEX IF NOT EXISTS idx_server_item_stats_count ON server_item_stats(server_id, listing_count);
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+Compact binary cache of parsed store dumps.
+
+Once a downloaded dump has been parsed and normalized, its ``Listing`` tuples
+are written to ``data/cache_<key>.m2dump`` and the raw JSON body is dropped.
+Item names and sellers are interned into string tables and bonuses become
+one ragged pair of integer columns, so the file is a fraction of the JSON
+size. When the dump has to be ingested again without having changed (the
+server answered 304, but the previous ingest failed or the database is new),
+``load_dump`` memory-maps the file and rebuilds the listings without any JSON
+decoding or normalization.
+
+File layout: columnar.py, magic b"M2DUMPv\\x00", version 2. The header holds
+``sha256`` (of the raw body the file was built from) and ``rows`` N; columns::
+
+    vnum          <i8  game item id
+    item          <i4  index into the item name table
+    seller        <i4  index into the seller table
+    quantity      <i4
+    price_won     <i8
+    price_yang    <i8
+    bonus_start   <i8  N + 1 offsets into the bonus columns
+    bonus_attr    <i4  attribute ids (bonuses.py)
+    bonus_value   <i4
+    item_text     u1   UTF-8 item names, concatenated
+    item_end      <i8  end offset of every item name in item_text
+    seller_text   u1   UTF-8 seller names, concatenated
+    seller_end    <i8  end offset of every seller name in seller_text
+
+Version history: 1 – initial layout; 2 – adds the ``vnum`` column. Files of
+another version are ignored (the dump is downloaded and parsed again).
+"""
+
+import os
+
+import numpy as np
+
+from . import columnar
+from .normalize import Listing
+
+MAGIC = b"M2DUMPv\x00"
+FORMAT_VERSION = 2
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+def dump_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"cache_{key}.m2dump")
+
+
+def _encode_strings(strings):
+    encoded = [string.encode("utf-8") for string in strings]
+    ends = np.cumsum([len(data) for data in encoded], dtype=np.int64)
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), ends
+
+
+def _decode_strings(text, ends):
+    data = text.tobytes()
+    starts = [0] + ends[:-1].tolist()
+    return [data[start:end].decode("utf-8") for start, end in zip(starts, ends.tolist())]
+
+
+def write_dump(key: str, sha256: str, listings) -> str:
+    """Write the parsed listings of the raw dump with hash ``sha256``. Returns the file path."""
+    item_index = {}
+    seller_index = {}
+    vnums, items, sellers, quantities, won, yang = [], [], [], [], [], []
+    bonus_start = [0]
+    bonus_attr, bonus_value = [], []
+    for listing in listings:
+        vnums.append(listing.vnum)
+        items.append(item_index.setdefault(listing.item_name, len(item_index)))
+        sellers.append(seller_index.setdefault(listing.seller, len(seller_index)))
+        quantities.append(listing.quantity)
+        won.append(listing.price_won)
+        yang.append(listing.price_yang)
+        for attr_id, value in listing.bonuses:
+            bonus_attr.append(attr_id)
+            bonus_value.append(value)
+        bonus_start.append(len(bonus_attr))
+
+    item_text, item_end = _encode_strings(item_index)
+    seller_text, seller_end = _encode_strings(seller_index)
+    columns = {
+        "vnum": np.asarray(vnums, dtype="<i8"),
+        "item": np.asarray(items, dtype="<i4"),
+        "seller": np.asarray(sellers, dtype="<i4"),
+        "quantity": np.asarray(quantities, dtype="<i4"),
+        "price_won": np.asarray(won, dtype="<i8"),
+        "price_yang": np.asarray(yang, dtype="<i8"),
+        "bonus_start": np.asarray(bonus_start, dtype="<i8"),
+        "bonus_attr": np.asarray(bonus_attr, dtype="<i4"),
+        "bonus_value": np.asarray(bonus_value, dtype="<i4"),
+        "item_text": item_text,
+        "item_end": item_end,
+        "seller_text": seller_text,
+        "seller_end": seller_end,
+    }
+    return columnar.write(dump_path(key), MAGIC, FORMAT_VERSION, {"sha256": sha256, "rows": len(items)}, columns)
+
+
+def _open(key: str, sha256: str):
+    try:
+        header, columns = columnar.read(dump_path(key), MAGIC, FORMAT_VERSION)
+    except (OSError, ValueError):
+        return None
+    return columns if header.get("sha256") == sha256 else None
+
+
+def has_dump(key: str, sha256: str) -> bool:
+    """Whether a binary cache built from the raw body with ``sha256`` exists."""
+    return _open(key, sha256) is not None
+
+
+def load_dump(key: str, sha256: str) -> list[Listing] | None:
+    """The listings cached for the raw body with ``sha256`` (None if not cached)."""
+    columns = _open(key, sha256)
+    if columns is None:
+        return None
+    names = _decode_strings(columns["item_text"], columns["item_end"])
+    sellers = _decode_strings(columns["seller_text"], columns["seller_end"])
+
+    pairs = list(zip(columns["bonus_attr"].tolist(), columns["bonus_value"].tolist()))
+    starts = columns["bonus_start"].tolist()
+    bonuses = [tuple(pairs[start:end]) for start, end in zip(starts, starts[1:])]
+    won = columns["price_won"]
+    yang = columns["price_yang"]
+    totals = (won * 100_000_000 + yang).tolist()
+
+    return [
+        Listing(names[item], sellers[seller], quantity, price_won, price_yang, total, bonus, vnum)
+        for item, seller, quantity, price_won, price_yang, total, bonus, vnum in zip(
+            columns["item"].tolist(), columns["seller"].tolist(), columns["quantity"].tolist(),
+            won.tolist(), yang.tolist(), totals, bonuses, columns["vnum"].tolist(),
+        )
+    ]
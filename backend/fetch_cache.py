@@ -0,0 +1,148 @@
+"""
+Conditional-request cache for the store dumps.
+
+Each dump is kept on disk next to a small metadata file with the validators
+the server sent (ETag, Last-Modified) and the SHA-256 of the body. A refetch
+sends If-None-Match / If-Modified-Since, so an unchanged dump costs a 304
+instead of the full multi-MB body. Servers or CDNs without validators still
+send the body; either way the returned SHA-256 lets the scraper compare the
+dump with the one it ingested last and skip parsing and ingestion altogether
+when nothing changed.
+
+Files: ``data/cache_<key>.json`` (raw body, dropped once the caller keeps a
+parsed copy, e.g. dump_cache.py) and ``data/cache_<key>.meta.json``.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+
+import httpx
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class CachedDump:
+    path: str | None     # raw body on disk (None once replaced by the parsed dump cache)
+    sha256: str
+    not_modified: bool   # the server answered 304
+    size: int
+
+
+def body_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"cache_{key}.json")
+
+
+def _meta_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"cache_{key}.meta.json")
+
+
+def load_meta(key: str) -> dict:
+    try:
+        with open(_meta_path(key), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _temp_file(path: str, mode: str = "wb", **kwargs):
+    """A uniquely named temporary file next to ``path``, published with os.replace.
+
+    Concurrent fetches of the same key each write their own file, so neither
+    can interleave with or truncate the other's body.
+    """
+    directory, name = os.path.split(path)
+    return tempfile.NamedTemporaryFile(mode, dir=directory, prefix=f"{name}.", suffix=".part", delete=False,
+                                       **kwargs)
+
+
+def _save_meta(key: str, meta: dict) -> None:
+    with _temp_file(_meta_path(key), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(f.name, _meta_path(key))
+
+
+def _conditional_headers(meta: dict, url: str, key: str, has_parsed_copy) -> dict:
+    # Revalidate only while the body is still around, raw or as the caller's parsed copy
+    if meta.get("url") != url or not meta.get("sha256"):
+        return {}
+    if not os.path.exists(body_path(key)) and not (has_parsed_copy and has_parsed_copy(meta["sha256"])):
+        return {}
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+async def fetch(client: httpx.AsyncClient, url: str, key: str, has_parsed_copy=None) -> CachedDump:
+    """Fetch ``url`` into the cache entry ``key``, revalidating what is already cached.
+
+    Once the raw body was dropped (``drop_body``), revalidation continues as long
+    as ``has_parsed_copy(sha256)`` says the caller still holds that body's data.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = body_path(key)
+    meta = load_meta(key)
+    conditional = _conditional_headers(meta, url, key, has_parsed_copy)
+    headers = {"Accept": "application/json", "Cache-Control": "no-cache", **conditional}
+
+    async with client.stream("GET", url, headers=headers) as resp:
+        if resp.status_code == 304 and conditional:
+            print(f"Not modified: {url}")
+            if not os.path.exists(path):
+                return CachedDump(None, meta["sha256"], True, meta.get("size", 0))
+            return CachedDump(path, meta["sha256"], True, os.path.getsize(path))
+        resp.raise_for_status()
+
+        print(f"Fetching {url}...")
+        hasher = hashlib.sha256()
+        size = 0
+        with _temp_file(path) as out:
+            try:
+                async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+            except BaseException:
+                out.close()
+                os.remove(out.name)
+                raise
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+
+    # Only publish once the whole body arrived
+    os.replace(out.name, path)
+    sha256 = hasher.hexdigest()
+    _save_meta(key, {"url": url, "etag": etag, "last_modified": last_modified, "sha256": sha256, "size": size})
+    print(f"Fetched {size / 1024 / 1024:.1f} MB.")
+    return CachedDump(path, sha256, False, size)
+
+
+def drop_body(key: str) -> None:
+    """Delete the raw body once a parsed copy is cached; revalidation keeps working."""
+    try:
+        os.remove(body_path(key))
+    except OSError:
+        pass
+
+
+def discard(key: str) -> None:
+    """Forget a cache entry (e.g. because its body turned out to be malformed)."""
+    for path in (body_path(key), _meta_path(key)):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def iter_file(path: str):
+    """Read a cached body in CHUNK_SIZE pieces."""
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
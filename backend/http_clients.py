@@ -0,0 +1,106 @@
+"""
+Process-wide registry of pooled httpx clients.
+
+Every outbound call (metin2alerts CDN, Telegram Bot API) goes through one
+long-lived client per upstream host instead of building a new client per
+request, so DNS, TCP and TLS setup is paid once and bursts reuse warm
+keep-alive connections. HTTP/2 is used when the optional ``h2`` package is
+installed (``pip install httpx[http2]``) and HTTP2_ENABLED is not "0".
+
+Clients are created lazily; call ``aclose_all()`` / ``close_all()`` on
+shutdown (FastAPI lifespan, scheduler exit, scraper CLI).
+"""
+
+import asyncio
+import importlib.util
+import os
+import threading
+
+import httpx
+
+HTTP2_ENABLED = (
+    os.environ.get("HTTP2_ENABLED", "1") != "0"
+    and importlib.util.find_spec("h2") is not None
+)
+
+# One profile per upstream host – the pool limits therefore act as per-host limits.
+CLIENT_PROFILES = {
+    "metin2alerts": {
+        "timeout": 120,
+        "max_connections": int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", "8")),
+        "headers": {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+            "Referer": "https://metin2alerts.com/store/",
+        },
+    },
+    "telegram": {
+        "timeout": 15,
+        "max_connections": 4,
+        "headers": {},
+    },
+}
+
+KEEPALIVE_EXPIRY_SECONDS = 60
+
+_lock = threading.Lock()
+_async_clients: dict[str, tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = {}
+_sync_clients: dict[str, httpx.Client] = {}
+
+
+def _client_kwargs(name: str) -> dict:
+    profile = CLIENT_PROFILES[name]
+    return {
+        "timeout": profile["timeout"],
+        "headers": profile["headers"],
+        "http2": HTTP2_ENABLED,
+        "limits": httpx.Limits(
+            max_connections=profile["max_connections"],
+            max_keepalive_connections=profile["max_connections"],
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    }
+
+
+def get_async_client(name: str) -> httpx.AsyncClient:
+    """Return the shared AsyncClient for a profile (must be called inside a running loop).
+
+    An AsyncClient's pool is bound to the event loop it was first used on, so a
+    new client is created if the caller runs on a different loop.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        entry = _async_clients.get(name)
+        if entry and entry[1] is loop and not entry[0].is_closed:
+            return entry[0]
+        client = httpx.AsyncClient(**_client_kwargs(name))
+        _async_clients[name] = (client, loop)
+        return client
+
+
+def get_sync_client(name: str) -> httpx.Client:
+    """Return the shared blocking Client for a profile."""
+    with _lock:
+        client = _sync_clients.get(name)
+        if client is None or client.is_closed:
+            client = httpx.Client(**_client_kwargs(name))
+            _sync_clients[name] = client
+        return client
+
+
+async def aclose_all() -> None:
+    """Close every AsyncClient that belongs to the currently running loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        mine = [name for name, (_, owner) in _async_clients.items() if owner is loop]
+        clients = [_async_clients.pop(name)[0] for name in mine]
+    for client in clients:
+        await client.aclose()
+
+
+def close_all() -> None:
+    """Close every blocking Client."""
+    with _lock:
+        clients = list(_sync_clients.values())
+        _sync_clients.clear()
+    for client in clients:
+        client.close()
@@ -0,0 +1,131 @@
+"""
+Item-name search index.
+
+Item names are folded (case, diacritics, Turkish dotless i, ß) and stored in
+``item_search``, an FTS5 table with the trigram tokenizer whose rowid is the
+item id. Substring lookups (``LIKE '%query%'``) on it are served from the
+trigram index instead of scanning, and are case- and diacritic-insensitive:
+"dolunay kilici" finds "Dolunay Kılıcı+9". On SQLite builds without the
+trigram tokenizer a plain table is used and the same query falls back to a
+scan of the (small) folded name table. Each row also keeps the unfolded
+``source_name`` it was built from, so renamed or deleted items are re-indexed.
+
+The listings endpoint, the scheduler's alert matcher and the slang aliases in
+ITEM_NAME_MAPPINGS all resolve item names through ``search_item_ids``.
+
+The index holds the ingested (German) names. A query in another language
+(``lang``) is matched against that language's name table (vnum_names.py),
+folded once per table version and item count and then kept in memory.
+"""
+
+import sqlite3
+import unicodedata
+
+from . import vnum_names
+
+# Common item name mappings (Short/Slang -> Full Game Name, German)
+ITEM_NAME_MAPPINGS = {
+    "vollmond": "Vollmondschwert",
+    "gift": "Giftschwert",
+    "klinge": "Klinge des Verderbens",
+    "rep": "Roter Eisenschlitzer",
+    "rundschild": "Schwarzer Rundschild",
+    "hirschhorn": "Hirschhorn-Bogen",
+    "groll": "Grollschwert",
+    "stahlrüstung": "Blaue Stahlrüstung",
+    "fünfeck": "Fünfeckschild",
+    "orchidee": "Orchideenglocke",
+    "löwenmaul": "Löwenmaulschild",
+    "falke": "Falkenschild",
+    "tiger": "Tigerschild",
+    "ebenholz": "Ebenholz-Ohrring",
+    "himmelsauge": "Himmelsaugen-Halskette",
+}
+
+# Letters that NFKD does not decompose into base letter + combining mark
+_FOLD_TABLE = str.maketrans({"ı": "i", "ø": "o", "æ": "ae", "œ": "oe", "đ": "d", "ł": "l"})
+
+
+def fold(text: str) -> str:
+    """Normalize a name for matching: casefold, strip diacritics, map special letters."""
+    text = unicodedata.normalize("NFKD", text.casefold().translate(_FOLD_TABLE))
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+_FOLDED_MAPPINGS = {fold(short): fold(full) for short, full in ITEM_NAME_MAPPINGS.items()}
+
+
+def ensure_search_index(cursor) -> None:
+    """Create the item_search table (FTS5 trigram if available)."""
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(item_search)").fetchall()}
+    if columns and "source_name" not in columns:
+        cursor.execute("DROP TABLE item_search")  # older layout, rebuilt by sync_search_index
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS item_search "
+                       "USING fts5(name, source_name UNINDEXED, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        cursor.execute("CREATE TABLE IF NOT EXISTS item_search "
+                       "(rowid INTEGER PRIMARY KEY, name TEXT NOT NULL, source_name TEXT)")
+
+
+def sync_search_index(cursor) -> int:
+    """Index every item that is not in item_search yet or was renamed since, and drop
+    the entries of deleted items. Returns the number (re)indexed."""
+    cursor.execute("""
+        DELETE FROM item_search WHERE rowid IN (
+            SELECT item_search.rowid FROM item_search LEFT JOIN items ON items.id = item_search.rowid
+            WHERE items.name IS NOT item_search.source_name
+        )
+    """)
+    missing = cursor.execute(
+        "SELECT id, name FROM items WHERE id NOT IN (SELECT rowid FROM item_search)"
+    ).fetchall()
+    cursor.executemany("INSERT INTO item_search (rowid, name, source_name) VALUES (?, ?, ?)",
+                       [(item_id, fold(name), name) for item_id, name in missing])
+    return len(missing)
+
+
+def search_terms(query: str) -> set[str]:
+    """Folded search terms for a query, including its slang alias expansion."""
+    term = fold(query).strip().replace("%", "").replace("_", "")
+    terms = {term} if term else set()
+    if term in _FOLDED_MAPPINGS:
+        terms.add(_FOLDED_MAPPINGS[term])
+    return terms
+
+
+# lang -> ((table sha256, item count, max item id), [(item id, folded localized name)])
+_localized_cache = {}
+
+
+def _localized_index(cursor, lang):
+    key = cursor.execute("""
+        SELECT (SELECT sha256 FROM item_name_versions WHERE lang = ?), COUNT(*), MAX(id) FROM items
+    """, (lang,)).fetchone()
+    cached = _localized_cache.get(lang)
+    if cached is None or cached[0] != key:
+        rows = cursor.execute("""
+            SELECT items.id, item_names.name FROM items
+            JOIN item_names ON item_names.lang = ? AND item_names.vnum = items.vnum
+        """, (lang,)).fetchall()
+        cached = _localized_cache[lang] = (key, [(item_id, fold(name)) for item_id, name in rows])
+    return cached[1]
+
+
+def search_item_ids(cursor, query: str, lang: str | None = None) -> list[int]:
+    """Return ids of all items whose name contains ``query`` (or its alias).
+
+    With ``lang`` (other than the ingest language) ``query`` is matched against
+    the item names in that language.
+    """
+    if lang and lang != vnum_names.INGEST_LANG:
+        terms = search_terms(query)
+        return sorted(item_id for item_id, name in _localized_index(cursor, lang)
+                      if any(term in name for term in terms))
+
+    ids = set()
+    for term in search_terms(query):
+        ids.update(row[0] for row in cursor.execute(
+            "SELECT rowid FROM item_search WHERE name LIKE ?", (f"%{term}%",)
+        ).fetchall())
+    return sorted(ids)
@@ -1,20 +1,41 @@
 import subprocess
 import os
 import sys
+from contextlib import asynccontextmanager
 from typing import Optional
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from .routers import market
 from .database import engine, Base
+from . import http_clients, item_search, response_cache
+from .database import get_connection, migrate_schema
 
 # Load environment variables
 load_dotenv()
 
-# Create tables if they don't exist
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bring older databases up to date (the same migration as the scheduler, so
+    # whichever process starts second finds it done), create the tables only
+    # the ORM knows, and make sure the item-name search index covers every item
+    conn = get_connection()
+    migrate_schema(conn)
+    Base.metadata.create_all(bind=engine)
+    item_search.ensure_search_index(conn.cursor())
+    item_search.sync_search_index(conn.cursor())
+    conn.commit()
+    conn.close()
+    # Pooled HTTP clients are created lazily on first use; release them on shutdown
+    yield
+    await http_clients.aclose_all()
+    http_clients.close_all()
 
-app = FastAPI(title="Metin2 Market Analysis API")
+app = FastAPI(title="Metin2 Market Analysis API", lifespan=lifespan)
+
+# Serve market read endpoints from memory until the next scrape (registered
+# before CORS so that cached and 304 responses still get CORS headers)
+app.middleware("http")(response_cache.cache_middleware)
 
 # CORS config
 # Allow all for local dev to avoid network issues
@@ -24,6 +45,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Cache"],
 )
 
 app.include_router(market.router)
@@ -0,0 +1,174 @@
+"""
+Columnar snapshot of each server's live listings.
+
+After every committed scrape the scraper publishes the server's normalized
+listing set to ``data/snapshots/<server>.m2snap`` (server name percent-encoded).
+Readers (API, alert checks) memory-map the file and run min/avg/percentile
+queries as NumPy operations instead of reading SQLite row by row. A snapshot always matches the
+``listings`` rows of its server; it is published right before the scrape
+transaction commits.
+
+File format (version 2, all integers little-endian)::
+
+    offset 0   8 bytes   magic b"M2SNAPv\\x00"
+    offset 8   uint32    format version (FORMAT_VERSION)
+    offset 12  uint32    header length H
+    offset 16  H bytes   header, UTF-8 JSON:
+                           server      server name
+                           scraped_at  ISO timestamp of the scrape
+                           rows        number of listings N
+                           columns     {name: {"dtype": numpy dtype str, "offset": absolute byte offset, "length": N}}
+                           items       [[item_id, item_name], ...]  names of the ids in the item_id column
+                           sellers     [seller_name, ...]           seller_id indexes this list
+    then       one column of N values per entry in ``columns``, each starting on
+               a 64-byte boundary:
+                           item_id     <i8  items.id
+                           unit_price  <i8  total price in yang / quantity
+                           quantity    <i4
+                           seller_id   <i4  index into ``sellers``
+                           outlier     u1   1 if the listing has an outlier verdict (outliers.py)
+
+Version history: 1 – initial layout; 2 – adds the ``outlier`` column.
+
+Readers must reject files with another magic or version (``load_snapshot``
+treats them as missing until the scraper republishes the server). Reading and
+atomic publishing are shared with the dump cache (columnar.py).
+"""
+
+import os
+import threading
+from urllib.parse import quote
+
+import numpy as np
+
+from . import columnar
+
+MAGIC = b"M2SNAPv\x00"
+FORMAT_VERSION = 2
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "snapshots")
+
+COLUMNS = (
+    ("item_id", "<i8"),
+    ("unit_price", "<i8"),
+    ("quantity", "<i4"),
+    ("seller_id", "<i4"),
+    ("outlier", "u1"),
+)
+
+
+class SnapshotFormatError(columnar.FormatError):
+    pass
+
+
+def snapshot_path(server_name, directory=None):
+    # Percent-encoding is reversible, so distinct server names never share a file
+    return os.path.join(directory or SNAPSHOT_DIR, f"{quote(server_name, safe='')}.m2snap")
+
+
+def write_snapshot(server_name, listings, item_names, scraped_at, directory=None):
+    """Publish a server's listing set.
+
+    ``listings`` are (item_id, seller_name, quantity, unit_price, is_outlier) tuples
+    and ``item_names`` maps every item id used to its name. Returns the file path.
+    """
+    seller_index = {}
+    item_ids, unit_prices, quantities, seller_ids, flags = [], [], [], [], []
+    for item_id, seller_name, quantity, unit_price, is_outlier in listings:
+        item_ids.append(item_id)
+        unit_prices.append(unit_price or 0)
+        quantities.append(quantity or 0)
+        seller_ids.append(seller_index.setdefault(seller_name, len(seller_index)))
+        flags.append(bool(is_outlier))
+
+    data = {
+        name: np.asarray(values, dtype=dtype)
+        for (name, dtype), values in zip(COLUMNS, (item_ids, unit_prices, quantities, seller_ids, flags))
+    }
+    header = {
+        "server": server_name,
+        "scraped_at": scraped_at,
+        "rows": len(item_ids),
+        "items": [[item_id, item_names[item_id]] for item_id in sorted(set(item_ids))],
+        "sellers": list(seller_index),
+    }
+
+    path = snapshot_path(server_name, directory)
+    columnar.write(path, MAGIC, FORMAT_VERSION, header, data, error=SnapshotFormatError)
+    return path
+
+
+class MarketSnapshot:
+    """A memory-mapped snapshot. Column attributes are read-only NumPy views."""
+
+    def __init__(self, path):
+        self.path = path
+        header, columns = columnar.read(path, MAGIC, FORMAT_VERSION, error=SnapshotFormatError)
+
+        self.server = header["server"]
+        self.scraped_at = header["scraped_at"]
+        self.rows = header["rows"]
+        self.item_names = {item_id: name for item_id, name in header["items"]}
+        self.sellers = header["sellers"]
+        self.seller_index = {name: index for index, name in enumerate(self.sellers)}
+        for name, column in columns.items():
+            setattr(self, name, column)
+
+    def __len__(self):
+        return self.rows
+
+    def seller_ids(self, seller_names):
+        return np.fromiter((self.seller_index[name] for name in seller_names if name in self.seller_index),
+                           dtype=np.int32)
+
+    def mask(self, item_ids=None, exclude_sellers=(), include_outliers=False):
+        """Boolean row mask: listings with a price, of ``item_ids`` (all if None), not by excluded sellers.
+
+        Listings with an outlier verdict are left out unless ``include_outliers``;
+        ``exclude_sellers`` covers fake sellers flagged after the snapshot was written.
+        """
+        mask = self.unit_price > 0
+        if not include_outliers:
+            mask &= self.outlier == 0
+        if item_ids is not None:
+            mask &= np.isin(self.item_id, np.asarray(list(item_ids), dtype=np.int64))
+        excluded = self.seller_ids(exclude_sellers)
+        if len(excluded):
+            mask &= ~np.isin(self.seller_id, excluded)
+        return mask
+
+    def unit_prices(self, item_ids=None, exclude_sellers=(), include_outliers=False):
+        return self.unit_price[self.mask(item_ids, exclude_sellers, include_outliers)]
+
+
+_cache_lock = threading.Lock()
+_cache = {}
+
+
+def load_snapshot(server_name, directory=None):
+    """Return the server's current snapshot (None if not published yet).
+
+    Mappings are reused until the file is republished.
+    """
+    path = snapshot_path(server_name, directory)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+    try:
+        snapshot = MarketSnapshot(path)
+    except SnapshotFormatError:
+        return None
+    with _cache_lock:
+        _cache[path] = (key, snapshot)
+    return snapshot
+
+
+
+def load_snapshots(server_names, directory=None):
+    """Current snapshots of ``server_names`` as {name: snapshot or None}."""
+    return {name: load_snapshot(name, directory) for name in server_names}
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, BigInteger, Float
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, BigInteger, Float, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
+from .bonuses import resolve_bonus
 
 class Server(Base):
     __tablename__ = "servers"
@@ -14,18 +15,22 @@ class Item(Base):
     name = Column(String, unique=True, index=True)
     category = Column(String)
     image_url = Column(String, nullable=True)
+    vnum = Column(Integer, nullable=True, index=True)
 
 class Listing(Base):
     __tablename__ = "listings"
     id = Column(Integer, primary_key=True, index=True)
     server_id = Column(Integer, ForeignKey("servers.id"))
     item_id = Column(Integer, ForeignKey("items.id"))
+    vnum = Column(Integer, nullable=True)
     seller_name = Column(String)
     quantity = Column(Integer)
     price_won = Column(Integer, default=0)
     price_yang = Column(Integer, default=0)
     total_price_yang = Column(BigInteger)
+    bonus_digest = Column(String, nullable=True)  # see scraper.bonus_digest
     seen_at = Column(DateTime(timezone=True), server_default=func.now())
+    outlier_reason = Column(String, nullable=True)  # see outliers.py
 
     server = relationship("Server")
     item = relationship("Item")
@@ -35,11 +40,20 @@ class ListingBonus(Base):
     __tablename__ = "listing_bonuses"
     id = Column(Integer, primary_key=True, index=True)
     listing_id = Column(Integer, ForeignKey("listings.id"))
-    bonus_name = Column(String)
-    bonus_value = Column(String)
+    attr_id = Column(Integer)
+    attr_value = Column(Integer)
 
     listing = relationship("Listing", back_populates="bonuses")
 
+    # Display text rendered on read from the integer pair (memoized in bonuses.py)
+    @property
+    def bonus_name(self):
+        return resolve_bonus(self.attr_id, self.attr_value)[0]
+
+    @property
+    def bonus_value(self):
+        return str(self.attr_value)
+
 class PriceHistory(Base):
     __tablename__ = "price_history"
     id = Column(Integer, primary_key=True, index=True)
@@ -92,6 +106,74 @@ class ListingSnapshot(Base):
     total_price_yang = Column(BigInteger, nullable=False)
     unit_price = Column(BigInteger, nullable=False)
     scraped_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    outlier_reason = Column(String, nullable=True)
+
+
+class ItemPriceAggregate(Base):
+    __tablename__ = "item_price_aggregates"
+    __table_args__ = (UniqueConstraint("server_name", "item_name", "scraped_at"),)
+    id = Column(Integer, primary_key=True, index=True)
+    server_name = Column(String, nullable=False)
+    item_name = Column(String, nullable=False, index=True)
+    scraped_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    listing_count = Column(Integer, nullable=False)
+    min_price = Column(BigInteger)
+    max_price = Column(BigInteger)
+    avg_price = Column(BigInteger)
+    avg_bottom20_price = Column(BigInteger)
+    p10_price = Column(BigInteger)
+    median_price = Column(BigInteger)
+    p90_price = Column(BigInteger)
+    scrape_count = Column(Integer, nullable=False, default=1)  # > 1 once rolled up, see retention.py
+    bottom_count = Column(Integer, nullable=True)
+
+
+class ServerItemStat(Base):
+    __tablename__ = "server_item_stats"
+    server_id = Column(Integer, ForeignKey("servers.id"), primary_key=True)
+    item_id = Column(Integer, ForeignKey("items.id"), primary_key=True)
+    listing_count = Column(Integer, nullable=False)
+    total_quantity = Column(Integer, nullable=False)
+    min_unit_price = Column(BigInteger)
+    prev_min_unit_price = Column(BigInteger)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class SellerOutlierStat(Base):
+    __tablename__ = "seller_outlier_stats"
+    server_name = Column(String, primary_key=True)
+    seller_name = Column(String, primary_key=True)
+    listing_count = Column(Float, nullable=False, default=0)  # decayed, see outliers.py
+    outlier_count = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class ScrapeState(Base):
+    """Single-row counter bumped whenever market data changes (cache invalidation)."""
+    __tablename__ = "scrape_state"
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+
+
+class RetentionState(Base):
+    __tablename__ = "retention_state"
+    tier = Column(String, primary_key=True)
+    rolled_until = Column(String, nullable=False)
+
+
+class ItemName(Base):
+    """Localized item name by vnum, one table per language (see vnum_names.py)."""
+    __tablename__ = "item_names"
+    lang = Column(String, primary_key=True)
+    vnum = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+
+
+class ItemNameVersion(Base):
+    __tablename__ = "item_name_versions"
+    lang = Column(String, primary_key=True)
+    sha256 = Column(String, nullable=False)
+    checked_at = Column(Float, nullable=False)
 
 
 class PriceAlert(Base):
@@ -0,0 +1,228 @@
+"""
+Normalization of raw store-dump items into compact listing tuples.
+
+Every dump element becomes a ``Listing`` tuple (item name resolved from the
+vnum table of vnum_names.py, prices combined, bonuses kept as integer (attr_id, value) pairs);
+elements without a price are dropped.
+
+The scraper reads the downloaded dump from disk (fetch_cache). By default its
+elements are decoded incrementally and normalized inline (``normalize_stream``).
+With NORMALIZE_WORKERS > 1, ``normalize_dump`` instead cuts the raw bytes into
+pieces at element boundaries and lets a process pool parse and normalize them,
+so both the JSON decoding and the per-listing work of large dumps are spread
+across cores while the file is still being read. Only raw bytes go to the
+workers and compact tuples come back.
+
+The pool is created lazily, receives the item-name table once through its
+initializer and is reused across scrapes as long as the table's ``version``
+stays the same; call ``shutdown()`` on exit.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+from .vnum_names import NameTable
+
+NORMALIZE_PIECE_BYTES = int(os.environ.get("NORMALIZE_PIECE_BYTES", str(4 * 1024 * 1024)))
+
+
+def _worker_count(value: str) -> int:
+    if value == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(value))
+
+
+# 1 = normalize inline in the scraping process; "auto" = one worker per CPU core
+NORMALIZE_WORKERS = _worker_count(os.environ.get("NORMALIZE_WORKERS", "1"))
+
+
+class Listing(NamedTuple):
+    item_name: str
+    seller: str
+    quantity: int
+    price_won: int
+    price_yang: int
+    total_yang: int
+    bonuses: tuple  # ((attr_id, value), ...) – rendered by bonuses.resolve_bonus
+    vnum: int = 0
+
+    @property
+    def unit_price(self) -> int:
+        return int(self.total_yang / max(self.quantity, 1))
+
+
+def normalize_item(raw_item: dict, item_names: NameTable) -> Listing | None:
+    """Turn one raw dump entry into a Listing (None for listings without a price)."""
+    yang = raw_item.get("yangPrice", 0) or 0
+    won = raw_item.get("wonPrice", 0) or 0
+    total_yang = won * 100_000_000 + yang
+    if total_yang <= 0:
+        return None
+
+    bonuses = tuple(
+        (int(attr[0]), int(attr[1]) if attr[1] else 0)
+        for attr in (raw_item.get("attrs") or ())
+        if isinstance(attr, (list, tuple)) and len(attr) >= 2 and attr[0]
+    )
+
+    vnum = int(raw_item.get("vnum") or 0)
+    return Listing(
+        item_names.get(vnum) or raw_item.get("name", "Unknown"),
+        raw_item.get("seller", "Unknown") or "Unknown",
+        raw_item.get("quantity", 1) or 1,
+        won,
+        yang,
+        total_yang,
+        bonuses,
+        vnum,
+    )
+
+
+def normalize_chunk(raw_items, item_names: NameTable) -> list[Listing]:
+    """Normalize raw items inline, dropping the ones without a price."""
+    listings = []
+    for raw_item in raw_items:
+        listing = normalize_item(raw_item, item_names)
+        if listing is not None:
+            listings.append(listing)
+    return listings
+
+
+def normalize_piece(piece: bytes, item_names: NameTable | None = None) -> list[Listing]:
+    """Parse and normalize a run of comma-separated dump elements (worker side).
+
+    Raises ValueError when the piece is not valid JSON, i.e. it was cut inside
+    a string or a nested value.
+    """
+    if item_names is None:
+        item_names = _worker_item_names
+    return normalize_chunk(json.loads(b"[" + piece + b"]"), item_names)
+
+
+_worker_item_names: NameTable | None = None
+
+
+def _init_worker(item_names: NameTable) -> None:
+    global _worker_item_names
+    _worker_item_names = item_names
+
+
+_pool_lock = threading.Lock()
+_pool: tuple[ProcessPoolExecutor, int, str] | None = None  # (pool, workers, item_names.version)
+
+
+def get_pool(item_names: NameTable, workers: int = None) -> ProcessPoolExecutor | None:
+    """Shared process pool for ``item_names`` (None when normalizing inline)."""
+    global _pool
+    workers = workers or NORMALIZE_WORKERS
+    if workers <= 1:
+        return None
+    with _pool_lock:
+        if _pool and _pool[1] == workers and _pool[2] == item_names.version:
+            return _pool[0]
+        if _pool:
+            _pool[0].shutdown(wait=False, cancel_futures=True)
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(item_names,))
+        _pool = (pool, workers, item_names.version)
+        return pool
+
+
+async def normalize_stream(raw_items, item_names: NameTable) -> list[Listing]:
+    """Normalize an async iterator of parsed raw items inline, in input order."""
+    listings = []
+    async for raw_item in raw_items:
+        listing = normalize_item(raw_item, item_names)
+        if listing is not None:
+            listings.append(listing)
+    return listings
+
+
+async def normalize_dump(chunks, item_names: NameTable, workers: int = None) -> list[Listing]:
+    """Normalize a raw JSON array dump, given as an async iterator of byte chunks.
+
+    The bytes are cut into pieces of about NORMALIZE_PIECE_BYTES at element
+    boundaries (``},{``) and every piece is parsed and normalized by a worker
+    while the following bytes are still being read. A cut that fell inside a
+    string makes both neighbouring pieces fail to parse; they are then glued
+    back together and normalized in this process. Without a pool (one
+    worker) the pieces are handled inline. Raises ValueError for a malformed dump.
+    """
+    pool = get_pool(item_names, workers)
+    loop = asyncio.get_running_loop()
+    pending = []  # [(piece, future)] in dump order
+    listings = []
+    carry = None  # pieces that failed to parse, waiting for the next one
+
+    def submit(piece):
+        if pool is None:
+            future = loop.create_future()
+            try:
+                future.set_result(normalize_piece(piece, item_names))
+            except ValueError as e:
+                future.set_exception(e)
+        else:
+            future = loop.run_in_executor(pool, normalize_piece, piece)
+        pending.append((piece, future))
+
+    async def drain(wait):
+        nonlocal carry
+        while pending and (wait or pending[0][1].done()):
+            piece, future = pending.pop(0)
+            try:
+                result = await future
+            except ValueError:
+                result = None
+            if carry is None:
+                if result is None:
+                    carry = piece
+                else:
+                    listings.extend(result)
+                continue
+            # The previous piece ended inside a value, so this one starts inside it
+            carry += b"," + piece
+            try:
+                listings.extend(normalize_piece(carry, item_names))
+                carry = None
+            except ValueError:
+                pass
+
+    buffer = bytearray()
+    started = False
+    async for data in chunks:
+        buffer += data
+        if not started:
+            del buffer[:len(buffer) - len(buffer.lstrip())]
+            if not buffer:
+                continue
+            if buffer[:1] != b"[":
+                raise ValueError(f"Expected JSON array, got {bytes(buffer[:1])!r}")
+            del buffer[:1]
+            started = True
+        if len(buffer) >= NORMALIZE_PIECE_BYTES:
+            cut = buffer.rfind(b"},{")
+            if cut != -1:
+                submit(bytes(buffer[:cut + 1]))
+                del buffer[:cut + 2]
+                await drain(wait=False)
+
+    tail = bytes(buffer).rstrip()
+    if not started or not tail.endswith(b"]"):
+        raise ValueError("Truncated or malformed JSON array")
+    if tail[:-1].strip():
+        submit(tail[:-1])
+    await drain(wait=True)
+    if carry is not None:
+        raise ValueError("Malformed JSON array in store dump")
+    return listings
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool:
+            _pool[0].shutdown()
+            _pool = None
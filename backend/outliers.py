@@ -0,0 +1,135 @@
+"""
+Automatic bait-listing detection at ingestion time.
+
+Every listing of a scrape gets a verdict that is stored with it
+(``listings.outlier_reason`` and ``listing_snapshots.outlier_reason``):
+
+* ``None``     – regular listing, used for prices, charts and alerts
+* ``"price"``  – its unit price is a MAD outlier among the server's listings of
+                 the same item (only for items with at least MIN_GROUP_SIZE listings)
+* ``"seller"`` – the seller's listings were price outliers too often before
+                 (at least SUSPECT_MIN_OUTLIERS and SUSPECT_RATIO of everything
+                 they listed), so all their listings are excluded
+* ``"fake"``   – the seller is in the hand-maintained fake_sellers list, which
+                 overrides the automatic verdicts
+
+Only the high side of the MAD test is a verdict on its own. A listing below
+the median is only a "price" outlier when it is also under LOW_PRICE_RATIO of
+the median: a deep but plausible undercut is exactly what price alerts are
+for, while a listing at a few percent of the going price is bait.
+
+Seller history is kept per server in ``seller_outlier_stats``. Every listing is
+counted once, in the scrape where it first appears, however long it stays up.
+The counts decay with a half-life of SELLER_HISTORY_HALF_LIFE_DAYS, so a
+seller who stopped baiting loses the verdict again.
+
+Aggregates, rankings, snapshots and alert prices all skip listings with a
+verdict, so nothing is filtered again at query time.
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+from . import price_stats
+
+MIN_GROUP_SIZE = 5
+SUSPECT_MIN_OUTLIERS = 5
+SUSPECT_RATIO = 0.5
+LOW_PRICE_RATIO = 0.2
+SELLER_HISTORY_HALF_LIFE_DAYS = 7
+
+PRICE = "price"
+SELLER = "seller"
+FAKE = "fake"
+
+
+def _decay(updated_at, now):
+    """Weight left of seller history last updated at ``updated_at`` (ISO strings)."""
+    elapsed = (datetime.fromisoformat(now) - datetime.fromisoformat(updated_at)).total_seconds()
+    return 0.5 ** (max(elapsed, 0) / (SELLER_HISTORY_HALF_LIFE_DAYS * 86400))
+
+
+def _seller_history(cursor, server_name, now, seller_names=None, min_outliers=0):
+    """{seller: [listing_count, outlier_count]} of a server, decayed to ``now``."""
+    rows = cursor.execute("""
+        SELECT seller_name, listing_count, outlier_count, updated_at FROM seller_outlier_stats
+        WHERE server_name = ? AND outlier_count >= ?
+    """, (server_name, min_outliers)).fetchall()
+    history = {}
+    for seller_name, listing_count, outlier_count, updated_at in rows:
+        if seller_names is None or seller_name in seller_names:
+            weight = _decay(updated_at, now)
+            history[seller_name] = [listing_count * weight, outlier_count * weight]
+    return history
+
+
+def suspect_sellers(cursor, server_name, now=None):
+    """Sellers of a server whose (decayed) outlier history marks them as bait sellers.
+
+    The decayed outlier count is rounded to whole listings, so outliers of the
+    last hours still count fully.
+    """
+    now = now or datetime.now().isoformat()
+    return {
+        seller_name
+        for seller_name, (listing_count, outlier_count)
+        in _seller_history(cursor, server_name, now, min_outliers=SUSPECT_MIN_OUTLIERS - 0.5).items()
+        if round(outlier_count) >= SUSPECT_MIN_OUTLIERS and outlier_count >= listing_count * SUSPECT_RATIO
+    }
+
+
+def classify(cursor, server_name, listings, fake_sellers, updated_at, new=None):
+    """Return one verdict per (item_id, seller_name, unit_price) tuple and record seller history.
+
+    ``new`` flags the listings that were not live before this scrape (default:
+    all); only those are added to the seller history.
+    """
+    if not listings:
+        return []
+    item_ids = np.fromiter((row[0] for row in listings), dtype=np.int64, count=len(listings))
+    prices = np.fromiter((row[2] for row in listings), dtype=np.int64, count=len(listings))
+    _, groups = np.unique(item_ids, return_inverse=True)
+    groups = groups.astype(np.int64)
+
+    group_sizes = np.bincount(groups)
+    flags = price_stats.outlier_flags(prices, groups, len(group_sizes), low_ratio=LOW_PRICE_RATIO)
+    flags &= group_sizes[groups] >= MIN_GROUP_SIZE
+
+    suspects = suspect_sellers(cursor, server_name, updated_at)
+    verdicts = []
+    added = {}
+    for (_, seller_name, _), is_outlier, is_new in zip(listings, flags.tolist(), new or [True] * len(listings)):
+        if seller_name in fake_sellers:
+            verdicts.append(FAKE)
+        elif is_outlier:
+            verdicts.append(PRICE)
+        elif seller_name in suspects:
+            verdicts.append(SELLER)
+        else:
+            verdicts.append(None)
+        if is_new:
+            counts = added.setdefault(seller_name, [0, 0])
+            counts[0] += 1
+            counts[1] += is_outlier
+
+    history = _seller_history(cursor, server_name, updated_at, added)
+    cursor.executemany("""
+        INSERT OR REPLACE INTO seller_outlier_stats (server_name, seller_name, listing_count, outlier_count, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, [
+        (server_name, seller, old[0] + total, old[1] + outliers, updated_at)
+        for seller, (total, outliers) in added.items()
+        for old in [history.get(seller, (0, 0))]
+    ])
+    return verdicts
+
+
+def apply_fake_seller(cursor, seller_name, is_fake):
+    """Set or clear the "fake" override on a seller's stored listings and snapshots."""
+    for table in ("listings", "listing_snapshots"):
+        if is_fake:
+            cursor.execute(f"UPDATE {table} SET outlier_reason = ? WHERE seller_name = ?", (FAKE, seller_name))
+        else:
+            cursor.execute(f"UPDATE {table} SET outlier_reason = NULL WHERE seller_name = ? AND outlier_reason = ?",
+                           (seller_name, FAKE))
@@ -0,0 +1,84 @@
+"""
+Per-scrape price aggregates – one row per (server, item, scrape timestamp).
+
+The scraper materializes these at ingestion time so price charts read a
+handful of precomputed rows instead of re-aggregating every snapshot on each
+request. Listings with an outlier verdict (see outliers.py, fake sellers
+included) are left out; when the fake seller list changes the affected items
+are rebuilt from listing_snapshots. Snapshots are only kept for the most
+recent day (retention.py), so only that stretch is rebuilt; older, rolled-up
+rows are left as they are.
+"""
+
+from . import price_stats
+
+INSERT_SQL = """
+    INSERT OR REPLACE INTO item_price_aggregates
+        (server_name, item_name, scraped_at, listing_count, min_price, max_price,
+         avg_price, avg_bottom20_price, p10_price, median_price, p90_price)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# price_stats statistics stored in the columns after (server_name, item_name, scraped_at)
+AGGREGATE_STATS = ("count", "min", "max", "mean", "bottom_mean", "p10", "median", "p90")
+
+
+def write_aggregates(cursor, snapshots, fake_sellers=()):
+    """Aggregate freshly ingested snapshots.
+
+    ``snapshots`` are (item_name, seller_name, server_name, unit_price, scraped_at)
+    tuples of listings without an outlier verdict.
+    """
+    keys = {}
+    codes = []
+    prices = []
+    for item_name, seller_name, server_name, unit_price, scraped_at in snapshots:
+        if unit_price and seller_name not in fake_sellers:
+            codes.append(keys.setdefault((server_name, item_name, scraped_at), len(keys)))
+            prices.append(unit_price)
+    if not keys:
+        return 0
+
+    stats = price_stats.group_stats(prices, codes, len(keys))
+    columns = [stats[name].tolist() for name in AGGREGATE_STATS]
+    rows = [key + values for key, values in zip(keys, zip(*columns))]
+    cursor.executemany(INSERT_SQL, rows)
+    return len(rows)
+
+
+def rebuild_aggregates(cursor, item_names=None):
+    """Recompute aggregates from listing_snapshots (all items, or only ``item_names``).
+
+    Only aggregates from the oldest remaining snapshot on are replaced.
+    """
+    fake_sellers = {row[0] for row in cursor.execute("SELECT seller_name FROM fake_sellers").fetchall()}
+    oldest = cursor.execute("SELECT MIN(scraped_at) FROM listing_snapshots").fetchone()[0]
+    if oldest is None:
+        return 0
+
+    sql = """
+        SELECT item_name, seller_name, server_name, unit_price, scraped_at FROM listing_snapshots
+        WHERE outlier_reason IS NULL
+    """
+    params = ()
+    if item_names is not None:
+        item_names = list(item_names)
+        if not item_names:
+            return 0
+        placeholders = ",".join("?" * len(item_names))
+        sql += f" AND item_name IN ({placeholders})"
+        params = tuple(item_names)
+        cursor.execute(f"DELETE FROM item_price_aggregates WHERE scraped_at >= ? AND item_name IN ({placeholders})",
+                       (oldest,) + params)
+    else:
+        cursor.execute("DELETE FROM item_price_aggregates WHERE scraped_at >= ?", (oldest,))
+
+    return write_aggregates(cursor, cursor.execute(sql, params).fetchall(), fake_sellers)
+
+
+def rebuild_aggregates_for_seller(cursor, seller_name):
+    """Refresh every item a (newly flagged or unflagged) seller ever listed."""
+    item_names = [row[0] for row in cursor.execute(
+        "SELECT DISTINCT item_name FROM listing_snapshots WHERE seller_name = ?", (seller_name,)
+    ).fetchall()]
+    return rebuild_aggregates(cursor, item_names)
@@ -0,0 +1,143 @@
+"""
+Vectorized price statistics for many groups at once.
+
+Every price summary in the backend (per-scrape aggregates, alert prices, the
+current-prices endpoint) goes through ``group_stats``: rows are given as a
+price array plus an integer group index per row, sorted once by (group,
+price) and reduced per group with prefix sums and index arithmetic – no
+Python loop over groups or rows.
+
+Conventions shared by all statistics (they match the previous list code):
+
+* percentiles use the nearest-rank method,
+* the bottom mean averages the cheapest ``max(1, int(n * BOTTOM_FRACTION))`` prices,
+* the trimmed mean drops ``int(n * TRIM_FRACTION)`` prices at each end,
+* means are floored to whole yang.
+
+``outlier_flags`` marks prices whose distance to their group median exceeds
+``MAD_THRESHOLD`` scaled median absolute deviations (groups with MAD 0 flag nothing).
+With ``low_ratio`` a price below the median must also be under that fraction
+of the median to be flagged.
+"""
+
+import numpy as np
+
+BOTTOM_FRACTION = 0.2
+TRIM_FRACTION = 0.1
+MAD_THRESHOLD = 3.5
+MAD_SCALE = 1.4826  # makes MAD comparable to a standard deviation for normal data
+
+STAT_NAMES = ("count", "min", "max", "mean", "bottom_mean", "p10", "median", "p90", "trimmed_mean")
+
+
+def _sort_within_groups(values, groups):
+    """``values`` ordered by (group, value).
+
+    When both fit into one int64, group and value are packed into a single key
+    (group in the high bits) and sorted in one pass, which is an order of
+    magnitude faster than ``np.lexsort``.
+    """
+    if len(values) == 0:
+        return values
+    if values.min() >= 0:
+        value_bits = max(int(values.max()).bit_length(), 1)
+        if value_bits + int(groups.max()).bit_length() <= 62:
+            return np.sort((groups << value_bits) | values) & ((1 << value_bits) - 1)
+    return values[np.lexsort((values, groups))]
+
+
+def _sorted_groups(values, groups, group_count):
+    values = np.asarray(values, dtype=np.int64)
+    groups = np.asarray(groups, dtype=np.int64)
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    return _sort_within_groups(values, groups), counts, starts
+
+
+def _nearest_rank(sorted_prices, starts, counts, pct):
+    offset = np.maximum(0, -(-counts * pct // 100) - 1)
+    return sorted_prices[np.minimum(starts + offset, len(sorted_prices) - 1)]
+
+
+def group_stats(prices, groups, group_count=None):
+    """Statistics of ``prices`` grouped by ``groups`` (ints in 0..group_count-1).
+
+    Returns {stat name: int64 array of length group_count}; groups without rows
+    have count 0 and 0 in every other statistic.
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    if group_count is None:
+        group_count = int(groups.max()) + 1 if len(groups) else 0
+    sorted_prices, counts, starts = _sorted_groups(prices, groups, group_count)
+    if len(sorted_prices) == 0:
+        return {name: np.zeros(group_count, dtype=np.int64) for name in STAT_NAMES}
+
+    present = counts > 0
+    ends = starts + counts
+    safe_counts = np.maximum(counts, 1)
+    prefix = np.concatenate(([0], np.cumsum(sorted_prices)))
+
+    bottom = np.maximum(1, (counts * BOTTOM_FRACTION).astype(np.int64))
+    trim = (counts * TRIM_FRACTION).astype(np.int64)
+    kept = np.maximum(counts - 2 * trim, 1)
+    last = np.maximum(ends - 1, 0)
+
+    stats = {
+        "count": counts.astype(np.int64),
+        "min": sorted_prices[np.minimum(starts, len(sorted_prices) - 1)],
+        "max": sorted_prices[last],
+        "mean": (prefix[ends] - prefix[starts]) // safe_counts,
+        "bottom_mean": (prefix[np.minimum(starts + bottom, ends)] - prefix[starts]) // np.minimum(bottom, safe_counts),
+        "p10": _nearest_rank(sorted_prices, starts, counts, 10),
+        "median": _nearest_rank(sorted_prices, starts, counts, 50),
+        "p90": _nearest_rank(sorted_prices, starts, counts, 90),
+        "trimmed_mean": (prefix[ends - trim] - prefix[starts + trim]) // kept,
+    }
+    for name in STAT_NAMES[1:]:
+        stats[name] = np.where(present, stats[name], 0)
+    return stats
+
+
+def outlier_flags(prices, groups, group_count=None, threshold=MAD_THRESHOLD, low_ratio=None):
+    """Boolean array (row order of ``prices``): True where the price is a MAD outlier of its group.
+
+    The test is two-sided. With ``low_ratio``, prices below the median are only
+    flagged when they are also under ``low_ratio`` times the median.
+    """
+    prices = np.asarray(prices, dtype=np.int64)
+    groups = np.asarray(groups, dtype=np.int64)
+    if len(prices) == 0:
+        return np.zeros(0, dtype=bool)
+    if group_count is None:
+        group_count = int(groups.max()) + 1
+    sorted_prices, counts, starts = _sorted_groups(prices, groups, group_count)
+    medians = _nearest_rank(sorted_prices, starts, counts, 50)
+
+    deviations = np.abs(prices - medians[groups])
+    sorted_deviations, _, _ = _sorted_groups(deviations, groups, group_count)
+    mad = _nearest_rank(sorted_deviations, starts, counts, 50) * MAD_SCALE
+
+    row_mad = mad[groups]
+    flags = (row_mad > 0) & (deviations > threshold * row_mad)
+    if low_ratio is not None:
+        row_median = medians[groups]
+        flags &= (prices >= row_median) | (prices < row_median * low_ratio)
+    return flags
+
+
+def summarize(prices):
+    """Statistics of a single price list as {stat name: int} (None if empty)."""
+    if len(prices) == 0:
+        return None
+    stats = group_stats(prices, np.zeros(len(prices), dtype=np.int64), 1)
+    return {name: int(values[0]) for name, values in stats.items()}
+
+
+def rows(stats):
+    """Turn a group_stats result into one {stat name: int} dict per group (None if empty)."""
+    counts = stats["count"]
+    columns = {name: values.tolist() for name, values in stats.items()}
+    return [
+        {name: columns[name][index] for name in STAT_NAMES} if counts[index] else None
+        for index in range(len(counts))
+    ]
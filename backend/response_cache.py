@@ -0,0 +1,120 @@
+"""
+In-process response cache for the market read endpoints.
+
+Listings, top items, servers and price history only change when the scraper
+commits a new scrape (or a fake seller is flagged, which rebuilds the price
+aggregates). Both bump ``scrape_state.generation`` in the same transaction, so
+a cached body is valid exactly as long as the generation it was rendered at:
+the cache key is (path, query string, generation) and stale entries simply
+stop being hit and age out of the LRU.
+
+Every cached response carries an ETag derived from the generation and the body;
+clients that send it back in If-None-Match get an empty 304.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import Request, Response
+from starlette.concurrency import run_in_threadpool
+
+from .database import get_scrape_generation
+
+CACHED_PATHS = {
+    "/market/listings",
+    "/market/stats/top-items",
+    "/market/stats/price-history",
+    "/market/stats/current-prices",
+    "/market/servers",
+}
+
+# Response headers that belong to the body and must be replayed on a hit
+REPLAYED_HEADERS = ("content-type", "x-next-cursor")
+
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "256"))
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: dict
+
+
+class LRUCache:
+    """Thread-safe LRU mapping with a fixed number of entries."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+cache = LRUCache(RESPONSE_CACHE_SIZE)
+
+
+def make_etag(generation: int, body: bytes) -> str:
+    return f'"{generation}-{hashlib.sha1(body).hexdigest()[:16]}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+async def cache_middleware(request: Request, call_next):
+    """HTTP middleware serving GETs on CACHED_PATHS from the cache."""
+    if request.method != "GET" or request.url.path not in CACHED_PATHS:
+        return await call_next(request)
+
+    generation = await run_in_threadpool(get_scrape_generation)
+    key = (request.url.path, str(sorted(request.query_params.multi_items())), generation)
+    entry = cache.get(key)
+    status = "HIT"
+
+    if entry is None:
+        status = "MISS"
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        headers = {name: response.headers[name] for name in REPLAYED_HEADERS if name in response.headers}
+        entry = CachedResponse(body, make_etag(generation, body), headers)
+        cache.put(key, entry)
+
+    headers = {**entry.headers, "ETag": entry.etag, "X-Cache": status}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        headers.pop("content-type", None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, headers=headers)
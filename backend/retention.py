@@ -0,0 +1,195 @@
+"""
+Tiered retention of the price history.
+
+The raw listing snapshots are only needed to rebuild recent aggregates (when
+the fake seller list changes), and per-scrape resolution only matters for
+recent charts. So the resolution of the history drops with its age:
+
+    younger than RAW_RETENTION      listing_snapshots + one aggregate row per scrape
+    younger than HOURLY_RETENTION   one item_price_aggregates row per (server, item, hour)
+    older                           one row per (server, item, day)
+
+``apply_retention`` deletes expired snapshots and rolls the aggregates of each
+tier into the next. All work happens in small transactions: at most
+SNAPSHOT_DELETE_BATCH snapshot rows, or one server's rows of one hour/day
+bucket, per write lock. The whole run stops after RETENTION_MAX_SECONDS and
+continues where it left off next time (``retention_state`` records how far
+each tier has been rolled up). A run therefore never holds the write lock long
+enough to stall the API or a scrape. Every transaction that changes rows bumps
+the scrape generation, so cached price history responses are re-rendered.
+
+Aggregates are only rolled up once the snapshots they were computed from are
+gone, so price_aggregates.rebuild_aggregates never touches rolled-up rows.
+
+A rolled-up row keeps the exact min/max, the listing-count-weighted mean, the
+bottom-20% mean weighted by its number of bottom listings (``bottom_count``),
+and the number of scrapes it covers (``scrape_count``). p10/median/p90 become
+count-weighted means of the merged rows' values.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from .database import bump_scrape_generation
+
+RAW_RETENTION = timedelta(hours=float(os.environ.get("RAW_RETENTION_HOURS", "24")))
+HOURLY_RETENTION = timedelta(days=float(os.environ.get("HOURLY_RETENTION_DAYS", "14")))
+SNAPSHOT_DELETE_BATCH = 5000
+RETENTION_MAX_SECONDS = 60
+
+
+class Tier(NamedTuple):
+    name: str
+    bucket: str        # strftime format of a bucket's start
+    span: timedelta    # length of a bucket
+    after: timedelta   # age from which rows are rolled into this tier
+
+
+TIERS = (
+    Tier("hour", "%Y-%m-%dT%H:00:00", timedelta(hours=1), RAW_RETENTION),
+    Tier("day", "%Y-%m-%dT00:00:00", timedelta(days=1), HOURLY_RETENTION),
+)
+
+# Bottom-20% listings behind a row's avg_bottom20_price (derived for per-scrape rows)
+BOTTOM_COUNT_SQL = "COALESCE(bottom_count, MAX(1, CAST(listing_count * 0.2 AS INTEGER)))"
+
+
+def _weighted_mean(column, weight):
+    return (f"CAST(ROUND(SUM({column} * 1.0 * {weight}) / "
+            f"SUM(CASE WHEN {column} IS NOT NULL THEN {weight} END)) AS INTEGER)")
+
+
+ROLLUP_SQL = f"""
+    SELECT item_name, strftime(?, scraped_at) AS bucket,
+           SUM(listing_count), MIN(min_price), MAX(max_price),
+           {_weighted_mean("avg_price", "listing_count")},
+           {_weighted_mean("avg_bottom20_price", "bottom_n")},
+           {_weighted_mean("p10_price", "listing_count")},
+           {_weighted_mean("median_price", "listing_count")},
+           {_weighted_mean("p90_price", "listing_count")},
+           SUM(scrape_count), SUM(bottom_n),
+           COUNT(*), MIN(scraped_at)
+    FROM (
+        SELECT *, {BOTTOM_COUNT_SQL} AS bottom_n FROM item_price_aggregates
+        WHERE server_name = ? AND scraped_at >= ? AND scraped_at < ?
+    )
+    GROUP BY item_name, bucket
+"""
+
+INSERT_SQL = """
+    INSERT INTO item_price_aggregates
+        (server_name, item_name, scraped_at, listing_count, min_price, max_price, avg_price,
+         avg_bottom20_price, p10_price, median_price, p90_price, scrape_count, bottom_count)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class RetentionResult(NamedTuple):
+    snapshots_deleted: int
+    aggregates_removed: int   # aggregate rows saved by merging them into coarser ones
+    complete: bool            # False if the time budget ran out first
+
+
+def _floor(moment: datetime, tier: Tier) -> datetime:
+    return datetime.fromisoformat(moment.strftime(tier.bucket))
+
+
+def delete_snapshots(conn, before: str, deadline: float) -> int:
+    """Delete snapshots taken before ``before`` in SNAPSHOT_DELETE_BATCH-row transactions."""
+    cursor = conn.cursor()
+    deleted = 0
+    while time.monotonic() < deadline:
+        cursor.execute("""
+            DELETE FROM listing_snapshots WHERE id IN (
+                SELECT id FROM listing_snapshots WHERE scraped_at < ? ORDER BY scraped_at LIMIT ?
+            )
+        """, (before, SNAPSHOT_DELETE_BATCH))
+        batch = cursor.rowcount
+        if batch:
+            bump_scrape_generation(cursor)
+        conn.commit()
+        deleted += batch
+        if batch < SNAPSHOT_DELETE_BATCH:
+            break
+    return deleted
+
+
+def _rolled_until(cursor, tier):
+    row = cursor.execute("SELECT rolled_until FROM retention_state WHERE tier = ?", (tier.name,)).fetchone()
+    return datetime.fromisoformat(row[0]) if row else None
+
+
+def _roll_bucket_range(cursor, tier, server_name, start, end) -> int:
+    """Merge one server's rows in [start, end) into one row per item and bucket."""
+    rows = cursor.execute(ROLLUP_SQL, (tier.bucket, server_name, start, end)).fetchall()
+    if all(row[-2] == 1 and row[-1] == row[1] for row in rows):
+        return 0  # already rolled up
+    cursor.execute(
+        "DELETE FROM item_price_aggregates WHERE server_name = ? AND scraped_at >= ? AND scraped_at < ?",
+        (server_name, start, end),
+    )
+    cursor.executemany(INSERT_SQL, [(server_name, *row[:-2]) for row in rows])
+    bump_scrape_generation(cursor)
+    return sum(row[-2] for row in rows) - len(rows)
+
+
+def roll_up(conn, tier: Tier, cutoff: datetime, deadline: float) -> tuple[int, bool]:
+    """Roll the aggregates older than ``cutoff`` (a bucket start) into ``tier`` buckets.
+
+    Returns (aggregate rows removed, whether everything up to ``cutoff`` is done).
+    """
+    cursor = conn.cursor()
+    start = _rolled_until(cursor, tier)
+    merged = 0
+    while True:
+        # Skip empty stretches (e.g. while the scraper was down)
+        row = cursor.execute(
+            "SELECT MIN(scraped_at) FROM item_price_aggregates WHERE scraped_at >= ? AND scraped_at < ?",
+            ((start or datetime.min).isoformat(), cutoff.isoformat()),
+        ).fetchone()
+        if row[0] is None:
+            return merged, True
+        if time.monotonic() >= deadline:
+            return merged, False
+
+        start = _floor(datetime.fromisoformat(row[0]), tier)
+        end = start + tier.span
+        bounds = (start.isoformat(), end.isoformat())
+        server_names = [name for (name,) in cursor.execute(
+            "SELECT DISTINCT server_name FROM item_price_aggregates WHERE scraped_at >= ? AND scraped_at < ?", bounds
+        ).fetchall()]
+        for server_name in server_names:
+            cursor.execute("BEGIN IMMEDIATE")
+            merged += _roll_bucket_range(cursor, tier, server_name, *bounds)
+            conn.commit()
+        cursor.execute("""
+            INSERT INTO retention_state (tier, rolled_until) VALUES (?, ?)
+            ON CONFLICT(tier) DO UPDATE SET rolled_until = excluded.rolled_until
+        """, (tier.name, bounds[1]))
+        conn.commit()
+        start = end
+
+
+def apply_retention(conn, now: datetime | None = None, max_seconds: float = RETENTION_MAX_SECONDS) -> RetentionResult:
+    """Delete expired snapshots, then roll every tier up to its cutoff."""
+    now = now or datetime.now()
+    deadline = time.monotonic() + max_seconds
+
+    raw_cutoff = _floor(now - RAW_RETENTION, TIERS[0])
+    deleted = delete_snapshots(conn, raw_cutoff.isoformat(), deadline)
+
+    # Never roll up aggregates whose snapshots are still around (see rebuild_aggregates)
+    oldest = conn.execute("SELECT MIN(scraped_at) FROM listing_snapshots").fetchone()[0]
+    if oldest is not None:
+        raw_cutoff = min(raw_cutoff, _floor(datetime.fromisoformat(oldest), TIERS[0]))
+
+    merged = 0
+    complete = True
+    for tier in TIERS:
+        cutoff = _floor(min(now - tier.after, raw_cutoff), tier)
+        tier_merged, done = roll_up(conn, tier, cutoff, deadline)
+        merged += tier_merged
+        complete = complete and done
+    return RetentionResult(deleted, merged, complete)
@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session, joinedload, selectinload
 from typing import List, Optional
-from .. import models, schemas, database
+from datetime import datetime
+import base64
+import json
+import numpy as np
+from .. import models, schemas, database, price_aggregates, item_search, top_items, market_snapshot, price_stats, outliers, bonuses, vnum_names
 from ..telegram_bot import send_telegram_message, format_alert_message
 import httpx
 
@@ -10,68 +14,286 @@ router = APIRouter(
     tags=["market"]
 )
 
+# sort_by -> (sort column, descending?). Ties are broken by id in the same direction.
+LISTING_SORTS = {
+    "newest": ("seen_at", True),
+    "price_asc": ("total_price_yang", False),
+    "price_desc": ("total_price_yang", True),
+}
+
+
+def encode_listing_cursor(sort_by: str, key, listing_id: int) -> str:
+    raw = json.dumps([sort_by, key, listing_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_listing_cursor(cursor: str, sort_by: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, key, listing_id = json.loads(raw)
+        listing_id = int(listing_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort_by:
+        raise HTTPException(status_code=400, detail="Cursor was issued for a different sort order")
+    return key, listing_id
+
+
+def check_lang(lang: Optional[str]) -> Optional[str]:
+    """The requested name language, or None when names are served as ingested."""
+    if lang is None or lang == vnum_names.INGEST_LANG:
+        return None
+    if lang not in vnum_names.ITEM_NAME_LANGS:
+        raise HTTPException(status_code=400, detail=f"Unknown language, use one of: {', '.join(vnum_names.ITEM_NAME_LANGS)}")
+    return lang
+
+
 @router.get("/listings", response_model=List[schemas.ListingOut])
 def get_listings(
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
     server: Optional[str] = None, 
     item_name: Optional[str] = None,
     sort_by: Optional[str] = "newest",
+    cursor: Optional[str] = None,
+    bonus: Optional[List[str]] = Query(None),
+    lang: Optional[str] = None,
     db: Session = Depends(database.get_db)
 ):
-    query = db.query(models.Listing)
+    """Returns live listings.
+
+    ``lang`` (e.g. "tr") localizes the item names, and ``item_name`` is then
+    searched in that language; names are resolved by vnum at read time.
+
+    ``bonus`` filters by attribute: "<attr_id>" or "<attr_id>:<min value>"
+    (e.g. ``bonus=72:15`` for at least 15% average damage); repeat it to
+    require several bonuses.
+
+    Pages can be fetched with ``skip`` or – at constant cost however deep – with
+    keyset pagination: pass the opaque ``X-Next-Cursor`` response header of the
+    previous page as ``cursor`` (``skip`` is then ignored). The header is only
+    set when more rows may follow.
+    """
+    from sqlalchemy import tuple_, type_coerce, String, exists
+
+    lang = check_lang(lang)
+
+    # Load server/item in the same query and all bonuses of the page in one more,
+    # instead of one lazy load per row and relationship during serialization
+    query = db.query(models.Listing).options(
+        joinedload(models.Listing.server),
+        joinedload(models.Listing.item),
+        selectinload(models.Listing.bonuses),
+    )
     
     if server:
         query = query.join(models.Server).filter(models.Server.name == server)
     if item_name:
-        query = query.join(models.Item).filter(models.Item.name.contains(item_name))
-        
-    if sort_by == "newest":
-        query = query.order_by(models.Listing.seen_at.desc())
-    elif sort_by == "price_asc":
-        query = query.order_by(models.Listing.total_price_yang.asc())
-    elif sort_by == "price_desc":
-        query = query.order_by(models.Listing.total_price_yang.desc())
+        # Case/diacritic-insensitive substring match through the trigram search index
+        item_ids = item_search.search_item_ids(db.connection().connection.cursor(), item_name, lang)
+        query = query.filter(models.Listing.item_id.in_(item_ids))
+    for bonus_filter in bonus or ():
+        try:
+            attr_id, min_value = bonuses.parse_filter(bonus_filter)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid bonus filter, use <attr_id> or <attr_id>:<min value>")
+        conditions = [models.ListingBonus.listing_id == models.Listing.id, models.ListingBonus.attr_id == attr_id]
+        if min_value is not None:
+            conditions.append(models.ListingBonus.attr_value >= min_value)
+        query = query.filter(exists().where(*conditions))
+
+    column_name, descending = LISTING_SORTS.get(sort_by, ("id", False))
+    # Compare the stored values as-is (seen_at is a raw SQLite timestamp string)
+    sort_column = type_coerce(getattr(models.Listing, column_name), String) \
+        if column_name == "seen_at" else getattr(models.Listing, column_name)
+    key_columns = (sort_column, models.Listing.id)
+
+    if cursor:
+        key, last_id = decode_listing_cursor(cursor, sort_by)
+        if column_name == "id":
+            query = query.filter(models.Listing.id > last_id)
+        elif descending:
+            query = query.filter(tuple_(*key_columns) < tuple_(key, last_id))
+        else:
+            query = query.filter(tuple_(*key_columns) > tuple_(key, last_id))
+        skip = 0
+
+    if column_name == "id":
+        query = query.order_by(models.Listing.id.asc())
+    elif descending:
+        query = query.order_by(sort_column.desc(), models.Listing.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), models.Listing.id.asc())
 
     listings = query.offset(skip).limit(limit).all()
+
+    if listings and len(listings) == limit:
+        last = listings[-1]
+        key = db.query(sort_column).filter(models.Listing.id == last.id).scalar() \
+            if column_name != "id" else None
+        response.headers["X-Next-Cursor"] = encode_listing_cursor(sort_by, key, last.id)
+
+    if lang:
+        names = vnum_names.localized_names(db.connection().connection.cursor(), lang,
+                                           (listing.item.vnum for listing in listings))
+        # Localize copies – the ORM items must not be modified
+        listings = [schemas.ListingOut.model_validate(listing) for listing in listings]
+        for listing in listings:
+            listing.item.name = names.get(listing.item.vnum, listing.item.name)
     return listings
 
 @router.get("/stats/top-items")
-def get_top_items(db: Session = Depends(database.get_db)):
-    """Returns the most frequently listed items (by listing count)."""
-    from sqlalchemy import func
-    results = db.query(models.Item.name, func.count(models.Listing.id).label("count")) \
-        .join(models.Listing) \
-        .group_by(models.Item.name) \
-        .order_by(func.count(models.Listing.id).desc()) \
-        .limit(10).all()
-    
-    return [{"name": name, "count": count} for name, count in results]
+def get_top_items(
+    server: Optional[str] = None,
+    by: str = "volume",
+    limit: int = Query(10, ge=1, le=100),
+    lang: Optional[str] = None,
+    db: Session = Depends(database.get_db)
+):
+    """Returns the top items of a server (or of all servers) from the ranking table
+    the scraper maintains.
+
+    ``by`` is "volume" (listing count), "cheapest" (lowest unit price, fake sellers
+    excluded) or "price_drop" (largest drop of the lowest unit price since the
+    previous scrape). ``lang`` localizes the item names.
+    """
+    if by not in top_items.RANKINGS:
+        raise HTTPException(status_code=400, detail=f"Unknown ranking, use one of: {', '.join(top_items.RANKINGS)}")
+    lang = check_lang(lang)
+    cursor = db.connection().connection.cursor()
+    rows = top_items.top_items(cursor, by, server, limit)
+    if lang:
+        names = vnum_names.localized_names(cursor, lang, (row["vnum"] for row in rows))
+        for row in rows:
+            row["name"] = names.get(row["vnum"], row["name"])
+    return rows
+
+@router.get("/stats/current-prices")
+def get_current_prices(
+    item_name: str,
+    server: Optional[str] = None,
+    lang: Optional[str] = None,
+    db: Session = Depends(database.get_db)
+):
+    """Returns live price statistics (min, mean, bottom-20% mean, p10/median/p90,
+    trimmed mean, MAD outlier count) of the items matching ``item_name`` per server.
+    Listings with an ingestion outlier verdict and fake sellers are excluded.
+
+    Computed from the memory-mapped columnar snapshots the scraper publishes;
+    servers without a snapshot yet are omitted. ``item_name`` is searched in
+    ``lang`` if given.
+    """
+    cursor = db.connection().connection.cursor()
+    item_ids = item_search.search_item_ids(cursor, item_name, check_lang(lang))
+    fake_sellers = {name for (name,) in db.query(models.FakeSeller.seller_name).all()}
+    if server:
+        server_names = [server]
+    else:
+        server_names = [name for (name,) in db.query(models.Server.name).order_by(models.Server.name).all()]
+
+    snapshots = [snapshot for snapshot in market_snapshot.load_snapshots(server_names).values() if snapshot]
+    prices = [snapshot.unit_prices(item_ids, fake_sellers) for snapshot in snapshots]
+    groups = [np.full(len(p), index, dtype=np.int64) for index, p in enumerate(prices)]
+    all_prices = np.concatenate([np.empty(0, dtype=np.int64)] + prices)
+    all_groups = np.concatenate([np.empty(0, dtype=np.int64)] + groups)
+
+    # One vectorized pass over all servers, each server is a group
+    stats = price_stats.rows(price_stats.group_stats(all_prices, all_groups, len(snapshots)))
+    outliers = np.bincount(all_groups[price_stats.outlier_flags(all_prices, all_groups, len(snapshots))],
+                           minlength=len(snapshots))
+    return [
+        {"server": snapshot.server, "scraped_at": snapshot.scraped_at,
+         "stats": dict(row, outliers=int(outliers[index])) if row else None}
+        for index, (snapshot, row) in enumerate(zip(snapshots, stats))
+    ]
 
-@router.get("/stats/price-history")
-def get_price_history(item_name: str, db: Session = Depends(database.get_db)):
-    """Returns price history for an item. Combines legacy price_history with snapshot-based dynamic data."""
-    from sqlalchemy import func as sa_func
-    from collections import defaultdict
+# strftime patterns that truncate a scrape timestamp to the start of its bucket
+PRICE_HISTORY_BUCKETS = {
+    "scrape": "%Y-%m-%dT%H:%M:00",
+    "hour": "%Y-%m-%dT%H:00:00",
+    "day": "%Y-%m-%dT00:00:00",
+}
 
-    result = []
 
-    # 1. Get fake seller names
-    fake_names = [fs.seller_name for fs in db.query(models.FakeSeller).all()]
+def to_local_naive(moment: Optional[datetime]) -> Optional[datetime]:
+    """Scrape timestamps are stored as naive local time; convert aware input to match."""
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone().replace(tzinfo=None)
+    return moment
+
+@router.get("/stats/price-history")
+def get_price_history(
+    item_name: str,
+    server: Optional[str] = None,
+    bucket: str = "scrape",
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = Query(None),
+    lang: Optional[str] = None,
+    db: Session = Depends(database.get_db)
+):
+    """Returns price history for an item. Combines legacy price_history with the per-scrape
+    aggregates the scraper materializes (fake sellers already excluded).
+
+    ``server`` limits the aggregates to one server; without it all servers are merged
+    into one series. Legacy price_history rows predate multi-server scraping and carry
+    no server, so they are included either way.
+
+    ``bucket`` is "scrape" (one point per scrape), "hour" or "day"; the downsampling runs
+    in SQL so the payload scales with the chart resolution. ``from``/``to`` limit the range.
+    Older history is only kept hourly (after a day) and daily (after two weeks), see
+    retention.py, so finer buckets return one point per stored row there.
+    With ``lang``, ``item_name`` is the item's name in that language; history is
+    stored once under the ingested name it maps to (by vnum). Timestamps with an offset
+    (e.g. ``...Z``) are converted to server local time, the time the history is stored in.
+    """
+    from sqlalchemy import func, cast, type_coerce, Integer, String
+
+    if bucket not in PRICE_HISTORY_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Invalid bucket. Must be one of: {set(PRICE_HISTORY_BUCKETS)}")
+    from_, to = to_local_naive(from_), to_local_naive(to)
+    lang = check_lang(lang)
+    if lang:
+        item_name = vnum_names.ingest_name(db.connection().connection.cursor(), lang, item_name) or item_name
 
-    # 2. Check if snapshots exist for this item
-    snapshot_query = db.query(models.ListingSnapshot)\
-        .filter(models.ListingSnapshot.item_name == item_name)
-    if fake_names:
-        snapshot_query = snapshot_query.filter(~models.ListingSnapshot.seller_name.in_(fake_names))
-    snapshots = snapshot_query.order_by(models.ListingSnapshot.scraped_at.asc()).all()
+    result = []
+    agg = models.ItemPriceAggregate
+    # Scrape timestamps are stored as ISO strings – compare them as such so the index is used
+    scraped_at = type_coerce(agg.scraped_at, String)
+
+    # 1. Precomputed per-(server, item, scrape) aggregates, downsampled into buckets.
+    #    Servers/scrapes in one bucket are merged with count-weighted means and an exact min.
+    #    Rolled-up rows (retention.py) carry their bottom-20% count and number of scrapes.
+    bottom_n = func.coalesce(agg.bottom_count, func.max(1, cast(agg.listing_count * 0.2, Integer)))
+    bucket_key = func.strftime(PRICE_HISTORY_BUCKETS[bucket], agg.scraped_at)
+    query = db.query(
+        bucket_key.label("bucket"),
+        func.min(agg.min_price),
+        func.sum(agg.avg_price * agg.listing_count),
+        func.sum(agg.listing_count),
+        func.sum(agg.avg_bottom20_price * bottom_n),
+        func.sum(bottom_n),
+        func.sum(agg.listing_count * 1.0 / agg.scrape_count),
+        func.count(func.distinct(func.strftime("%Y-%m-%dT%H:%M", agg.scraped_at))),
+    ).filter(agg.item_name == item_name)
+    if server:
+        query = query.filter(agg.server_name == server)
+    if from_:
+        query = query.filter(scraped_at >= from_.isoformat())
+    if to:
+        query = query.filter(scraped_at <= to.isoformat())
+    buckets = query.group_by("bucket").order_by("bucket").all()
 
     # Find the earliest snapshot timestamp (if any)
     earliest_snapshot_ts = None
-    if snapshots:
-        earliest_snapshot_ts = min(s.scraped_at for s in snapshots if s.scraped_at)
+    first_query = db.query(func.min(scraped_at)).filter(agg.item_name == item_name)
+    if server:
+        first_query = first_query.filter(agg.server_name == server)
+    first = first_query.scalar()
+    if first:
+        earliest_snapshot_ts = datetime.fromisoformat(first)
 
-    # 3. Include legacy price_history entries that are OLDER than the earliest snapshot
+    # 2. Include legacy price_history entries that are OLDER than the earliest snapshot
     legacy_history = db.query(models.PriceHistory)\
         .filter(models.PriceHistory.item_name == item_name)\
         .order_by(models.PriceHistory.timestamp.asc())\
@@ -81,6 +303,8 @@ def get_price_history(item_name: str, db: Session = Depends(database.get_db)):
         # If we have snapshots, only include legacy data from before the snapshot era
         if earliest_snapshot_ts and h.timestamp and h.timestamp >= earliest_snapshot_ts:
             continue
+        if h.timestamp and ((from_ and h.timestamp < from_) or (to and h.timestamp > to)):
+            continue
         result.append({
             "timestamp": h.timestamp,
             "avg_unit_price": h.avg_unit_price,
@@ -89,28 +313,15 @@ def get_price_history(item_name: str, db: Session = Depends(database.get_db)):
             "total_listings": h.total_listings
         })
 
-    # 4. Add snapshot-based data (dynamically computed, fake-seller-filtered)
-    if snapshots:
-        time_groups = defaultdict(list)
-        for s in snapshots:
-            # Round to minute for grouping
-            key = s.scraped_at.replace(second=0, microsecond=0) if s.scraped_at else s.scraped_at
-            time_groups[key].append(s.unit_price)
-
-        for ts, prices in sorted(time_groups.items()):
-            prices_sorted = sorted(prices)
-            total = len(prices_sorted)
-            avg_price = sum(prices_sorted) / total
-            min_price = prices_sorted[0]
-            bottom_count = max(1, int(total * 0.2))
-            avg_bottom20 = sum(prices_sorted[:bottom_count]) / bottom_count
-            result.append({
-                "timestamp": ts,
-                "avg_unit_price": int(avg_price),
-                "min_unit_price": int(min_price),
-                "avg_bottom20_price": int(avg_bottom20),
-                "total_listings": total
-            })
+    # 3. One point per bucket
+    for key, min_price, price_sum, count, bottom_sum, bottom_count, per_scrape, scrapes in buckets:
+        result.append({
+            "timestamp": datetime.fromisoformat(key),
+            "avg_unit_price": int(price_sum / count),
+            "min_unit_price": int(min_price),
+            "avg_bottom20_price": int(bottom_sum / bottom_count),
+            "total_listings": round(per_scrape / max(scrapes, 1))
+        })
 
     # Sort by timestamp
     result.sort(key=lambda x: x["timestamp"] if x["timestamp"] else "")
@@ -377,6 +588,11 @@ def add_fake_seller(body: schemas.FakeSellerCreate, db: Session = Depends(databa
         raise HTTPException(status_code=409, detail="Seller already flagged")
     seller = models.FakeSeller(seller_name=body.seller_name, reason=body.reason)
     db.add(seller)
+    db.flush()
+    cursor = db.connection().connection.cursor()
+    outliers.apply_fake_seller(cursor, body.seller_name, True)
+    price_aggregates.rebuild_aggregates_for_seller(cursor, body.seller_name)
+    database.bump_scrape_generation(cursor)
     db.commit()
     db.refresh(seller)
     return seller
@@ -388,5 +604,10 @@ def remove_fake_seller(seller_id: int, db: Session = Depends(database.get_db)):
     if not seller:
         raise HTTPException(status_code=404, detail="Fake seller entry not found")
     db.delete(seller)
+    db.flush()
+    cursor = db.connection().connection.cursor()
+    outliers.apply_fake_seller(cursor, seller.seller_name, False)
+    price_aggregates.rebuild_aggregates_for_seller(cursor, seller.seller_name)
+    database.bump_scrape_generation(cursor)
     db.commit()
     return {"message": f"Seller '{seller.seller_name}' removed from fake list"}
@@ -1,20 +1,62 @@
 import sqlite3
 import time
-import subprocess
-import sys
+import asyncio
 import os
+from collections import defaultdict
 from datetime import datetime, timedelta
 
-# Path to the scraper script
-SCRAPER_PATH = os.path.join(os.path.dirname(__file__), "scraper.py")
+import numpy as np
+
+from . import scraper, http_clients, item_search, market_snapshot, price_stats, normalize, retention
+from .database import get_connection
+
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "metin2.db")
 
 TICK_SECONDS = 30  # Check watchlist every 30 seconds
+SCRAPE_TIMEOUT_SECONDS = 600  # Per server
+SCRAPE_CONCURRENCY = int(os.environ.get("SCRAPE_CONCURRENCY", "4"))
+
+
+class TickContext:
+    """Database context for one scheduler pass.
+
+    The whole pass shares a single connection, so sqlite3 reuses its prepared
+    statements across watchlist items. Writes are queued with ``defer()`` and
+    flushed with one commit when the context exits, so no write lock is held
+    while alerts are being sent.
+    """
+
+    def __init__(self, path=None):
+        self.conn = get_connection(path or DB_PATH)
+        self.conn.row_factory = sqlite3.Row
+        self._pending = defaultdict(list)
+
+    def execute(self, sql, params=()):
+        return self.conn.execute(sql, params)
+
+    def defer(self, sql, params):
+        self._pending[sql].append(params)
+
+    def flush(self):
+        for sql, rows in self._pending.items():
+            self.conn.executemany(sql, rows)
+        self._pending.clear()
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Flush even after an error: alerts already sent must stay marked
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
 
 
 def ensure_tables():
     """Ensure watchlist + alert tables exist (migration-safe)."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS watchlist (
@@ -68,7 +110,8 @@ def ensure_tables():
             price_yang INTEGER DEFAULT 0,
             total_price_yang BIGINT NOT NULL,
             unit_price BIGINT NOT NULL,
-            scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            outlier_reason TEXT
         )
     """)
     cursor.execute("""
@@ -90,7 +133,7 @@ def ensure_tables():
 
 def ensure_watchlist_seeded():
     """Seed watchlist from env vars if the table is empty (first-run migration)."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection(DB_PATH)
     cursor = conn.cursor()
     count = cursor.execute("SELECT COUNT(*) FROM watchlist").fetchone()[0]
     if count == 0:
@@ -105,14 +148,9 @@ def ensure_watchlist_seeded():
     conn.close()
 
 
-def get_due_items():
+def get_due_items(tick):
     """Return watchlist items that are active and due for scraping."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM watchlist WHERE is_active = 1")
-    items = cursor.fetchall()
-    conn.close()
+    items = tick.execute("SELECT * FROM watchlist WHERE is_active = 1").fetchall()
 
     now = datetime.now()
     due = []
@@ -128,141 +166,164 @@ def get_due_items():
     return due
 
 
-def mark_scraped(item_id):
+def mark_scraped(tick, item_id):
     """Update last_scraped_at for an item."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute(
+    tick.defer(
         "UPDATE watchlist SET last_scraped_at = ? WHERE id = ?",
         (datetime.now().isoformat(), item_id)
     )
-    conn.commit()
-    conn.close()
 
 
-def perform_global_scrape(server_name="Chimera"):
-    """Run scraper subprocess globally for the server."""
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] Executing Global Scrape for '{server_name}'...")
+# One long-lived event loop so the pooled AsyncClient (bound to its loop)
+# keeps its warm connections from one scrape cycle to the next.
+_runner = asyncio.Runner()
+
+
+def perform_global_scrape(server_names=("Chimera",)):
+    """Scrape all given servers concurrently in-process. Returns True if any succeeded."""
+    server_names = list(server_names)
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Executing Global Scrape for {', '.join(server_names)}...")
     try:
-        env = os.environ.copy()
-        env["SERVER_NAME"] = server_name
-        result = subprocess.run(
-            [sys.executable, SCRAPER_PATH],
-            env=env, capture_output=False, timeout=600
-        )
-        if result.returncode == 0:
-            print(f"  -> GLOBAL SCRAPE OK")
-            return True
-        else:
-            print(f"  -> GLOBAL SCRAPE FAIL: exit code {result.returncode}")
-            return False
-    except subprocess.TimeoutExpired:
-        print(f"  -> TIMEOUT for Global Scrape")
-        return False
+        results = _runner.run(scraper.scrape_servers(
+            server_names, concurrency=SCRAPE_CONCURRENCY, timeout=SCRAPE_TIMEOUT_SECONDS
+        ))
     except Exception as e:
         print(f"  -> ERROR: {e}")
         return False
 
-def clean_old_snapshots(days=14):
-    """Delete listing snapshots older than X days to prevent endless DB growth."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cutoff = (datetime.now() - timedelta(days=days)).isoformat()
-    cursor.execute("DELETE FROM listing_snapshots WHERE scraped_at < ?", (cutoff,))
-    deleted = cursor.rowcount
-    conn.commit()
-    conn.close()
-    if deleted > 0:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Auto-Cleanup: Deleted {deleted} old snapshots.")
+    failed = [name for name, ok in results.items() if not ok]
+    if failed:
+        print(f"  -> GLOBAL SCRAPE FAIL for: {', '.join(failed)}")
+    ok_count = len(results) - len(failed)
+    print(f"  -> GLOBAL SCRAPE OK for {ok_count}/{len(results)} servers")
+    return ok_count > 0
+
+def apply_retention():
+    """Drop expired snapshots and roll old price aggregates up to hourly/daily rows
+    (see retention.py) – in small batches, so the API is never stalled."""
+    conn = get_connection(DB_PATH)
+    try:
+        result = retention.apply_retention(conn)
+    finally:
+        conn.close()
+    if result.snapshots_deleted or result.aggregates_removed:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Retention: deleted {result.snapshots_deleted} old snapshots, "
+              f"merged away {result.aggregates_removed} aggregate rows"
+              f"{'' if result.complete else ' (continues next run)'}.")
 
 
 # ── Price Alert checking ────────────────────────────────────────
 
-def get_telegram_config():
+def get_telegram_config(tick):
     """Return (bot_token, chat_id) or None if not configured / disabled."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    row = conn.execute("SELECT * FROM telegram_settings WHERE is_active = 1 LIMIT 1").fetchone()
-    conn.close()
+    row = tick.execute("SELECT * FROM telegram_settings WHERE is_active = 1 LIMIT 1").fetchone()
     if row:
         return row["bot_token"], row["chat_id"]
     return None
 
 
-def get_active_alerts_for(watchlist_id):
-    """Return active price alerts for a watchlist item."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    alerts = conn.execute(
-        "SELECT * FROM price_alerts WHERE watchlist_id = ? AND is_active = 1",
-        (watchlist_id,)
-    ).fetchall()
-    conn.close()
-    return alerts
+def get_fake_sellers(tick):
+    return set(row["seller_name"] for row in tick.execute("SELECT seller_name FROM fake_sellers").fetchall())
 
 
-def get_current_prices(query):
-    """Get min, avg_bottom20, and avg prices for an item, excluding fake sellers.
-    Returns dict with keys: 'min', 'avg_bottom20', 'avg' (or None if no data)."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-
-    # Load fake seller names
-    fake_sellers = set(
-        row["seller_name"] for row in
-        conn.execute("SELECT seller_name FROM fake_sellers").fetchall()
-    )
-
-    # Compute from listings, excluding fake sellers
-    rows = conn.execute("""
-        SELECT l.total_price_yang / MAX(l.quantity, 1) as unit_price, l.seller_name
-        FROM listings l
-        JOIN items i ON l.item_id = i.id
-        WHERE i.name LIKE ?
-    """, (f"%{query}%",)).fetchall()
-    conn.close()
-
-    prices = sorted([row["unit_price"] for row in rows if row["seller_name"] not in fake_sellers and row["unit_price"]])
-    if not prices:
+def summarize_prices(stats):
+    """Reduce price_stats statistics to {'min', 'avg_bottom20', 'avg'} (None if empty)."""
+    if not stats:
         return None
-    total = len(prices)
-    bottom_count = max(1, int(total * 0.2))
-    return {
-        "min": prices[0],
-        "avg_bottom20": int(sum(prices[:bottom_count]) / bottom_count),
-        "avg": int(sum(prices) / total),
-    }
-
-
-def mark_alert_triggered(alert_id):
+    return {"min": stats["min"], "avg_bottom20": stats["bottom_mean"], "avg": stats["mean"]}
+
+
+def get_live_prices(tick, server_name, fake_sellers):
+    """(item_id array, unit_price array) of a server's live listings without an outlier verdict.
+
+    Read from the server's memory-mapped market snapshot if it has one,
+    otherwise from the listings table. ``fake_sellers`` also drops sellers
+    flagged after the snapshot was published.
+    """
+    snapshot = market_snapshot.load_snapshot(server_name)
+    if snapshot is not None:
+        mask = snapshot.mask(exclude_sellers=fake_sellers)
+        return snapshot.item_id[mask], snapshot.unit_price[mask]
+
+    rows = [
+        (row["item_id"], row["unit_price"])
+        for row in tick.execute("""
+            SELECT l.item_id, l.total_price_yang / MAX(l.quantity, 1) as unit_price
+            FROM listings l JOIN servers s ON s.id = l.server_id
+            WHERE s.name = ? AND l.outlier_reason IS NULL
+        """, (server_name,))
+        if row["unit_price"]
+    ]
+    table = np.array(rows, dtype=np.int64).reshape(-1, 2)
+    return table[:, 0], table[:, 1]
+
+
+def get_prices_for_queries(tick, watches):
+    """Min, avg_bottom20 and avg price of every (query, server_name) watch, excluding
+    outliers and fake sellers.
+
+    Each query is resolved to item ids through the item-name search index
+    (case/diacritic-insensitive substring match plus slang aliases) and matched
+    against the live listings of its own server only; the prices of all watches
+    are then summarized in one price_stats call with the watch as group.
+    Returns {(query, server_name): price dict or None}.
+    """
+    fake_sellers = get_fake_sellers(tick)
+    cursor = tick.conn.cursor()
+    watches = sorted(set(watches))
+    live = {}
+    matched = {}
+    selected = [np.empty(0, dtype=np.int64)]
+    groups = [np.empty(0, dtype=np.int64)]
+    for index, (query, server_name) in enumerate(watches):
+        if server_name not in live:
+            live[server_name] = get_live_prices(tick, server_name, fake_sellers)
+        if query not in matched:
+            matched[query] = item_search.search_item_ids(cursor, query)
+        item_ids, prices = live[server_name]
+        mask = np.isin(item_ids, matched[query])
+        selected.append(prices[mask])
+        groups.append(np.full(int(mask.sum()), index, dtype=np.int64))
+
+    stats = price_stats.group_stats(np.concatenate(selected), np.concatenate(groups), len(watches))
+    return {watch: summarize_prices(row) for watch, row in zip(watches, price_stats.rows(stats))}
+
+
+def get_active_alerts_by_watchlist(tick, table):
+    """Return {watchlist_id: [active alert rows]} for price_alerts / percentage_alerts."""
+    grouped = defaultdict(list)
+    for alert in tick.execute(f"SELECT * FROM {table} WHERE is_active = 1").fetchall():
+        grouped[alert["watchlist_id"]].append(alert)
+    return grouped
+
+
+def mark_alert_triggered(tick, alert_id):
     """Update last_triggered_at for an alert."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute(
+    tick.defer(
         "UPDATE price_alerts SET last_triggered_at = ? WHERE id = ?",
         (datetime.now().isoformat(), alert_id)
     )
-    conn.commit()
-    conn.close()
 
 
-def check_alerts_for_item(watchlist_item):
+def in_cooldown(alert):
+    """Don't re-trigger an alert within 30 minutes."""
+    last = alert["last_triggered_at"]
+    if last:
+        last_dt = datetime.fromisoformat(last)
+        if datetime.now() - last_dt < timedelta(minutes=30):
+            return True
+    return False
+
+
+def check_alerts_for_item(tick, watchlist_item, alerts, price_data, tg):
     """After scraping, check if any price alerts should fire."""
     from .telegram_bot import send_telegram_message_sync, format_alert_message
 
-    tg = get_telegram_config()
-    if not tg:
-        return  # Telegram not set up or disabled
+    if not tg or not alerts or price_data is None:
+        return
 
     bot_token, chat_id = tg
     query = watchlist_item["query"]
-    alerts = get_active_alerts_for(watchlist_item["id"])
-
-    if not alerts:
-        return
-
-    price_data = get_current_prices(query)
-    if price_data is None:
-        return
-
     min_price = price_data["min"]
 
     for alert in alerts:
@@ -280,43 +341,24 @@ def check_alerts_for_item(watchlist_item):
             triggered = True
 
         if triggered:
-            # Cooldown: don't re-trigger within 30 minutes
-            last = alert["last_triggered_at"]
-            if last:
-                last_dt = datetime.fromisoformat(last)
-                if datetime.now() - last_dt < timedelta(minutes=30):
-                    continue
+            if in_cooldown(alert):
+                continue
 
             try:
                 msg = format_alert_message(query, current, price_type, direction)
                 send_telegram_message_sync(bot_token, chat_id, msg)
-                mark_alert_triggered(alert["id"])
+                mark_alert_triggered(tick, alert["id"])
                 print(f"  🔔 Alert sent for '{query}' – {current:,} (threshold {threshold:,} {direction})")
             except Exception as e:
                 print(f"  ⚠️ Failed to send alert for '{query}': {e}")
 
 
-def get_active_percentage_alerts_for(watchlist_id):
-    """Return active percentage alerts for a watchlist item."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    alerts = conn.execute(
-        "SELECT * FROM percentage_alerts WHERE watchlist_id = ? AND is_active = 1",
-        (watchlist_id,)
-    ).fetchall()
-    conn.close()
-    return alerts
-
-
-def mark_percentage_alert_triggered(alert_id):
+def mark_percentage_alert_triggered(tick, alert_id):
     """Update last_triggered_at for a percentage alert."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute(
+    tick.defer(
         "UPDATE percentage_alerts SET last_triggered_at = ? WHERE id = ?",
         (datetime.now().isoformat(), alert_id)
     )
-    conn.commit()
-    conn.close()
 
 
 METRIC_LABELS = {
@@ -326,24 +368,15 @@ METRIC_LABELS = {
 }
 
 
-def check_percentage_alerts_for_item(watchlist_item):
+def check_percentage_alerts_for_item(tick, watchlist_item, alerts, price_data, tg):
     """After scraping, check if any percentage-based deviation alerts should fire."""
     from .telegram_bot import send_telegram_message_sync, format_percentage_alert_message
 
-    tg = get_telegram_config()
-    if not tg:
+    if not tg or not alerts or price_data is None:
         return
 
     bot_token, chat_id = tg
     query = watchlist_item["query"]
-    alerts = get_active_percentage_alerts_for(watchlist_item["id"])
-
-    if not alerts:
-        return
-
-    price_data = get_current_prices(query)
-    if price_data is None:
-        return
 
     for alert in alerts:
         metric_a = alert["metric_a"]
@@ -359,12 +392,8 @@ def check_percentage_alerts_for_item(watchlist_item):
         deviation_pct = abs((val_a - val_b) / val_b) * 100
 
         if deviation_pct >= threshold_pct:
-            # Cooldown: don't re-trigger within 30 minutes
-            last = alert["last_triggered_at"]
-            if last:
-                last_dt = datetime.fromisoformat(last)
-                if datetime.now() - last_dt < timedelta(minutes=30):
-                    continue
+            if in_cooldown(alert):
+                continue
 
             try:
                 label_a = METRIC_LABELS.get(metric_a, metric_a)
@@ -373,22 +402,58 @@ def check_percentage_alerts_for_item(watchlist_item):
                     query, label_a, val_a, label_b, val_b, deviation_pct, threshold_pct
                 )
                 send_telegram_message_sync(bot_token, chat_id, msg)
-                mark_percentage_alert_triggered(alert["id"])
+                mark_percentage_alert_triggered(tick, alert["id"])
                 print(f"  🔔 %-Alert sent for '{query}' – {label_a}={val_a:,} vs {label_b}={val_b:,} ({deviation_pct:.1f}% >= {threshold_pct}%)")
             except Exception as e:
                 print(f"  ⚠️ Failed to send %-alert for '{query}': {e}")
 
 
-print("Scheduler started – reading watchlist from DB.")
-ensure_tables()
-ensure_watchlist_seeded()
+def check_all_alerts(tick):
+    """Evaluate every active price and percentage alert in one batch.
+
+    Prices for all watchlist rows are computed in a single pass, each row
+    against the listings of its own server; alerts and the Telegram config are
+    loaded once per pass.
+    """
+    items = tick.execute("SELECT * FROM watchlist WHERE is_active = 1").fetchall()
+    if not items:
+        return
+
+    print(f"  -> Checking alerts for {len(items)} watchlist items...")
+    for it in items:
+        mark_scraped(tick, it["id"])
+
+    tg = get_telegram_config(tick)
+    if not tg:
+        return  # Telegram not set up or disabled
+
+    price_alerts = get_active_alerts_by_watchlist(tick, "price_alerts")
+    percentage_alerts = get_active_alerts_by_watchlist(tick, "percentage_alerts")
+    alerted = [it for it in items if it["id"] in price_alerts or it["id"] in percentage_alerts]
+    if not alerted:
+        return
+
+    prices = get_prices_for_queries(tick, [(it["query"], it["server_name"]) for it in alerted])
+    for it in alerted:
+        price_data = prices.get((it["query"], it["server_name"]))
+        check_alerts_for_item(tick, it, price_alerts.get(it["id"]), price_data, tg)
+        check_percentage_alerts_for_item(tick, it, percentage_alerts.get(it["id"]), price_data, tg)
+
+def startup():
+    """Create/migrate the database and seed the watchlist (run once, before the loop)."""
+    print("Scheduler started – reading watchlist from DB.")
+    scraper.init_db()
+    ensure_tables()
+    ensure_watchlist_seeded()
+
 
 GLOBAL_INTERVAL_MIN = 10
-CLEANUP_INTERVAL_DAYS = 1
+RETENTION_INTERVAL_MIN = 60
 
 if __name__ == "__main__":
+    startup()
     try:
-        server_name = os.environ.get("SERVER_NAME", "Chimera")
+        server_names = scraper.resolve_server_names()
         last_global_scrape = None
         last_cleanup = None
         
@@ -397,28 +462,24 @@ if __name__ == "__main__":
             
             # 1. Global Scrape Check
             if last_global_scrape is None or now - last_global_scrape >= timedelta(minutes=GLOBAL_INTERVAL_MIN):
-                success = perform_global_scrape(server_name)
+                success = perform_global_scrape(server_names)
                 last_global_scrape = datetime.now()
                 
                 if success:
-                    # Check alerts for all active watchlist items
-                    conn = sqlite3.connect(DB_PATH)
-                    conn.row_factory = sqlite3.Row
-                    items = conn.execute("SELECT * FROM watchlist WHERE is_active = 1").fetchall()
-                    conn.close()
-                    
-                    if items:
-                        print(f"  -> Checking alerts for {len(items)} watchlist items...")
-                        for it in items:
-                            mark_scraped(it["id"])
-                            check_alerts_for_item(it)
-                            check_percentage_alerts_for_item(it)
-
-            # 2. Cleanup Check
-            if last_cleanup is None or now - last_cleanup >= timedelta(days=CLEANUP_INTERVAL_DAYS):
-                clean_old_snapshots(days=14)
+                    # Check alerts for all active watchlist items – one connection, one commit
+                    with TickContext() as tick:
+                        check_all_alerts(tick)
+
+            # 2. Retention Check
+            if last_cleanup is None or now - last_cleanup >= timedelta(minutes=RETENTION_INTERVAL_MIN):
+                apply_retention()
                 last_cleanup = datetime.now()
                 
             time.sleep(TICK_SECONDS)
     except KeyboardInterrupt:
         print("Scheduler stopped.")
+    finally:
+        _runner.run(http_clients.aclose_all())
+        _runner.close()
+        http_clients.close_all()
+        normalize.shutdown()
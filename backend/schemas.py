@@ -14,11 +14,14 @@ class ItemBase(BaseModel):
     name: str
     category: Optional[str] = None
     image_url: Optional[str] = None
+    vnum: Optional[int] = None
     
     class Config:
         from_attributes = True
 
 class ListingBonusBase(BaseModel):
+    attr_id: int
+    attr_value: int
     bonus_name: str
     bonus_value: Optional[str] = None
     
@@ -29,12 +32,14 @@ class ListingOut(BaseModel):
     id: int
     server: ServerBase
     item: ItemBase
+    vnum: Optional[int] = None
     seller_name: str
     quantity: int
     price_won: int
     price_yang: int
     total_price_yang: int
     seen_at: datetime
+    outlier_reason: Optional[str] = None
     bonuses: List[ListingBonusBase] = [] 
 
     class Config:
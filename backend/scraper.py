@@ -1,24 +1,30 @@
 import os
-import sqlite3
+import re
+import codecs
+import hashlib
 import asyncio
-import random
+import threading
+import time
 import sys
 import json
 import argparse
 from datetime import datetime
 import httpx
 
+from . import http_clients, price_aggregates, item_search, top_items, market_snapshot, outliers, normalize, fetch_cache, dump_cache, vnum_names
+from .database import get_connection, bump_scrape_generation, migrate_schema
+
 # Configuration
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "metin2.db")
-SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "database", "schema.sql")
 HISTORY_EXPORT_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "exports")
 
 # Direct JSON API endpoints (no browser needed!)
-STORE_DATA_URL = "https://metin2alerts.com/store/public/data/{server_id}.json?v={ts}&r={rand}"
+# Stable URL, so conditional requests can be answered with 304 (see fetch_cache.py)
+STORE_DATA_URL = "https://metin2alerts.com/store/public/data/{server_id}.json"
 ITEM_NAMES_URL = "https://metin2alerts.com/m2_data/{lang}/item_names.json"
 
-# Cache for item names (vnum_str -> localized name)
-_item_names_cache: dict[str, dict[str, str]] = {}
+# Per-process item name tables (lang -> (vnum_names.NameTable, unix time loaded))
+_item_names_cache: dict[str, tuple[vnum_names.NameTable, float]] = {}
 
 # ---------------------------------------------------------------------------
 # Complete server list (scraped from metin2alerts.com dropdown)
@@ -60,437 +66,549 @@ SERVER_MAPPING = {
     "Polska": "702",
 }
 
-# ---------------------------------------------------------------------------
-# German bonus / attribute mapping  (attr_id -> format string)
-# Extracted from metin2alerts.com  window.STAT_MAP
-# The format string contains %d (or %0.1f) as placeholder for the value.
-# ---------------------------------------------------------------------------
-STAT_MAP: dict[int, str] = {
-    1: "Max. TP +%d",
-    2: "Max. MP +%d",
-    3: "Vitalität +%d",
-    4: "Intelligenz +%d",
-    5: "Stärke +%d",
-    6: "Beweglichkeit +%d",
-    7: "Angriffsgeschwindigkeit +%d%%",
-    8: "Bewegungsgeschw. %d%%",
-    9: "Zaubergeschwindigkeit +%d%%",
-    10: "TP-Regeneration +%d%%",
-    11: "MP-Regeneration +%d%%",
-    12: "Vergiftungschance %d%%",
-    13: "Ohnmachtschance %d%%",
-    14: "Verlangsamungschance %d%%",
-    15: "Chance auf krit. Treffer +%d%%",
-    16: "%d%% Chance auf durchbohrenden Treffer",
-    17: "Stark gegen Halbmenschen +%d%%",
-    18: "Stark gegen Tiere +%d%%",
-    19: "Stark gegen Orks +%d%%",
-    20: "Stark gegen Esoterische +%d%%",
-    21: "Stark gegen Untote +%d%%",
-    22: "Stark gegen Teufel +%d%%",
-    23: "%d%% Schaden wird von TP absorbiert",
-    24: "%d%% Schaden wird von MP absorbiert",
-    25: "%d%% Chance auf Manaraub",
-    26: "%d%% Chance, MP bei Treffer zurückzuerhalten",
-    27: "Chance, Nahkampfangriff abzublocken %d%%",
-    28: "%d%% Chance, Pfeilangriff auszuweichen",
-    29: "Schwertverteidigung %d%%",
-    30: "Zweihänderverteidigung %d%%",
-    31: "Dolchverteidigung %d%%",
-    32: "Glockenverteidigung %d%%",
-    33: "Fächerverteidigung %d%%",
-    34: "Pfeilverteidigung %d%%",
-    35: "Feuerwiderstand %d%%",
-    36: "Blitzwiderstand %d%%",
-    37: "Magiewiderstand %d%%",
-    38: "Windwiderstand %d%%",
-    39: "%d%% Chance, Nahkampftreffer zu reflektieren",
-    40: "%d%% Chance, Fluch zu reflektieren",
-    41: "Giftwiderstand %d%%",
-    42: "%d%% Chance, MP wiederherzustellen",
-    43: "%d%% Chance auf EXP-Bonus",
-    44: "%d%% Chance, eine doppelte Menge Yang fallen zu lassen.",
-    45: "%d%% Chance, eine doppelte Menge von Gegenständen fallen zu lassen.",
-    46: "Trank %d%% Effektzuwachs",
-    47: "%d%% Chance, TP wiederherzustellen",
-    48: "Abwehr gegen Ohnmacht",
-    49: "Abwehr gegen Verlangsamen",
-    50: "Immun gegen Stürzen",
-    51: "Fertigkeit",
-    52: "Reichweite +%d m",
-    53: "Angriffswert +%d",
-    54: "Verteidigung +%d",
-    55: "Magischer Angriffswert +%d",
-    56: "Magische Verteidigung +%d",
-    58: "Max. Ausdauer +%d",
-    59: "Stark gegen Krieger +%d%%",
-    60: "Stark gegen Ninja +%d%%",
-    61: "Stark gegen Sura +%d%%",
-    62: "Stark gegen Schamanen +%d%%",
-    63: "Stark gegen Monster +%d%%",
-    64: "Angriffswert +%d%%",
-    65: "Verteidigung +%d%%",
-    66: "EXP +%d%%",
-    67: "Dropchance von Gegenständen um %d%% erhöht",
-    68: "Dropchance Yang um %d%% erhöht",
-    69: "Max. TP +%d%%",
-    70: "Max. MP +%d%%",
-    71: "Fertigkeitsschaden %d%%",
-    72: "Durchschn. Schaden %d%%",
-    73: "Widerstand gegen Fertigkeitsschaden %d%%",
-    74: "Durchschn. Schadenswiderstand %d%%",
-    78: "Abwehrchance gegen Kriegerangriffe %d%%",
-    79: "Abwehrchance gegen Ninjaangriffe %d%%",
-    80: "Abwehrchance gegen Suraangriffe %d%%",
-    81: "Abwehrchance gegen Schamanenangriffe %d%%",
-    82: "Energie %d",
-    83: "Verteidigung +%d",
-    84: "Kostümbonus %d%%",
-    85: "Magischer Angriff +%d%%",
-    86: "Magie-/Nahkampfangriff +%d%%",
-    87: "Eiswiderstand +%d%%",
-    88: "Erdwiderstand +%d%%",
-    89: "Widerstand gegen Dunkelheit %d%%",
-    90: "Widerstand gegen kritischen Treffer +%d%%",
-    91: "Widerstand gegen durchbohrenden Treffer +%d%%",
-    92: "Widerstand gegen Blutungsangriff + %d%%",
-    93: "Blutungsangriff + %d%%",
-    94: "Stark gegen Lykaner + %d%%",
-    95: "Abwehrchance gegen Lykaner %d%%",
-    96: "Krallenverteidigung + %d%%",
-    97: "Aufnahmerate: %d%%",
-    98: "Magiebruch um %d%%",
-    99: "Kraft der Blitze +%d%%",
-    100: "Kraft des Feuers +%d%%",
-    101: "Kraft des Eises +%d%%",
-    102: "Kraft des Windes +%d%%",
-    103: "Kraft der Erde +%d%%",
-    104: "Kraft der Dunkelheit +%d%%",
-    105: "Stark gegen Zodiakmonster +%d%%",
-    106: "Stark gegen Insekten +%d%%",
-    107: "Stark gegen Wüstenmonster +%d%%",
-    108: "Bruch von Schwertverteidigung +%d%%",
-    109: "Bruch von Zweihandverteidigung +%d%%",
-    110: "Bruch von Dolchverteidigung +%d%%",
-    111: "Bruch von Glockenverteidigung +%d%%",
-    112: "Bruch von Fächerverteidigung +%d%%",
-    113: "Bruch von Pfeilverteidigung +%d%%",
-    114: "Bruch von Krallenverteidigung +%d%%",
-    115: "Widerstand gegen Halbmenschen %d%%",
-    116: "Widerstand gegen Sturz +%d%%",
-    119: "Dreiwege-Schnitt-Schaden +%d%%",
-    120: "Schaden von Sausen +%d%%",
-    121: "Schaden von Schwertwirbel +%d%%",
-    122: "Durchschlagsschaden +%d%%",
-    123: "Schaden von Heftiges Schlagen +%d%%",
-    124: "Schwertschlagschaden +%d%%",
-    125: "Schaden von Hinterhalt +%d%%",
-    126: "Schaden von Blitzangriff +%d%%",
-    127: "Schaden von Degenwirbel +%d%%",
-    128: "Schaden von Giftwolke +%d%%",
-    129: "Schaden von Wiederholter Schuss +%d%%",
-    130: "Pfeilregenschaden +%d%%",
-    131: "Giftpfeilschaden +%d%%",
-    132: "Feuerpfeilschaden +%d%%",
-    133: "Fingerschlagschaden +%d%%",
-    134: "Schaden von Drachenwirbel +%d%%",
-    135: "Schaden von Zauber aufheben +%d%%",
-    136: "Schaden von Dunkler Schlag +%d%%",
-    137: "Schaden von Flammenschlag +%d%%",
-    138: "Schaden von Dunkler Stein +%d%%",
-    139: "Schaden von Fliegender Talisman +%d%%",
-    140: "Schaden von Drachenschießen +%d%%",
-    141: "Schaden von Drachengebrüll +%d%%",
-    142: "Blitzwurfschaden +%d%%",
-    143: "Schaden von Blitz heraufbeschwören +%d%%",
-    144: "Blitzkrallenschaden +%d%%",
-    145: "Schaden von Zerreißen +%d%%",
-    146: "Schaden von Atem des Wolfes +%d%%",
-    147: "Schaden von Wolfssprung +%d%%",
-    148: "Wolfskrallenschaden +%d%%",
-    149: "Angriffsschaden von Bossen -%d%%",
-    150: "Fertigkeitsschaden von Bossen -%d%%",
-    151: "Angriffsschaden gegen Bosse +%d%%",
-    152: "Fertigkeitsschaden gegen Bosse +%d%%",
-    153: "Erhalte Kraft d. Feuers für %d Sek. im Kampf",
-    154: "Erhalte Kraft d. Eises für %d Sek. im Kampf",
-    155: "Erhalte Kraft d. Blitze für %d Sek. im Kampf",
-    156: "Erhalte Kraft d. Windes für %d Sek. im Kampf",
-    157: "Erhalte Kraft d. Dunkelheit für %d Sek. im Kampf",
-    158: "Erhalte Kraft d. Erde für %d Sek. im Kampf",
-    159: "Erhalte Feuerwiderstand für %d Sek. im Kampf",
-    160: "Erhalte Eiswiderstand für %d Sek. im Kampf",
-    161: "Erhalte Blitzwiderstand für %d Sek. im Kampf",
-    162: "Erhalte Windwiderstand für %d Sek. im Kampf",
-    163: "Erhalte Widerstand vs Dunkelheit für %d Sek. im Kampf",
-    164: "Erhalte Erdwiderstand für %d Sek. im Kampf",
-    214: "+%d%% Stark gegen Metinsteine",
-    215: "Absorbiert Schaden zu %d%% als TP",
-    216: "Absorbiert Schaden zu %d%% als MP",
-    312: "Stark gegen Mysterien +%d%%",
-    313: "Stark gegen Drachen +%d%%",
-    322: "Stark gegen Mondschatten-Monster +%d%%",
-}
+async def fetch_item_names(lang: str = vnum_names.INGEST_LANG,
+                           client: httpx.AsyncClient | None = None) -> vnum_names.NameTable:
+    """vnum -> localized item name table for ``lang``. Cached per process.
+
+    Served from the persisted ``item_names`` table; the CDN copy is revalidated
+    at most every ITEM_NAMES_REFRESH_SECONDS and only re-parsed when it changed
+    (see vnum_names.py). Uses the shared pooled metin2alerts client unless
+    ``client`` is given.
+    """
+    cached = _item_names_cache.get(lang)
+    if cached and time.time() - cached[1] < vnum_names.ITEM_NAMES_REFRESH_SECONDS:
+        return cached[0]
+
+    conn = get_connection(DB_PATH)
+    try:
+        cursor = conn.cursor()
+        version = vnum_names.stored_version(cursor, lang)
+        now = time.time()
+        if vnum_names.needs_refresh(version, now):
+            try:
+                await _refresh_item_names(cursor, lang, version, now, client)
+            except (httpx.HTTPError, ValueError) as e:
+                conn.rollback()
+                if version is None:
+                    raise
+                print(f"Could not refresh item names for '{lang}', using the stored table: {e}")
+        table = vnum_names.load_table(cursor, lang)
+    finally:
+        conn.close()
+
+    _item_names_cache[lang] = (table, now)
+    return table
+
+
+async def _refresh_item_names(cursor, lang, version, now, client):
+    """Revalidate the CDN copy of a language's names; store it if it changed."""
+    if client is None:
+        client = http_clients.get_async_client("metin2alerts")
+    url = ITEM_NAMES_URL.format(lang=lang)
+    key = f"names_{lang}"
+
+    def has_parsed_copy(sha256):
+        return version is not None and version.sha256 == sha256
+
+    dump = await fetch_cache.fetch(client, url, key, has_parsed_copy)
+    if version is not None and dump.sha256 == version.sha256:
+        vnum_names.mark_checked(cursor, lang, dump.sha256, now)
+    else:
+        if dump.path is None:
+            fetch_cache.discard(key)
+            dump = await fetch_cache.fetch(client, url, key)
+        with open(dump.path, "rb") as f:
+            names = json.load(f)  # dict: vnum_str -> localized name
+        vnum_names.store_table(cursor, lang, names, dump.sha256, now)
+        print(f"Stored {len(names)} item names for '{lang}'.")
+    cursor.connection.commit()
+    fetch_cache.drop_body(key)
 
 
-def resolve_bonus(attr_id: int, attr_value: int) -> tuple[str, str]:
-    """Resolve a raw attribute ID + value into (readable_name, value_str).
+# Longest element the stream parser buffers while waiting for its end
+MAX_PENDING_ELEMENT_CHARS = 1 << 20
 
-    Returns e.g. ("Durchschn. Schaden 15%", "15") for attr_id=72, attr_value=15.
-    Falls back to "Attribut #<id> <value>" for unknown IDs.
+
+class JSONArrayStream:
+    """Incremental decoder for a top-level JSON array of objects.
+
+    Bytes are pushed in with ``feed()`` as they arrive from the network (or a
+    file) and every element that is complete so far is returned immediately,
+    so only the current partial element is ever buffered – never the whole
+    multi-MB dump.
+
+    A decode error only means "wait for more bytes" when more bytes could fix
+    it: an unterminated string, or an error within the last few characters (a
+    cut token, number or escape). Anything else, a missing separator, or a
+    partial element longer than MAX_PENDING_ELEMENT_CHARS raises ValueError.
     """
-    fmt = STAT_MAP.get(attr_id)
-    if fmt:
-        try:
-            display = fmt % attr_value
-        except (TypeError, ValueError):
-            display = fmt.replace("%d", str(attr_value)).replace("%0.1f", str(attr_value))
-        return (display, str(attr_value))
-    # Unknown attribute – keep raw data so nothing is lost
-    return (f"Attribut #{attr_id} {attr_value}", str(attr_value))
-
-
-async def fetch_item_names(lang: str = "de") -> dict[str, str]:
-    """Fetch German item names from metin2alerts CDN. Cached."""
-    if lang in _item_names_cache:
-        return _item_names_cache[lang]
-    
-    url = ITEM_NAMES_URL.format(lang=lang)
-    print(f"Fetching item names for language '{lang}'...")
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.get(url, headers={
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Referer": "https://metin2alerts.com/store/",
-        })
-        resp.raise_for_status()
-        names = resp.json()  # dict: vnum_str -> localized name
-        _item_names_cache[lang] = names
-        print(f"Loaded {len(names)} item names for '{lang}'.")
-        return names
-
-
-async def fetch_server_items(server_id: str) -> list[dict]:
-    """Fetch ALL market listings for a server as JSON (bypasses browser entirely). Cache for 5 mins."""
-    import time
-    
-    cache_file = os.path.join(os.path.dirname(__file__), "..", "data", f"cache_{server_id}.json")
-    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
-    
-    # Check if cache is fresh (less than 5 minutes old)
-    if os.path.exists(cache_file):
-        mtime = os.path.getmtime(cache_file)
-        if time.time() - mtime < 300:  # 5 minutes
-            print(f"Loading server data from cache ({cache_file})...")
-            try:
-                with open(cache_file, "r", encoding="utf-8") as f:
-                    items = json.load(f)
-                    print(f"Loaded {len(items)} items from local cache.")
-                    return items
-            except Exception as e:
-                print(f"Cache read error: {e}, fetching fresh data.")
-                
-    ts = int(time.time() * 1000)
-    rand = random.randint(100000, 999999)
-    url = STORE_DATA_URL.format(server_id=server_id, ts=ts, rand=rand)
-    
-    print(f"Fetching server data from {url}...")
-    async with httpx.AsyncClient(timeout=120) as client:
-        resp = await client.get(url, headers={
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Referer": "https://metin2alerts.com/store/",
-            "Accept": "application/json",
-        })
-        resp.raise_for_status()
-        items = resp.json()
-        print(f"Fetched {len(items)} items from server ({len(resp.content) / 1024 / 1024:.1f} MB).")
-        
-        # Save to cache
-        try:
-            with open(cache_file, "w", encoding="utf-8") as f:
-                json.dump(items, f, ensure_ascii=False)
-        except Exception as e:
-            print(f"Failed to write cache: {e}")
-            
-        return items
+
+    _WS = re.compile(r"[ \t\n\r]*")
+    # Longest tail a cut can leave undecodable: "-Infinity", a "\uXXXX" escape, ...
+    _CUT_TAIL = 16
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._started = False
+        self._finished = False
+        self._separated = True  # a ',' (or the '[') precedes the next element
+
+    def feed(self, data: bytes) -> list:
+        """Consume a chunk of raw bytes and return the elements completed by it."""
+        buf = self._buf + self._utf8.decode(data)
+        pos = 0
+        out = []
+        while not self._finished:
+            pos = self._WS.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            ch = buf[pos]
+            if not self._started:
+                if ch != "[":
+                    raise ValueError(f"Expected JSON array, got {ch!r}")
+                self._started = True
+                pos += 1
+            elif ch == "]":
+                self._finished = True
+                pos += 1
+            elif ch == "," and not self._separated:
+                self._separated = True
+                pos += 1
+            elif not self._separated:
+                raise ValueError(f"Expected ',' or ']' in JSON array, got {ch!r}")
+            else:
+                try:
+                    obj, end = self._decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError as e:
+                    if not self._is_cut(e, buf):
+                        raise ValueError(f"Malformed element in JSON array: {e}") from None
+                    if len(buf) - pos > MAX_PENDING_ELEMENT_CHARS:
+                        raise ValueError("JSON array element exceeds MAX_PENDING_ELEMENT_CHARS") from None
+                    break  # element not complete yet – wait for more bytes
+                if end == len(buf) and not isinstance(obj, (dict, list)):
+                    break  # a bare number may still be cut off
+                out.append(obj)
+                self._separated = False
+                pos = end
+        self._buf = buf[pos:]
+        return out
+
+    def _is_cut(self, error: json.JSONDecodeError, buf: str) -> bool:
+        """Whether more bytes could complete the text that failed to decode."""
+        return error.msg.startswith("Unterminated string") or error.pos >= len(buf) - self._CUT_TAIL
+
+    def close(self) -> None:
+        """Verify the array was terminated and nothing but whitespace follows."""
+        rest = self._buf + self._utf8.decode(b"", final=True)
+        if not self._finished or rest.strip():
+            raise ValueError("Truncated or malformed JSON array")
+
+
+async def fetch_server_dump(server_id: str, client: httpx.AsyncClient | None = None,
+                            need_body: bool = False) -> fetch_cache.CachedDump:
+    """Download (or revalidate) a server's raw store dump into the fetch cache.
+
+    With ``need_body`` the raw JSON is downloaded again if only the parsed
+    dump cache is left. Uses the shared pooled metin2alerts client unless
+    ``client`` is given.
+    """
+    if client is None:
+        client = http_clients.get_async_client("metin2alerts")
+    url = STORE_DATA_URL.format(server_id=server_id)
+    def has_parsed_copy(sha256):
+        return dump_cache.has_dump(server_id, sha256)
+
+    dump = await fetch_cache.fetch(client, url, server_id, has_parsed_copy)
+    if need_body and dump.path is None:
+        fetch_cache.discard(server_id)
+        dump = await fetch_cache.fetch(client, url, server_id)
+    return dump
+
+
+async def iter_dump_chunks(path: str):
+    """Raw bytes of a cached dump as an async iterator (for normalize_dump)."""
+    for chunk in fetch_cache.iter_file(path):
+        yield chunk
+
+
+async def iter_dump_items(path: str):
+    """Parse a cached dump one raw dict at a time; peak memory does not grow with its size."""
+    parser = JSONArrayStream()
+    for chunk in fetch_cache.iter_file(path):
+        for item in parser.feed(chunk):
+            yield item
+    parser.close()
+
+
+async def iter_server_items(server_id: str, client: httpx.AsyncClient | None = None):
+    """Stream market listings for a server one raw dict at a time (see fetch_server_dump)."""
+    dump = await fetch_server_dump(server_id, client, need_body=True)
+    try:
+        async for item in iter_dump_items(dump.path):
+            yield item
+    except ValueError:
+        fetch_cache.discard(server_id)
+        raise
+
+
+async def fetch_server_items(server_id: str, client: httpx.AsyncClient | None = None) -> list[dict]:
+    """Fetch ALL market listings for a server as a list (see iter_server_items)."""
+    return [item async for item in iter_server_items(server_id, client)]
+
+
+def get_ingested_dump(server_name: str) -> str | None:
+    """SHA-256 of the store dump last ingested for a server."""
+    conn = get_connection(DB_PATH)
+    try:
+        row = conn.execute("SELECT sha256 FROM ingested_dumps WHERE server_name = ?", (server_name,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
 
 def init_db():
     """Initialize the database with the schema."""
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     os.makedirs(HISTORY_EXPORT_DIR, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection(DB_PATH)
+    migrate_schema(conn)
     cursor = conn.cursor()
-    
-    with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
-        schema = f.read()
-        cursor.executescript(schema)
-    
+
+    item_search.ensure_search_index(cursor)
+    item_search.sync_search_index(cursor)
+
+    # One-time backfill of price aggregates for snapshots taken before they existed
+    has_aggregates = cursor.execute("SELECT 1 FROM item_price_aggregates LIMIT 1").fetchone()
+    has_snapshots = cursor.execute("SELECT 1 FROM listing_snapshots LIMIT 1").fetchone()
+    if has_snapshots and not has_aggregates:
+        rebuilt = price_aggregates.rebuild_aggregates(cursor)
+        print(f"Backfilled {rebuilt} price aggregates from existing snapshots.")
+
+    has_item_stats = cursor.execute("SELECT 1 FROM server_item_stats LIMIT 1").fetchone()
+    has_listings = cursor.execute("SELECT 1 FROM listings LIMIT 1").fetchone()
+    if has_listings and not has_item_stats:
+        rebuilt = top_items.rebuild_server_stats(cursor, datetime.now().isoformat())
+        print(f"Backfilled {rebuilt} item ranking rows from live listings.")
+
     conn.commit()
     conn.close()
     print(f"Database initialized at {DB_PATH}")
 
 
-# Common item name mappings (Short/Slang -> Full Game Name, German)
-ITEM_NAME_MAPPINGS = {
-    "vollmond": "Vollmondschwert",
-    "gift": "Giftschwert",
-    "klinge": "Klinge des Verderbens",
-    "rep": "Roter Eisenschlitzer",
-    "rundschild": "Schwarzer Rundschild",
-    "hirschhorn": "Hirschhorn-Bogen",
-    "groll": "Grollschwert",
-    "stahlrüstung": "Blaue Stahlrüstung",
-    "fünfeck": "Fünfeckschild",
-    "orchidee": "Orchideenglocke",
-    "löwenmaul": "Löwenmaulschild",
-    "falke": "Falkenschild",
-    "tiger": "Tigerschild",
-    "ebenholz": "Ebenholz-Ohrring",
-    "himmelsauge": "Himmelsaugen-Halskette",
-}
-
-async def scrape_store(server_name=None, max_pages=50):
+async def scrape_store(server_name=None, max_pages=50, client: httpx.AsyncClient | None = None) -> bool:
     """
     Fetch market data natively for the whole server globally.
+    Returns True on success, False if fetching or saving failed.
     """
     if not server_name:
         server_name = os.environ.get("SERVER_NAME", "Chimera")
 
     server_value = SERVER_MAPPING.get(server_name, "531")
-    lang = "de"  # Always German
+    lang = vnum_names.INGEST_LANG  # other languages are resolved at read time
     print(f"Global Scrape for server: {server_name} (ID: {server_value}, lang: {lang})")
 
     try:
-        item_names = await fetch_item_names(lang)
-        all_items = await fetch_server_items(server_value)
-
-        matching_listings = []
-        for raw_item in all_items:
-            vnum = raw_item.get("vnum", 0)
-            localized_name = item_names.get(str(vnum), raw_item.get("name", "Unknown"))
-            
-            yang = raw_item.get("yangPrice", 0) or 0
-            won = raw_item.get("wonPrice", 0) or 0
-            quantity = raw_item.get("quantity", 1) or 1
-            seller = raw_item.get("seller", "Unknown") or "Unknown"
-            total_yang = won * 100_000_000 + yang
-
-            if total_yang <= 0:
-                continue
-
-            bonuses = []
-            for attr in (raw_item.get("attrs") or []):
-                if isinstance(attr, (list, tuple)) and len(attr) >= 2 and attr[0]:
-                    attr_id = int(attr[0])
-                    attr_val = int(attr[1]) if attr[1] else 0
-                    display_name, val_str = resolve_bonus(attr_id, attr_val)
-                    bonuses.append({"name": display_name, "value": val_str})
-
-            matching_listings.append({
-                "item_name": localized_name,
-                "seller": seller,
-                "quantity": quantity,
-                "price_won": won,
-                "price_yang": yang,
-                "total_yang": total_yang,
-                "unit_price": total_yang / quantity,
-                "bonuses": bonuses,
-            })
+        dump = await fetch_server_dump(server_value, client)
+        if dump.sha256 == get_ingested_dump(server_name):
+            print(f"Store dump of {server_name} unchanged since the last scrape, nothing to ingest.")
+            return True
+
+        # A dump that was parsed before (but not ingested) is loaded from the binary cache
+        matching_listings = dump_cache.load_dump(server_value, dump.sha256)
+        if matching_listings is None:
+            item_names = await fetch_item_names(lang, client)
+
+            # Compact Listing tuples; large dumps are parsed and normalized by
+            # NORMALIZE_WORKERS processes straight from the raw bytes
+            try:
+                if dump.path is None:
+                    raise ValueError("Neither the raw nor the parsed dump is cached any more")
+                if normalize.NORMALIZE_WORKERS > 1:
+                    matching_listings = await normalize.normalize_dump(iter_dump_chunks(dump.path), item_names)
+                else:
+                    matching_listings = await normalize.normalize_stream(iter_dump_items(dump.path), item_names)
+            except ValueError:
+                fetch_cache.discard(server_value)
+                raise
+            dump_cache.write_dump(server_value, dump.sha256, matching_listings)
+            fetch_cache.drop_body(server_value)
 
         print(f"Found {len(matching_listings)} listings total on {server_name}.")
 
         if not matching_listings:
-            return
+            return True
 
         from collections import defaultdict
         grouped = defaultdict(list)
         for listing in matching_listings:
-            grouped[listing["item_name"]].append(listing)
+            grouped[listing.item_name].append(listing)
 
-        await save_to_db_global(grouped, server_name)
+        await save_to_db_global(grouped, server_name, dump.sha256)
 
         print(f"Global scrape complete for {server_name}.")
+        return True
 
     except httpx.HTTPStatusError as e:
-        print(f"HTTP error fetching data: {e.response.status_code} {e.response.reason_phrase}")
-        sys.exit(1)
+        print(f"HTTP error fetching data for {server_name}: {e.response.status_code} {e.response.reason_phrase}")
     except httpx.RequestError as e:
-        print(f"Network error: {e}")
-        sys.exit(1)
+        print(f"Network error for {server_name}: {e}")
     except Exception as e:
-        print(f"Scrape error: {e}")
+        print(f"Scrape error for {server_name}: {e}")
         import traceback
         traceback.print_exc()
-        sys.exit(1)
+    return False
 
 
+async def scrape_servers(server_names, concurrency=4, timeout=600) -> dict[str, bool]:
+    """Scrape several servers concurrently in this process.
 
-async def save_to_db_global(grouped_listings, server_name):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    All servers share the pooled metin2alerts client (warm connections, one
+    TLS handshake per host) and the item-name tables (ITEM_NAME_LANGS) are
+    revalidated only once.
+    At most ``concurrency`` downloads run at the same time.
+    Returns {server_name: success}.
+    """
+    server_names = [name for name in server_names if name in SERVER_MAPPING]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    client = http_clients.get_async_client("metin2alerts")
+
+    async def run_one(name):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(scrape_store(name, client=client), timeout)
+            except asyncio.TimeoutError:
+                print(f"Timeout while scraping {name}.")
+                return False
+
+    # Ingest names first; the other languages' tables are only read by the API
+    for lang in dict.fromkeys((vnum_names.INGEST_LANG, *vnum_names.ITEM_NAME_LANGS)):
+        try:
+            await fetch_item_names(lang, client)
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Could not prefetch item names for '{lang}': {e}")
+
+    results = await asyncio.gather(*(run_one(name) for name in server_names))
+    return dict(zip(server_names, results))
+
+
+def resolve_server_names(spec=None) -> list[str]:
+    """Turn a SCRAPE_SERVERS spec ("all" or "Chimera,Germania") into server names."""
+    if spec is None:
+        spec = os.environ.get("SCRAPE_SERVERS") or os.environ.get("SERVER_NAME", "Chimera")
+    if spec.strip().lower() == "all":
+        return list(SERVER_MAPPING)
+    names = [name.strip() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SERVER_MAPPING]
+    if unknown:
+        print(f"Ignoring unknown servers: {', '.join(unknown)}")
+    return [name for name in names if name in SERVER_MAPPING]
+
+
+
+BULK_CHUNK_SIZE = 5000
+
+_write_lock = threading.Lock()
+
+
+def _executemany_chunked(cursor, sql, rows, chunk_size=BULK_CHUNK_SIZE):
+    for start in range(0, len(rows), chunk_size):
+        cursor.executemany(sql, rows[start:start + chunk_size])
+
+
+def bonus_digest(bonuses) -> str:
+    """Short hash of a listing's integer (attr_id, value) pairs, independent of their order."""
+    if not bonuses:
+        return ""
+    return hashlib.blake2b(repr(sorted(bonuses)).encode(), digest_size=8).hexdigest()
+
+
+def listing_signature(item_id, seller, total_yang, quantity, digest) -> tuple:
+    """Stable identity of a live listing across scrapes (``digest``: see bonus_digest)."""
+    return (item_id, seller, int(total_yang), int(quantity), digest)
+
+
+def write_listings(grouped_listings, server_name, dump_sha256=None):
+    """Sync the live listings of a server with the scraped set and archive snapshots.
+
+    Listings are diffed by their signature (item, seller, total price, quantity,
+    bonuses): only new listings are inserted and only vanished ones are deleted,
+    so unchanged rows and their bonuses are never rewritten.
+
+    All writes are batched with executemany inside one transaction; listing ids
+    are pre-allocated under the write lock so bonuses can be linked without a
+    per-row ``lastrowid`` round trip.
+
+    ``dump_sha256`` (the hash of the ingested store dump) is recorded in the same
+    transaction, so an identical dump is skipped next time. Any error rolls the
+    whole transaction back.
+    """
+    # One writer per process at a time (they run in threads, see save_to_db_global);
+    # the write lock would serialize them anyway, but only up to the busy timeout
+    with _write_lock:
+        conn = get_connection(DB_PATH)
+        try:
+            count, inserted, removed = _write_listings(conn.cursor(), grouped_listings, server_name, dump_sha256)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    print(f"Saved {count} listings (+ snapshots) globally for {server_name} "
+          f"({inserted} new, {removed} removed, {count - inserted} unchanged).")
+
+
+async def save_to_db_global(grouped_listings, server_name, dump_sha256=None):
+    """``write_listings`` in a worker thread, so other servers' downloads and
+    normalization keep running on the event loop while one server ingests.
+
+    Cancelling (e.g. the scrape timeout) does not interrupt a transaction that
+    already started; it still commits or rolls back as a whole.
+    """
+    await asyncio.to_thread(write_listings, grouped_listings, server_name, dump_sha256)
+
+
+def _write_listings(cursor, grouped_listings, server_name, dump_sha256):
+    cursor.execute("BEGIN IMMEDIATE")
 
     cursor.execute("INSERT OR IGNORE INTO servers (name) VALUES (?)", (server_name,))
     cursor.execute("SELECT id FROM servers WHERE name=?", (server_name,))
     server_id = cursor.fetchone()[0]
 
-    # Clear current live listings for this server entirely
-    cursor.execute("DELETE FROM listings WHERE server_id = ?", (server_id,))
-    cursor.execute("DELETE FROM listing_bonuses WHERE listing_id NOT IN (SELECT id FROM listings)")
-
     now = datetime.now().isoformat()
     count = 0
 
-    unique_item_names = list(grouped_listings.keys())
-    cursor.executemany("INSERT OR IGNORE INTO items (name, category) VALUES (?, ?)", 
-                       [(name, "General") for name in unique_item_names])
-
-    cursor.execute("SELECT name, id FROM items")
-    item_id_map = {row[0]: row[1] for row in cursor.fetchall()}
-
-    unique_items_list = []
+    item_vnums = {name: listings[0].vnum for name, listings in grouped_listings.items() if listings}
+    named_vnums = [(vnum, name) for name, vnum in item_vnums.items() if vnum]
+    # A vnum whose name changed moves to the item row of its new name
+    cursor.executemany("UPDATE items SET vnum = NULL WHERE vnum = ? AND name != ?", named_vnums)
+    cursor.executemany("INSERT OR IGNORE INTO items (name, category, vnum) VALUES (?, ?, ?)",
+                       [(name, "General", vnum or None) for name, vnum in item_vnums.items()])
+    cursor.executemany("UPDATE items SET vnum = ? WHERE name = ? AND vnum IS NULL", named_vnums)
+
+    item_search.sync_search_index(cursor)
+
+    # Item ids through the integer vnum index; by name only for vnum-less listings
+    # and for the extra vnums of names shared by several vnums
+    by_vnum = dict(cursor.execute("SELECT vnum, id FROM items WHERE vnum IS NOT NULL").fetchall())
+    item_id_map = {}
+    for name, vnum in item_vnums.items():
+        item_id = by_vnum.get(vnum) if vnum else None
+        if item_id is None:
+            row = cursor.execute("SELECT id FROM items WHERE name = ?", (name,)).fetchone()
+            item_id = row[0] if row else None
+        if item_id is not None:
+            item_id_map[name] = item_id
+
+    # (listing, signature) per distinct listing of a known item
+    unique_items = []
+    seen = set()
     for item_name, listings in grouped_listings.items():
-        unique = []
-        seen = set()
+        item_id = item_id_map.get(item_name)
+        if not item_id:
+            continue
         for item in listings:
-            sig = (item["item_name"], item["seller"], item["total_yang"], item["quantity"])
+            sig = listing_signature(item_id, item.seller, item.total_yang, item.quantity, bonus_digest(item.bonuses))
             if sig not in seen:
                 seen.add(sig)
-                unique.append(item)
-        unique_items_list.extend(unique)
+                unique_items.append((item, sig))
+
+    # Current live listings of this server, keyed by signature
+    existing = {}
+    stale_ids = []
+    cursor.execute(
+        "SELECT id, item_id, seller_name, total_price_yang, quantity, bonus_digest, outlier_reason "
+        "FROM listings WHERE server_id = ?",
+        (server_id,)
+    )
+    for listing_id, item_id, seller, total_yang, quantity, digest, reason in cursor.fetchall():
+        sig = listing_signature(item_id, seller, total_yang or 0, quantity or 0, digest)
+        if sig in existing:
+            stale_ids.append(listing_id)  # duplicate left over from older imports
+        else:
+            existing[sig] = (listing_id, reason)
+
+    # Outlier verdicts for the whole listing set (fake_sellers overrides them);
+    # only listings that were not live yet count towards the seller history
+    fake_sellers = {row[0] for row in cursor.execute("SELECT seller_name FROM fake_sellers").fetchall()}
+    verdicts = outliers.classify(cursor, server_name, [
+        (sig[0], item.seller, item.unit_price) for item, sig in unique_items
+    ], fake_sellers, now, new=[sig not in existing for _, sig in unique_items])
+
+    # Pre-allocate ids above both MAX(id) and the AUTOINCREMENT sequence
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM listings")
+    next_id = cursor.fetchone()[0]
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'listings'")
+    row = cursor.fetchone()
+    next_id = max(next_id, row[0] if row else 0) + 1
+
+    listing_rows = []
+    bonus_rows = []
+    snapshot_rows = []
+    stat_rows = []
+    verdict_updates = []
+    for (item, sig), verdict in zip(unique_items, verdicts):
+        item_id = sig[0]
+        current = existing.pop(sig, None)
+        if current is not None:
+            if current[1] != verdict:
+                verdict_updates.append((verdict, current[0]))
+        else:
+            listing_id = next_id
+            next_id += 1
+            listing_rows.append((listing_id, server_id, item_id, item.vnum or None, item.seller, item.quantity,
+                                 item.price_won, item.price_yang, item.total_yang, sig[4], verdict))
+            bonus_rows.extend((listing_id, attr_id, value) for attr_id, value in item.bonuses)
 
-    # Fast bulk insert
-    for item in unique_items_list:
-        item_id = item_id_map.get(item['item_name'])
-        if not item_id:
-            continue
-            
-        cursor.execute("""
-            INSERT INTO listings (server_id, item_id, seller_name, quantity, price_won, price_yang, total_price_yang)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (server_id, item_id, item['seller'], item['quantity'], item['price_won'], item['price_yang'], item['total_yang']))
-        
-        listing_id = cursor.lastrowid
-        
-        for bonus in item['bonuses']:
-            if bonus:
-                if isinstance(bonus, dict):
-                    cursor.execute("INSERT INTO listing_bonuses (listing_id, bonus_name, bonus_value) VALUES (?, ?, ?)",
-                                   (listing_id, bonus.get('name', ''), bonus.get('value', '')))
-                else:
-                    cursor.execute("INSERT INTO listing_bonuses (listing_id, bonus_name, bonus_value) VALUES (?, ?, ?)",
-                                   (listing_id, str(bonus), ""))
-                                   
         # Snapshot
-        unit_price = int(item['total_yang'] / max(item['quantity'], 1))
-        cursor.execute("""
-            INSERT INTO listing_snapshots (item_name, seller_name, server_name, quantity, price_won, price_yang, total_price_yang, unit_price, scraped_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (item['item_name'], item['seller'], server_name, item['quantity'], item['price_won'], item['price_yang'], int(item['total_yang']), unit_price, now))
-        
+        unit_price = item.unit_price
+        snapshot_rows.append((item.item_name, item.seller, server_name, item.quantity, item.price_won,
+                              item.price_yang, int(item.total_yang), unit_price, now, verdict))
+        stat_rows.append((item_id, item.seller, item.quantity, unit_price, verdict is not None))
         count += 1
-            
-    conn.commit()
-    conn.close()
-    print(f"Saved {count} listings (+ snapshots) globally for {server_name}.")
+
+    # Whatever is left in `existing` vanished from the market
+    vanished = [(listing_id,) for listing_id, _ in existing.values()] + [(listing_id,) for listing_id in stale_ids]
+    _executemany_chunked(cursor, "DELETE FROM listing_bonuses WHERE listing_id = ?", vanished)
+    _executemany_chunked(cursor, "DELETE FROM listings WHERE id = ?", vanished)
+
+    _executemany_chunked(cursor, """
+        INSERT INTO listings (id, server_id, item_id, vnum, seller_name, quantity, price_won, price_yang, total_price_yang, bonus_digest, outlier_reason)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, listing_rows)
+    _executemany_chunked(cursor, "UPDATE listings SET outlier_reason = ? WHERE id = ?", verdict_updates)
+    _executemany_chunked(cursor, "INSERT INTO listing_bonuses (listing_id, attr_id, attr_value) VALUES (?, ?, ?)",
+                         bonus_rows)
+    _executemany_chunked(cursor, """
+        INSERT INTO listing_snapshots (item_name, seller_name, server_name, quantity, price_won, price_yang, total_price_yang, unit_price, scraped_at, outlier_reason)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, snapshot_rows)
+    inserted = len(listing_rows)
+
+    # Materialize this scrape's per-item price aggregates and rankings without outliers
+    price_aggregates.write_aggregates(
+        cursor, ((row[0], row[1], row[2], row[7], row[8]) for row in snapshot_rows if row[9] is None)
+    )
+    top_items.write_server_stats(cursor, server_id, stat_rows, now)
+    if dump_sha256:
+        cursor.execute("""
+            INSERT INTO ingested_dumps (server_name, sha256, ingested_at) VALUES (?, ?, ?)
+            ON CONFLICT(server_name) DO UPDATE SET sha256 = excluded.sha256, ingested_at = excluded.ingested_at
+        """, (server_name, dump_sha256, now))
+    bump_scrape_generation(cursor)
+
+    # Publish the listing set for vectorized readers (API, alert checks) while the
+    # write lock is still held, so no reader caches the new generation with the old file
+    item_names = {item_id_map[name]: name for name in grouped_listings if name in item_id_map}
+    try:
+        market_snapshot.write_snapshot(server_name, stat_rows, item_names, now)
+    except OSError as e:
+        print(f"Could not publish market snapshot for {server_name}: {e}")
+
+    return count, inserted, len(vanished)
+
+
 
 
 
@@ -500,11 +618,24 @@ async def run_bot(interval_minutes=10):
     server_name = os.environ.get("SERVER_NAME", "Chimera")
     max_pages = int(os.environ.get("MAX_PAGES", "50"))
     
-    while True:
-        print(f"\n[{datetime.now().strftime('%H:%M:%S')}] Global bot execution started for {server_name}...")
-        await scrape_store(server_name, max_pages=max_pages)
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Sleeping for {interval_minutes} minutes...")
-        await asyncio.sleep(interval_minutes * 60)
+    try:
+        while True:
+            print(f"\n[{datetime.now().strftime('%H:%M:%S')}] Global bot execution started for {server_name}...")
+            await scrape_store(server_name, max_pages=max_pages)
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Sleeping for {interval_minutes} minutes...")
+            await asyncio.sleep(interval_minutes * 60)
+    finally:
+        await http_clients.aclose_all()
+        normalize.shutdown()
+
+
+async def scrape_once(server_name=None, max_pages=50) -> bool:
+    """Single CLI scrape that releases the pooled connections and workers afterwards."""
+    try:
+        return await scrape_store(server_name, max_pages=max_pages)
+    finally:
+        await http_clients.aclose_all()
+        normalize.shutdown()
 
 
 
@@ -545,5 +676,6 @@ if __name__ == "__main__":
         except KeyboardInterrupt:
             print("Bot stopped by user.")
     else:
-        asyncio.run(scrape_store(server_name=os.environ.get("SERVER_NAME"), max_pages=max_pages))
+        ok = asyncio.run(scrape_once(server_name=os.environ.get("SERVER_NAME"), max_pages=max_pages))
+        sys.exit(0 if ok else 1)
 
@@ -1,11 +1,13 @@
 """
 Telegram Bot integration – sends price alert messages via the Telegram Bot API.
-Uses only httpx (no heavy SDK needed).
+Uses only httpx (no heavy SDK needed) through the shared pooled clients,
+so alert bursts reuse one warm connection to api.telegram.org.
 """
 
-import httpx
 from datetime import datetime
 
+from . import http_clients
+
 
 async def send_telegram_message(bot_token: str, chat_id: str, text: str) -> dict:
     """Send a message via Telegram Bot API (async)."""
@@ -15,10 +17,10 @@ async def send_telegram_message(bot_token: str, chat_id: str, text: str) -> dict
         "text": text,
         "parse_mode": "HTML",
     }
-    async with httpx.AsyncClient(timeout=15) as client:
-        resp = await client.post(url, json=payload)
-        resp.raise_for_status()
-        return resp.json()
+    client = http_clients.get_async_client("telegram")
+    resp = await client.post(url, json=payload)
+    resp.raise_for_status()
+    return resp.json()
 
 
 def send_telegram_message_sync(bot_token: str, chat_id: str, text: str) -> dict:
@@ -29,10 +31,10 @@ def send_telegram_message_sync(bot_token: str, chat_id: str, text: str) -> dict:
         "text": text,
         "parse_mode": "HTML",
     }
-    with httpx.Client(timeout=15) as client:
-        resp = client.post(url, json=payload)
-        resp.raise_for_status()
-        return resp.json()
+    client = http_clients.get_sync_client("telegram")
+    resp = client.post(url, json=payload)
+    resp.raise_for_status()
+    return resp.json()
 
 
 def format_alert_message(item_name: str, price: int, price_type: str, direction: str) -> str:
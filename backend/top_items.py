@@ -0,0 +1,120 @@
+"""
+Per-server item rankings – one row per (server, item) currently on the market.
+
+The scraper rewrites a server's rows from the listing set it just ingested, so
+the dashboard's top-items ranking reads a small precomputed table instead of
+grouping the whole listings table on every request. Besides the listing count
+each row keeps the cheapest unit price (listings with an outlier verdict, fake
+sellers included, left out) and the cheapest unit price of the previous scrape,
+which gives the price-drop ranking.
+"""
+
+INSERT_SQL = """
+    INSERT INTO server_item_stats
+        (server_id, item_id, listing_count, total_quantity, min_unit_price, prev_min_unit_price, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Ranking -> (ORDER BY clause, extra WHERE condition)
+RANKINGS = {
+    "volume": ("listing_count DESC, total_quantity DESC", "1"),
+    "cheapest": ("min_unit_price ASC", "min_unit_price IS NOT NULL"),
+    "price_drop": (
+        "CAST(prev_min_unit_price - min_unit_price AS REAL) / prev_min_unit_price DESC",
+        "prev_min_unit_price > min_unit_price",
+    ),
+}
+
+
+def write_server_stats(cursor, server_id, listings, updated_at):
+    """Replace the ranking rows of one server.
+
+    ``listings`` are the server's current (item_id, seller_name, quantity, unit_price, is_outlier) tuples.
+    """
+    groups = {}
+    for item_id, _, quantity, unit_price, is_outlier in listings:
+        entry = groups.setdefault(item_id, [0, 0, None])
+        entry[0] += 1
+        entry[1] += quantity or 0
+        if unit_price and not is_outlier and (entry[2] is None or unit_price < entry[2]):
+            entry[2] = unit_price
+
+    previous = dict(cursor.execute(
+        "SELECT item_id, min_unit_price FROM server_item_stats WHERE server_id = ?", (server_id,)
+    ).fetchall())
+    cursor.execute("DELETE FROM server_item_stats WHERE server_id = ?", (server_id,))
+    rows = [
+        (server_id, item_id, count, quantity, min_price, previous.get(item_id), updated_at)
+        for item_id, (count, quantity, min_price) in groups.items()
+    ]
+    cursor.executemany(INSERT_SQL, rows)
+    return len(rows)
+
+
+def rebuild_server_stats(cursor, updated_at):
+    """Rebuild every server's rows from the live listings table."""
+    server_ids = [row[0] for row in cursor.execute("SELECT DISTINCT server_id FROM listings").fetchall()]
+    total = 0
+    for server_id in server_ids:
+        listings = cursor.execute("""
+            SELECT item_id, seller_name, quantity, total_price_yang / MAX(quantity, 1), outlier_reason IS NOT NULL
+            FROM listings WHERE server_id = ?
+        """, (server_id,)).fetchall()
+        total += write_server_stats(cursor, server_id, listings, updated_at)
+    return total
+
+
+def top_items(cursor, ranking="volume", server_name=None, limit=10):
+    """Top ``limit`` items of a server (or summed over all servers) for a ranking.
+
+    Without a server the price-drop ranking compares each server's minimums
+    with each other and ranks an item by its largest drop on any server.
+    """
+    order_by, condition = RANKINGS[ranking]
+    if server_name:
+        source = """
+            SELECT item_id, listing_count, total_quantity, min_unit_price, prev_min_unit_price
+            FROM server_item_stats
+            WHERE server_id = (SELECT id FROM servers WHERE name = ?)
+        """
+        params = (server_name,)
+    elif ranking == "price_drop":
+        # A drop only means something within one server's market, so each item
+        # is ranked by its largest per-server drop (that server's row is shown)
+        source = f"""
+            SELECT item_id, listing_count, total_quantity, min_unit_price, prev_min_unit_price
+            FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY item_id ORDER BY {order_by}, server_id) AS rank
+                FROM server_item_stats WHERE {condition}
+            ) WHERE rank = 1
+        """
+        params = ()
+    else:
+        source = """
+            SELECT item_id, SUM(listing_count) AS listing_count, SUM(total_quantity) AS total_quantity,
+                   MIN(min_unit_price) AS min_unit_price, MIN(prev_min_unit_price) AS prev_min_unit_price
+            FROM server_item_stats GROUP BY item_id
+        """
+        params = ()
+
+    rows = cursor.execute(f"""
+        SELECT items.name, items.vnum, s.listing_count, s.total_quantity, s.min_unit_price, s.prev_min_unit_price
+        FROM ({source}) AS s JOIN items ON items.id = s.item_id
+        WHERE {condition}
+        ORDER BY {order_by}, items.name
+        LIMIT ?
+    """, params + (limit,)).fetchall()
+
+    result = []
+    for name, vnum, count, quantity, min_price, prev_min in rows:
+        drop = round((prev_min - min_price) / prev_min * 100, 2) if prev_min and min_price else None
+        result.append({
+            "name": name,
+            "vnum": vnum,
+            "count": count,
+            "total_quantity": quantity,
+            "min_unit_price": min_price,
+            "prev_min_unit_price": prev_min,
+            "price_drop_pct": drop,
+        })
+    return result
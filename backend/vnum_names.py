@@ -0,0 +1,146 @@
+"""
+Persistent vnum -> item name tables, one per language.
+
+The CDN's ``item_names.json`` is stored in the ``item_names`` table and
+revalidated at most every ITEM_NAMES_REFRESH_SECONDS, using a conditional
+request through fetch_cache. A new copy is only parsed and written when its
+hash differs from the version recorded in ``item_name_versions``, so a fresh
+scraper process normally reads a few thousand rows from SQLite instead of
+downloading and decoding the whole file.
+
+In memory a table is a ``NameTable``: a list indexed by the integer vnum
+(a dict for very sparse vnum ranges). The dump parser looks names up without
+building a string key per listing.
+
+Dumps are ingested once, with the INGEST_LANG names (``items.name``, snapshots,
+aggregates); items and listings also carry the vnum. The other ITEM_NAME_LANGS
+tables are kept fresh the same way and the API resolves names through them at
+read time (``?lang=tr``), so serving another language costs no extra scrape.
+"""
+
+import hashlib
+import os
+from typing import NamedTuple
+
+# Language of the names stored in items, snapshots and aggregates
+INGEST_LANG = "de"
+# Languages whose name tables are kept for read-time localization
+ITEM_NAME_LANGS = tuple(
+    lang.strip() for lang in os.environ.get("ITEM_NAME_LANGS", "de,en,tr").split(",") if lang.strip()
+)
+ITEM_NAMES_REFRESH_SECONDS = int(os.environ.get("ITEM_NAMES_REFRESH_SECONDS", "3600"))
+
+# Largest vnum for the list-backed lookup; sparser tables fall back to a dict
+MAX_DENSE_VNUM = 1 << 22
+
+
+class NameVersion(NamedTuple):
+    sha256: str
+    checked_at: float  # unix time of the last revalidation
+
+
+class NameTable:
+    """vnum -> name lookup; ``get`` mirrors ``dict.get``.
+
+    ``version`` identifies the content: the stored sha256 of the CDN copy, or
+    a hash of the pairs when none is given.
+    """
+
+    def __init__(self, pairs, version=None):
+        pairs = [(int(vnum), name) for vnum, name in pairs]
+        self._count = len(pairs)
+        if version is None:
+            digest = hashlib.sha256()
+            for vnum, name in sorted(pairs):
+                digest.update(f"{vnum}\t{name}\n".encode())
+            version = digest.hexdigest()
+        self.version = version
+        top = max((vnum for vnum, _ in pairs), default=-1)
+        if 0 <= top <= MAX_DENSE_VNUM and all(vnum >= 0 for vnum, _ in pairs):
+            names = [None] * (top + 1)
+            for vnum, name in pairs:
+                names[vnum] = name
+            self._names = names
+            self._sparse = None
+        else:
+            self._names = []
+            self._sparse = dict(pairs)
+
+    def get(self, vnum, default=None):
+        if self._sparse is not None:
+            return self._sparse.get(vnum, default)
+        if 0 <= vnum < len(self._names):
+            name = self._names[vnum]
+            if name is not None:
+                return name
+        return default
+
+    def __len__(self):
+        return self._count
+
+    def items(self):
+        if self._sparse is not None:
+            return self._sparse.items()
+        return ((vnum, name) for vnum, name in enumerate(self._names) if name is not None)
+
+
+def stored_version(cursor, lang):
+    row = cursor.execute("SELECT sha256, checked_at FROM item_name_versions WHERE lang = ?", (lang,)).fetchone()
+    return NameVersion(*row) if row else None
+
+
+def needs_refresh(version, now):
+    return version is None or now - version.checked_at >= ITEM_NAMES_REFRESH_SECONDS
+
+
+def store_table(cursor, lang, names, sha256, now):
+    """Replace a language's table with ``names`` ({vnum string: name}, as served)."""
+    cursor.execute("DELETE FROM item_names WHERE lang = ?", (lang,))
+    cursor.executemany(
+        "INSERT INTO item_names (lang, vnum, name) VALUES (?, ?, ?)",
+        ((lang, int(vnum), name) for vnum, name in names.items() if str(vnum).lstrip("-").isdigit()),
+    )
+    _set_version(cursor, lang, sha256, now)
+
+
+def mark_checked(cursor, lang, sha256, now):
+    """The remote copy was revalidated and still has hash ``sha256``."""
+    _set_version(cursor, lang, sha256, now)
+
+
+def _set_version(cursor, lang, sha256, now):
+    cursor.execute("""
+        INSERT INTO item_name_versions (lang, sha256, checked_at) VALUES (?, ?, ?)
+        ON CONFLICT(lang) DO UPDATE SET sha256 = excluded.sha256, checked_at = excluded.checked_at
+    """, (lang, sha256, now))
+
+
+def load_table(cursor, lang):
+    version = stored_version(cursor, lang)
+    return NameTable(
+        cursor.execute("SELECT vnum, name FROM item_names WHERE lang = ?", (lang,)).fetchall(),
+        version.sha256 if version else None,
+    )
+
+
+def localized_names(cursor, lang, vnums) -> dict[int, str]:
+    """{vnum: name in ``lang``} for the given vnums (unknown vnums are left out)."""
+    vnums = sorted({vnum for vnum in vnums if vnum})
+    names = {}
+    for start in range(0, len(vnums), 500):
+        batch = vnums[start:start + 500]
+        names.update(cursor.execute(
+            f"SELECT vnum, name FROM item_names WHERE lang = ? AND vnum IN ({','.join('?' * len(batch))})",
+            (lang, *batch),
+        ).fetchall())
+    return names
+
+
+def ingest_name(cursor, lang, name) -> str | None:
+    """The stored (INGEST_LANG) name of the item called ``name`` in ``lang``."""
+    row = cursor.execute("""
+        SELECT items.name FROM item_names JOIN items ON items.vnum = item_names.vnum
+        WHERE item_names.lang = ? AND item_names.name = ?
+        LIMIT 1
+    """, (lang, name)).fetchone()
+    return row[0] if row else None
@@ -0,0 +1,67 @@
+"""
+Benchmark: warm-cache load of a store dump – raw JSON body vs the binary dump cache.
+
+For the JSON file, loading means what scrape_store did on a warm cache before:
+stream-parse the body and normalize every element (plus a plain json.load
+for reference). The binary file (dump_cache.py) is memory-mapped and turned
+straight into Listing tuples. Disk footprint is reported for both, with
+gzip-compressed JSON for comparison.
+
+Usage: python bench_dump_cache.py [item_count]
+"""
+import asyncio
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+
+from backend import dump_cache, normalize
+from backend.vnum_names import NameTable
+from backend.scraper import iter_dump_items
+from bench_normalize import synthetic_dump
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    item_names = NameTable((vnum, f"Item {vnum}") for vnum in range(5000))
+    data = json.dumps(synthetic_dump(count), separators=(",", ":"), ensure_ascii=False).encode()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dump_cache.CACHE_DIR = tmp
+        json_path = os.path.join(tmp, "cache_1.json")
+        with open(json_path, "wb") as f:
+            f.write(data)
+
+        streamed, stream_time = timed(
+            lambda: asyncio.run(normalize.normalize_stream(iter_dump_items(json_path), item_names))
+        )
+
+        def json_load():
+            with open(json_path, "rb") as f:
+                return normalize.normalize_chunk(json.load(f), item_names)
+        _, json_time = timed(json_load)
+
+        _, write_time = timed(lambda: dump_cache.write_dump("1", "bench", streamed))
+        loaded, binary_time = timed(lambda: dump_cache.load_dump("1", "bench"))
+        assert loaded == streamed
+
+        json_size = len(data)
+        gzip_size = len(gzip.compress(data, 6))
+        binary_size = os.path.getsize(dump_cache.dump_path("1"))
+
+    print(f"Synthetic dump: {count:,} raw items, {len(streamed):,} listings\n")
+    print(f"{'':28} {'load':>9} {'size':>10}")
+    print(f"{'JSON, streamed + normalize':28} {stream_time:8.2f}s {json_size / 1e6:8.1f} MB")
+    print(f"{'JSON, json.load + normalize':28} {json_time:8.2f}s")
+    print(f"{'JSON, gzip -6':28} {'':9} {gzip_size / 1e6:8.1f} MB")
+    print(f"{'binary dump cache':28} {binary_time:8.2f}s {binary_size / 1e6:8.1f} MB   (write {write_time:.2f}s)")
+    print(f"\nbinary vs streamed JSON: {stream_time / binary_time:.1f}x faster, "
+          f"{json_size / binary_size:.1f}x smaller")
@@ -0,0 +1,169 @@
+"""
+Benchmark: listing ingestion throughput of save_to_db_global on a synthetic dump.
+
+Compares the batched executemany writer against the previous writer, which
+diffed the same way but issued one execute per row (reproduced below). Both
+run on the tuned get_connection setup (WAL, pragmas) of a fresh database:
+
+    cold     every listing is new (first scrape of a server)
+    steady   the database already holds the dump and CHANGED_SHARE of the
+             listings changed (the usual scrape every few minutes)
+
+The old writer only wrote listings, bonuses and snapshots, so the speed-up is
+measured against the write phase alone (outlier detection, aggregates,
+rankings, search index and the market snapshot switched off). The full ingest
+is timed separately for reference.
+
+Usage: python bench_ingest.py [listing_count]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+from backend import scraper, market_snapshot, outliers, price_aggregates, top_items, item_search
+from backend.database import get_connection
+from backend.normalize import Listing
+
+CHANGED_SHARE = 0.05
+
+
+def synthetic_listings(count, item_count=2000, seller_count=20000, seed=42):
+    rnd = random.Random(seed)
+    grouped = defaultdict(list)
+    for _ in range(count):
+        name = f"Item {rnd.randrange(item_count)}"
+        quantity = rnd.randint(1, 200)
+        yang = rnd.randint(1_000, 99_999_999)
+        won = rnd.randint(0, 5)
+        grouped[name].append(Listing(
+            name, f"Seller{rnd.randrange(seller_count)}", quantity, won, yang, won * 100_000_000 + yang,
+            tuple((rnd.randrange(1, 150), rnd.randrange(50)) for _ in range(rnd.randint(0, 5))),
+        ))
+    return grouped
+
+
+def changed_listings(grouped, share=CHANGED_SHARE):
+    """The same dump with ``share`` of the listings repriced (sold and relisted)."""
+    rnd = random.Random(7)
+    return {
+        name: [item._replace(price_yang=item.price_yang + 1, total_yang=item.total_yang + 1)
+               if rnd.random() < share else item for item in listings]
+        for name, listings in grouped.items()
+    }
+
+
+def legacy_insert(grouped, server_name):
+    """The previous row-by-row writer (incremental diff, one execute per row)."""
+    conn = get_connection(scraper.DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("INSERT OR IGNORE INTO servers (name) VALUES (?)", (server_name,))
+    server_id = cursor.execute("SELECT id FROM servers WHERE name=?", (server_name,)).fetchone()[0]
+    cursor.executemany("INSERT OR IGNORE INTO items (name, category) VALUES (?, ?)",
+                       [(name, "General") for name in grouped])
+    item_id_map = dict(cursor.execute("SELECT name, id FROM items").fetchall())
+    now = datetime.now().isoformat()
+
+    existing = {}
+    for listing_id, item_id, seller, total_yang, quantity, digest in cursor.execute(
+        "SELECT id, item_id, seller_name, total_price_yang, quantity, bonus_digest FROM listings WHERE server_id = ?",
+        (server_id,),
+    ).fetchall():
+        existing[scraper.listing_signature(item_id, seller, total_yang, quantity, digest)] = listing_id
+
+    seen = set()
+    for name, listings in grouped.items():
+        item_id = item_id_map[name]
+        for item in listings:
+            digest = scraper.bonus_digest(item.bonuses)
+            sig = scraper.listing_signature(item_id, item.seller, item.total_yang, item.quantity, digest)
+            if sig in seen:
+                continue
+            seen.add(sig)
+            if existing.pop(sig, None) is None:
+                cursor.execute("""
+                    INSERT INTO listings (server_id, item_id, seller_name, quantity, price_won, price_yang, total_price_yang, bonus_digest)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (server_id, item_id, item.seller, item.quantity,
+                      item.price_won, item.price_yang, item.total_yang, digest))
+                listing_id = cursor.lastrowid
+                for attr_id, value in item.bonuses:
+                    cursor.execute("INSERT INTO listing_bonuses (listing_id, attr_id, attr_value) VALUES (?, ?, ?)",
+                                   (listing_id, attr_id, value))
+            cursor.execute("""
+                INSERT INTO listing_snapshots (item_name, seller_name, server_name, quantity, price_won, price_yang, total_price_yang, unit_price, scraped_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (item.item_name, item.seller, server_name, item.quantity, item.price_won,
+                  item.price_yang, item.total_yang, item.unit_price, now))
+
+    for listing_id in existing.values():
+        cursor.execute("DELETE FROM listing_bonuses WHERE listing_id = ?", (listing_id,))
+        cursor.execute("DELETE FROM listings WHERE id = ?", (listing_id,))
+    conn.commit()
+    conn.close()
+
+
+@contextmanager
+def write_phase_only():
+    """Skip everything save_to_db_global does beyond writing the rows themselves."""
+    patched = [
+        (outliers, "classify", lambda cursor, server_name, rows, *args, **kwargs: [None] * len(rows)),
+        (price_aggregates, "write_aggregates", lambda *args: None),
+        (top_items, "write_server_stats", lambda *args: None),
+        (item_search, "sync_search_index", lambda *args: None),
+        (market_snapshot, "write_snapshot", lambda *args: None),
+    ]
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patched]
+    for module, name, replacement in patched:
+        setattr(module, name, replacement)
+    try:
+        yield
+    finally:
+        for module, name, original in originals:
+            setattr(module, name, original)
+
+
+def batched_writes(grouped):
+    with write_phase_only():
+        scraper.write_listings(grouped, "Bench")
+
+
+def full_ingest(grouped):
+    asyncio.run(scraper.save_to_db_global(grouped, "Bench"))
+
+
+def run(label, func, grouped, count, before=None):
+    """Time ``func(grouped)`` on a fresh database, after ingesting ``before`` (untimed)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        scraper.DB_PATH = os.path.join(tmp, "bench.db")
+        market_snapshot.SNAPSHOT_DIR = os.path.join(tmp, "snapshots")
+        scraper.init_db()
+        if before is not None:
+            batched_writes(before)
+        start = time.perf_counter()
+        func(grouped)
+        elapsed = time.perf_counter() - start
+    print(f"  {label:<14} {elapsed:8.2f} s   {count / elapsed:12,.0f} listings/s")
+    return elapsed
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    grouped = synthetic_listings(count)
+    changed = changed_listings(grouped)
+    print(f"Synthetic dump: {count:,} listings, {len(grouped):,} items\n")
+
+    for case, dump, before in (("cold", grouped, None), ("steady", changed, grouped)):
+        print(f"{case}:")
+        legacy = run("row-by-row", lambda g: legacy_insert(g, "Bench"), dump, count, before)
+        batched = run("executemany", batched_writes, dump, count, before)
+        print(f"  speed-up of the write phase: {legacy / batched:.2f}x")
+        run("full ingest", full_ingest, dump, count, before)
+        print()
+    print("(full ingest = writes + outliers, aggregates, rankings, search index, market snapshot)")
@@ -0,0 +1,77 @@
+"""
+Benchmark: raw store-dump normalization throughput (listings/sec), inline and
+with NORMALIZE_WORKERS-style process pools, on a synthetic dump.
+
+The dump is fed as raw JSON bytes in 64 KiB chunks exactly as scrape_store
+receives it: workers=1 parses and normalizes inline (normalize_stream over the
+incremental parser), larger counts go through normalize_dump, so the pool
+numbers include cutting the bytes and transferring pieces and results.
+
+Usage: python bench_normalize.py [item_count] [max_workers]
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from backend import bonuses, normalize
+from backend.vnum_names import NameTable
+from backend.fetch_cache import CHUNK_SIZE
+from backend.scraper import JSONArrayStream
+
+
+def synthetic_dump(count, vnum_count=5000):
+    rnd = random.Random(42)
+    attr_ids = list(bonuses.STAT_MAP)
+    return [{
+        "vnum": rnd.randrange(vnum_count),
+        "name": "Unknown",
+        "seller": f"Seller{rnd.randrange(20000)}",
+        "quantity": rnd.randint(1, 200),
+        "yangPrice": rnd.randint(0, 99_999_999),
+        "wonPrice": rnd.randint(0, 5),
+        "attrs": [[rnd.choice(attr_ids), rnd.randint(1, 50)] for _ in range(rnd.randint(0, 7))],
+    } for _ in range(count)]
+
+
+async def byte_chunks(data):
+    for offset in range(0, len(data), CHUNK_SIZE):
+        yield data[offset:offset + CHUNK_SIZE]
+
+
+async def parsed_items(data):
+    parser = JSONArrayStream()
+    async for chunk in byte_chunks(data):
+        for item in parser.feed(chunk):
+            yield item
+    parser.close()
+
+
+def measure(data, item_names, workers):
+    start = time.perf_counter()
+    if workers == 1:
+        listings = asyncio.run(normalize.normalize_stream(parsed_items(data), item_names))
+    else:
+        listings = asyncio.run(normalize.normalize_dump(byte_chunks(data), item_names, workers))
+    elapsed = time.perf_counter() - start
+    return len(listings), elapsed
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    item_names = NameTable((vnum, f"Item {vnum}") for vnum in range(5000))
+    data = json.dumps(synthetic_dump(count), separators=(",", ":")).encode()
+    print(f"Synthetic dump: {count:,} raw items, {len(data) / 1024 / 1024:.1f} MB, {os.cpu_count()} CPU core(s)\n")
+
+    workers = 1
+    while workers <= max(1, max_workers):
+        if workers > 1:
+            normalize.get_pool(item_names, workers)  # start the workers outside the timing
+        listings, elapsed = measure(data, item_names, workers)
+        rate = listings / elapsed
+        print(f"workers={workers:<3} {elapsed:7.2f} s   {rate:12,.0f} listings/s   {rate / workers:12,.0f} per core")
+        workers *= 2
+    normalize.shutdown()
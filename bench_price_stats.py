@@ -0,0 +1,73 @@
+"""
+Benchmark: per-group price statistics with price_stats (NumPy) against the
+previous sorted-list code (reproduced below) that price_aggregates and the
+scheduler ran for each group.
+
+Usage: python bench_price_stats.py [row_count] [group_count]
+"""
+import math
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from backend import price_stats
+
+
+def legacy_summarize(prices):
+    """The previous per-group list implementation."""
+    prices = sorted(prices)
+    total = len(prices)
+    bottom_count = max(1, int(total * 0.2))
+
+    def percentile(pct):
+        return prices[max(0, math.ceil(pct / 100 * total) - 1)]
+
+    return {
+        "min": prices[0],
+        "max": prices[-1],
+        "avg": int(sum(prices) / total),
+        "avg_bottom20": int(sum(prices[:bottom_count]) / bottom_count),
+        "p10": percentile(10),
+        "median": percentile(50),
+        "p90": percentile(90),
+    }
+
+
+def legacy(groups, prices):
+    grouped = defaultdict(list)
+    for group, price in zip(groups, prices):
+        grouped[group].append(price)
+    return {group: legacy_summarize(values) for group, values in grouped.items()}
+
+
+def vectorized(groups, prices):
+    return price_stats.group_stats(prices, groups)
+
+
+def best_of(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    group_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    rng = np.random.default_rng(42)
+    groups = rng.integers(0, group_count, row_count)
+    prices = rng.integers(1_000, 10_000_000_000, row_count)
+    groups_list, prices_list = groups.tolist(), prices.tolist()
+    print(f"{row_count:,} prices in {group_count:,} groups\n")
+
+    old = best_of(legacy, groups_list, prices_list)
+    new = best_of(vectorized, groups, prices)
+    print(f"{'sorted lists':<14} {old * 1000:9.1f} ms")
+    print(f"{'price_stats':<14} {new * 1000:9.1f} ms   (+ trimmed mean)")
+    flags = best_of(price_stats.outlier_flags, prices, groups)
+    print(f"{'outlier_flags':<14} {flags * 1000:9.1f} ms")
+    print(f"\nSpeed-up: {old / new:.1f}x")
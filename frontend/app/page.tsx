@@ -6,12 +6,12 @@ import StatsCard from '@/components/StatsCard';
 import ListingTable from '@/components/ListingTable';
 import PriceChart from '@/components/PriceChart';
 import FavoritesList from '@/components/FavoritesList';
-import { getListings, getTopItems, getPriceHistory, triggerScrape, getServers, getWatchlist, addWatchlistItem, removeWatchlistItem, toggleWatchlistItem, getTelegramSettings, saveTelegramSettings, toggleTelegram, testTelegram, createAlert, deleteAlert, toggleAlert, getFakeSellers, addFakeSeller, removeFakeSeller, createPercentageAlert, deletePercentageAlert, togglePercentageAlert, Listing, PricePoint, WatchlistItem, TelegramSettings, PriceAlert, FakeSeller, PercentageAlert } from '@/lib/api';
+import { getListings, getTopItems, getPriceHistory, triggerScrape, getServers, getWatchlist, addWatchlistItem, removeWatchlistItem, toggleWatchlistItem, getTelegramSettings, saveTelegramSettings, toggleTelegram, testTelegram, createAlert, deleteAlert, toggleAlert, getFakeSellers, addFakeSeller, removeFakeSeller, createPercentageAlert, deletePercentageAlert, togglePercentageAlert, Listing, PricePoint, TopItem, WatchlistItem, TelegramSettings, PriceAlert, FakeSeller, PercentageAlert } from '@/lib/api';
 import { TrendingUp, ShoppingCart, Server, LineChart, Search, RefreshCw, ChevronDown, ChevronLeft, ChevronRight, Clock, Plus, Trash2, Power, List, Bell, BellOff, Send, Settings, AlertTriangle, UserX, Star, Play, Pause } from 'lucide-react';
 
 export default function Home() {
   const [listings, setListings] = useState<Listing[]>([]);
-  const [topItems, setTopItems] = useState<{ name: string, count: number }[]>([]);
+  const [topItems, setTopItems] = useState<TopItem[]>([]);
   const [servers, setServers] = useState<{ id: string, name: string, group: string, has_data: boolean }[]>([]);
   const [selectedServer, setSelectedServer] = useState<string>("Chimera");
   const [priceHistory, setPriceHistory] = useState<PricePoint[]>([]);
@@ -163,7 +163,7 @@ export default function Home() {
     try {
       const [listingsData, topItemsData, serversData, watchlistData, tgData, fakeSellersData] = await Promise.all([
         getListings(filter || undefined, currentServer),
-        getTopItems(),
+        getTopItems(currentServer),
         getServers(),
         getWatchlist(),
         getTelegramSettings(),
@@ -182,8 +182,11 @@ export default function Home() {
 
       if (topItemsData.length > 0 && !selectedItemForChart) {
         setSelectedItemForChart(topItemsData[0].name);
-        const history = await getPriceHistory(topItemsData[0].name);
+        const history = await getPriceHistory(topItemsData[0].name, currentServer);
         setPriceHistory(history);
+      } else if (selectedItemForChart) {
+        // The chart follows the selected server
+        setPriceHistory(await getPriceHistory(selectedItemForChart, currentServer));
       }
     } catch (error: any) {
       console.error("Failed to fetch data:", error);
@@ -224,7 +227,7 @@ export default function Home() {
   const handleTopItemClick = async (itemName: string) => {
     setSelectedItemForChart(itemName);
     try {
-      const history = await getPriceHistory(itemName);
+      const history = await getPriceHistory(itemName, selectedServer);
       setPriceHistory(history);
     } catch (e) {
       console.error("Failed to fetch history for", itemName, e);
@@ -417,7 +420,7 @@ export default function Home() {
     const query = watchlistQueries[newIndex];
     setSelectedItemForChart(query);
     try {
-      const history = await getPriceHistory(query);
+      const history = await getPriceHistory(query, selectedServer);
       if (history.length === 0 && autoMode) {
         // No data - skip to next item immediately
         handleChartNav(direction, skipCount + 1);
@@ -27,26 +27,35 @@ export interface Listing {
     name: string;
     category: string;
     image_url: string | null;
+    vnum?: number | null;
   };
   server: {
     name: string;
   };
+  vnum?: number | null;
   seller_name: string;
   quantity: number;
   price_won: number;
   price_yang: number;
   total_price_yang: number;
   seen_at: string;
+  outlier_reason?: 'price' | 'seller' | 'fake' | null;
   bonuses: {
+    attr_id: number;
+    attr_value: number;
     bonus_name: string;
     bonus_value: string;
   }[];
 }
 
-export const getListings = async (itemName?: string, server?: string) => {
+// Item name language; names are stored in German and localized by vnum on read
+export type ItemLang = 'de' | 'en' | 'tr';
+
+export const getListings = async (itemName?: string, server?: string, lang?: ItemLang) => {
   const params: any = {};
   if (itemName) params.item_name = itemName;
   if (server) params.server = server;
+  if (lang) params.lang = lang;
 
   const response = await api.get<Listing[]>('/market/listings', { params });
   return response.data;
@@ -57,8 +66,23 @@ export const getServers = async () => {
   return response.data;
 }
 
-export const getTopItems = async () => {
-  const response = await api.get<{ name: string, count: number }[]>('/market/stats/top-items');
+export type TopItemsRanking = 'volume' | 'cheapest' | 'price_drop';
+
+export interface TopItem {
+  name: string;
+  vnum: number | null;
+  count: number;
+  total_quantity: number;
+  min_unit_price: number | null;
+  prev_min_unit_price: number | null;
+  price_drop_pct: number | null;
+}
+
+export const getTopItems = async (server?: string, by: TopItemsRanking = 'volume', limit = 10, lang?: ItemLang) => {
+  const params: Record<string, string | number> = { by, limit };
+  if (server) params.server = server;
+  if (lang) params.lang = lang;
+  const response = await api.get<TopItem[]>('/market/stats/top-items', { params });
   return response.data;
 }
 
@@ -70,10 +94,20 @@ export interface PricePoint {
   total_listings: number;
 }
 
-export const getPriceHistory = async (itemName: string) => {
-  const response = await api.get<PricePoint[]>('/market/stats/price-history', {
-    params: { item_name: itemName }
-  });
+export type PriceHistoryBucket = 'scrape' | 'hour' | 'day';
+
+export const getPriceHistory = async (
+  itemName: string,
+  server?: string,
+  options: { bucket?: PriceHistoryBucket, from?: string, to?: string, lang?: ItemLang } = {}
+) => {
+  const params: any = { item_name: itemName };
+  if (server) params.server = server;
+  if (options.lang) params.lang = options.lang;
+  if (options.bucket) params.bucket = options.bucket;
+  if (options.from) params.from = options.from;
+  if (options.to) params.to = options.to;
+  const response = await api.get<PricePoint[]>('/market/stats/price-history', { params });
   return response.data;
 }
 
@@ -0,0 +1,47 @@
+"""
+Tests for the integer bonus layout and the conversion of old text bonuses.
+
+Run with: python -m pytest test_bonuses.py
+"""
+import sqlite3
+
+import pytest
+
+from backend import bonuses, database, market_snapshot, scraper
+
+
+def test_resolve_bonus():
+    assert bonuses.resolve_bonus(72, 15) == ("Durchschn. Schaden 15%", "15")
+    assert bonuses.resolve_bonus(9999, 3) == ("Attribut #9999 3", "3")
+    assert bonuses.parse_filter("72:15") == (72, 15) and bonuses.parse_filter("48") == (48, None)
+
+
+@pytest.mark.parametrize("process", ["scheduler", "api"])
+def test_text_bonuses_are_converted(tmp_path, monkeypatch, process):
+    monkeypatch.setattr(scraper, "DB_PATH", str(tmp_path / "old.db"))
+    monkeypatch.setattr(market_snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    conn = sqlite3.connect(scraper.DB_PATH)
+    conn.executescript("""
+        CREATE TABLE listing_bonuses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, listing_id INTEGER,
+            bonus_name TEXT NOT NULL, bonus_value TEXT
+        );
+        CREATE INDEX idx_listing_bonuses_listing ON listing_bonuses(listing_id);
+        INSERT INTO listing_bonuses (listing_id, bonus_name, bonus_value) VALUES
+            (1, 'Durchschn. Schaden 15%', '15'),
+            (1, 'Verteidigung +40', '40'),
+            (2, 'Attribut #9999 3', '3'),
+            (2, 'Kaputt', 'x');
+    """)
+    conn.commit()
+    if process == "scheduler":
+        scraper.init_db()
+    else:
+        database.migrate_schema(sqlite3.connect(scraper.DB_PATH))  # what main.lifespan runs
+    database.migrate_schema(sqlite3.connect(scraper.DB_PATH))  # the other process: nothing left to do
+
+    rows = conn.execute("SELECT listing_id, attr_id, attr_value FROM listing_bonuses ORDER BY id").fetchall()
+    assert rows == [(1, 72, 15), (1, 54, 40), (2, 9999, 3)]
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(listing_bonuses)").fetchall()}
+    assert {"idx_listing_bonuses_listing", "idx_listing_bonuses_attr"} <= indexes
+    assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'listing_bonuses_text'").fetchone()
@@ -0,0 +1,171 @@
+"""
+Tests for the conditional-request fetch cache (against a local stub HTTP
+server), the binary dump cache and the persisted item name tables.
+
+Run with: python -m pytest test_fetch_cache.py
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from backend import dump_cache, fetch_cache, market_snapshot, scraper, vnum_names
+from backend.normalize import Listing
+
+
+class StubStore:
+    """Serves /store/<id>.json and /names.json; ETags can be switched off."""
+
+    def __init__(self):
+        self.body = b"[]"
+        self.names = {"11": "Schwert+1"}
+        self.etags = True
+        self.statuses = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(stub.names).encode() if self.path == "/names.json" else stub.body
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if stub.etags and self.headers.get("If-None-Match") == etag:
+                    return self.send(304, b"")
+                self.send(200, body, {"ETag": etag} if stub.etags else {})
+
+            def send(self, status, body, headers=()):
+                stub.statuses.append(status)
+                self.send_response(status)
+                for name, value in dict(headers).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    store = StubStore()
+    monkeypatch.setattr(fetch_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(dump_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    yield store
+    store.server.shutdown()
+
+
+def fetch(url):
+    async def run():
+        async with httpx.AsyncClient() as client:
+            return await fetch_cache.fetch(client, url, "1")
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("etags", [True, False])
+def test_revalidation(stub, etags):
+    stub.etags = etags
+    url = stub.url + "/store/1.json"
+    first = fetch(url)
+    second = fetch(url)
+    assert stub.statuses == [200, 304 if etags else 200]
+    assert second.not_modified == etags and second.sha256 == first.sha256
+
+    stub.body = b'[{"vnum": 11}]'
+    third = fetch(url)
+    assert stub.statuses[-1] == 200 and third.sha256 != first.sha256
+    with open(third.path, "rb") as f:
+        assert f.read() == stub.body
+
+
+def test_concurrent_fetches_of_one_key(stub):
+    stub.body = b"[" + b",".join(b'{"vnum": %d}' % i for i in range(200_000)) + b"]"
+    url = stub.url + "/store/1.json"
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            return await asyncio.gather(*(fetch_cache.fetch(client, url, "1") for _ in range(4)))
+
+    results = asyncio.run(run())
+    assert {result.sha256 for result in results} == {hashlib.sha256(stub.body).hexdigest()}
+    with open(fetch_cache.body_path("1"), "rb") as f:
+        assert f.read() == stub.body
+    assert not [name for name in os.listdir(fetch_cache.CACHE_DIR) if name.endswith(".part")]
+
+
+@pytest.fixture
+def db(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(market_snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(scraper, "STORE_DATA_URL", stub.url + "/store/{server_id}.json")
+    monkeypatch.setattr(scraper, "ITEM_NAMES_URL", stub.url + "/names.json")
+    monkeypatch.setattr(scraper, "_item_names_cache", {})
+    scraper.init_db()
+    return sqlite3.connect(scraper.DB_PATH)
+
+
+def test_unchanged_dump_is_not_ingested(stub, db):
+    conn = db
+
+    def scrape():
+        async def run():
+            async with httpx.AsyncClient() as client:
+                return await scraper.scrape_store("Chimera", client=client)
+        assert asyncio.run(run())
+        return conn.execute("SELECT COUNT(*) FROM listing_snapshots").fetchone()[0]
+
+    stub.body = json.dumps([{"vnum": 11, "seller": "A", "quantity": 1, "yangPrice": 100}]).encode()
+    assert scrape() == 1
+    assert scrape() == 1  # 304: neither parsed nor ingested
+
+    # Only the parsed binary copy is kept; it is ingested again when the database lost the dump
+    assert not os.path.exists(fetch_cache.body_path("531"))
+    conn.execute("DELETE FROM ingested_dumps")
+    conn.commit()
+    assert scrape() == 2 and stub.statuses[-1] == 304
+    stub.etags = False
+    assert scrape() == 2  # full body, but the same hash
+    stub.body = json.dumps([{"vnum": 11, "seller": "B", "quantity": 1, "yangPrice": 90}]).encode()
+    assert scrape() == 3
+    assert conn.execute("SELECT seller_name, vnum FROM listings").fetchall() == [("B", 11)]
+    assert conn.execute("SELECT name, vnum FROM items").fetchall() == [("Schwert+1", 11)]
+
+
+def test_item_names_are_persisted_and_revalidated(stub, db, monkeypatch):
+    def names():
+        scraper._item_names_cache.clear()
+        async def run():
+            async with httpx.AsyncClient() as client:
+                return await scraper.fetch_item_names("de", client)
+        return dict(asyncio.run(run()).items())
+
+    assert names() == {11: "Schwert+1"} and stub.statuses == [200]
+    assert names() == {11: "Schwert+1"} and stub.statuses == [200]  # within the refresh interval
+    monkeypatch.setattr(vnum_names, "ITEM_NAMES_REFRESH_SECONDS", 0)
+    assert names() == {11: "Schwert+1"} and stub.statuses == [200, 304]
+    stub.names = {"11": "Schwert+1", "12": "Schwert+2"}
+    assert names() == {11: "Schwert+1", 12: "Schwert+2"} and stub.statuses == [200, 304, 200]
+
+    stub.server.shutdown()  # unreachable CDN: the stored table is still served
+    assert names() == {11: "Schwert+1", 12: "Schwert+2"}
+
+
+def test_dump_cache_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.setattr(dump_cache, "CACHE_DIR", str(tmp_path))
+    listings = [
+        Listing("Schwert+1", "Älice", 2, 1, 500, 100_000_500, ((72, 15), (1, 2000))),
+        Listing("Schild", "Bob", 1, 0, 90, 90, ()),
+        Listing("Schwert+1", "Bob", 1, 0, 80, 80, ((72, 5),)),
+    ]
+    dump_cache.write_dump("1", "abc", listings)
+    assert dump_cache.load_dump("1", "abc") == listings
+    assert dump_cache.load_dump("1", "other") is None and dump_cache.load_dump("2", "abc") is None
+
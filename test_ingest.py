@@ -0,0 +1,60 @@
+"""
+Tests for the incremental listing sync of save_to_db_global: unchanged listings
+keep their rows, changed ones (price or bonuses) are replaced.
+
+Run with: python -m pytest test_ingest.py
+"""
+import asyncio
+import sqlite3
+
+from backend import market_snapshot, scraper
+from backend.normalize import Listing
+
+
+def listing(seller, price, bonuses=()):
+    return Listing("Sword", seller, 1, 0, price, price, bonuses)
+
+
+def live_listings(conn):
+    rows = conn.execute("SELECT id, seller_name FROM listings").fetchall()
+    return {seller: listing_id for listing_id, seller in rows}
+
+
+def bonuses_of(conn, listing_id):
+    return conn.execute("SELECT attr_id, attr_value FROM listing_bonuses WHERE listing_id = ? ORDER BY attr_id",
+                        (listing_id,)).fetchall()
+
+
+def test_unchanged_listings_keep_their_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(market_snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    scraper.init_db()
+    conn = sqlite3.connect(scraper.DB_PATH)
+
+    asyncio.run(scraper.save_to_db_global({"Sword": [
+        listing("Same", 100, ((72, 15), (54, 40))),
+        listing("Reordered", 100, ((72, 15), (54, 40))),
+        listing("Rebonused", 100, ((72, 15),)),
+        listing("Repriced", 100),
+        listing("Gone", 100),
+    ]}, "Alpha"))
+    before = live_listings(conn)
+
+    asyncio.run(scraper.save_to_db_global({"Sword": [
+        listing("Same", 100, ((72, 15), (54, 40))),
+        listing("Reordered", 100, ((54, 40), (72, 15))),
+        listing("Rebonused", 100, ((72, 20),)),
+        listing("Repriced", 90),
+        # Two listings that only differ in their bonuses are both kept
+        listing("Twin", 100, ((72, 1),)),
+        listing("Twin", 100, ((72, 2),)),
+    ]}, "Alpha"))
+    after = live_listings(conn)
+
+    assert after["Same"] == before["Same"] and after["Reordered"] == before["Reordered"]
+    assert after["Rebonused"] != before["Rebonused"] and after["Repriced"] != before["Repriced"]
+    assert "Gone" not in after
+    assert bonuses_of(conn, after["Rebonused"]) == [(72, 20)]
+    assert bonuses_of(conn, before["Rebonused"]) == []
+    assert conn.execute("SELECT COUNT(*) FROM listings WHERE seller_name = 'Twin'").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM listing_bonuses").fetchone()[0] == 2 + 2 + 1 + 2
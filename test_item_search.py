@@ -0,0 +1,72 @@
+"""
+Tests for the item-name search index: folding, short queries, slang aliases
+and keeping the index in sync with renamed and deleted items, on the FTS5
+trigram table and on the plain fallback table.
+
+Run with: python -m pytest test_item_search.py
+"""
+import sqlite3
+
+import pytest
+
+from backend import item_search
+
+NAMES = {1: "Dolunay Kılıcı+9", 2: "Vollmondschwert+0", 3: "Fünfeckschild+3", 4: "Straße", 5: "Ox"}
+
+
+@pytest.fixture(params=["fts5", "plain"])
+def cursor(request):
+    conn = sqlite3.connect(":memory:")
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    cursor.executemany("INSERT INTO items (id, name) VALUES (?, ?)", NAMES.items())
+    if request.param == "plain":
+        # What ensure_search_index creates on SQLite builds without the trigram tokenizer
+        cursor.execute("CREATE TABLE item_search (rowid INTEGER PRIMARY KEY, name TEXT NOT NULL, source_name TEXT)")
+    item_search.ensure_search_index(cursor)
+    assert item_search.sync_search_index(cursor) == len(NAMES)
+    return cursor
+
+
+def test_fold():
+    assert item_search.fold("Dolunay KILICI") == item_search.fold("dolunay kılıcı") == "dolunay kilici"
+    assert item_search.fold("FÜNFECK") == "funfeck"
+    assert item_search.fold("Straße") == "strasse"
+
+
+def test_search(cursor):
+    assert item_search.search_item_ids(cursor, "dolunay kilici") == [1]
+    assert item_search.search_item_ids(cursor, "FÜNFECK") == [3]
+    assert item_search.search_item_ids(cursor, "fünfeck") == item_search.search_item_ids(cursor, "funfeck") == [3]
+    assert item_search.search_item_ids(cursor, "strasse") == [4]
+    assert item_search.search_item_ids(cursor, "vollmond") == [2]  # alias "Vollmondschwert"
+
+
+def test_queries_shorter_than_a_trigram(cursor):
+    assert item_search.search_item_ids(cursor, "ox") == [5]
+    assert item_search.search_item_ids(cursor, "+9") == [1]
+    assert item_search.search_item_ids(cursor, "ü") == item_search.search_item_ids(cursor, "u") == [1, 3]
+    assert item_search.search_item_ids(cursor, "") == []
+    assert item_search.search_item_ids(cursor, "%") == []
+
+
+def test_index_follows_renames_and_deletes(cursor):
+    cursor.execute("UPDATE items SET name = 'Kalkan+1' WHERE id = 1")
+    cursor.execute("DELETE FROM items WHERE id = 5")
+    assert item_search.sync_search_index(cursor) == 1
+    assert item_search.search_item_ids(cursor, "dolunay") == []
+    assert item_search.search_item_ids(cursor, "kalkan") == [1]
+    assert item_search.search_item_ids(cursor, "ox") == []
+    assert item_search.sync_search_index(cursor) == 0
+
+
+def test_older_index_layout_is_rebuilt():
+    cursor = sqlite3.connect(":memory:").cursor()
+    cursor.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    cursor.execute("INSERT INTO items (id, name) VALUES (1, 'Dolunay Kılıcı+9')")
+    cursor.execute("CREATE TABLE item_search (rowid INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    cursor.execute("INSERT INTO item_search (rowid, name) VALUES (1, 'dolunay kilici+9')")
+
+    item_search.ensure_search_index(cursor)
+    assert item_search.sync_search_index(cursor) == 1
+    assert item_search.search_item_ids(cursor, "kilici") == [1]
@@ -0,0 +1,159 @@
+"""
+Regression test: /market/listings must not lazy-load server, item and bonuses
+per row (N+1), renders/filters the integer bonuses, localizes item names and
+pages through ties with its keyset cursor. Runs against an in-memory database –
+no live API needed.
+
+Run with: python -m pytest test_listings_queries.py
+"""
+import base64
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import database, models, vnum_names
+from backend.routers import market
+
+
+def make_client(listing_count=100):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    database.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    db = Session()
+    servers = [models.Server(name=f"Server{i}") for i in range(3)]
+    items = [models.Item(name=f"Item{i}", category="General") for i in range(20)]
+    db.add_all(servers + items)
+    db.flush()
+    for i in range(listing_count):
+        listing = models.Listing(
+            server_id=servers[i % 3].id, item_id=items[i % 20].id, seller_name=f"Seller{i}",
+            quantity=1, price_won=0, price_yang=1000 + i, total_price_yang=1000 + i,
+        )
+        listing.bonuses = [models.ListingBonus(attr_id=71 + b, attr_value=i % 10 + b) for b in range(3)]
+        db.add(listing)
+    db.commit()
+    db.close()
+
+    def get_test_db():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app = FastAPI()
+    app.include_router(market.router)
+    app.dependency_overrides[database.get_db] = get_test_db
+    return engine, TestClient(app)
+
+
+def count_statements(engine, func):
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_execute)
+    try:
+        result = func()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_execute)
+    return result, statements
+
+
+def test_listings_page_uses_constant_number_of_queries():
+    engine, client = make_client(listing_count=100)
+    for sort_by in ("newest", "price_asc", "price_desc"):
+        response, statements = count_statements(
+            engine, lambda: client.get("/market/listings", params={"limit": 100, "sort_by": sort_by})
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) == 100
+        assert all(row["server"]["name"] and row["item"]["name"] and len(row["bonuses"]) == 3 for row in data)
+        # listings (+ joined server/item), bonuses (selectin), next-cursor key
+        assert len(statements) <= 3, statements
+
+
+
+def test_bonuses_are_rendered_and_filterable():
+    _, client = make_client(listing_count=100)
+    data = client.get("/market/listings", params={"limit": 1, "sort_by": "price_asc"}).json()
+    assert data[0]["bonuses"][1] == {
+        "attr_id": 72, "attr_value": 1, "bonus_name": "Durchschn. Schaden 1%", "bonus_value": "1",
+    }
+
+    data = client.get("/market/listings", params=[("bonus", "72:10"), ("bonus", "73"), ("limit", 100)]).json()
+    assert len(data) == 10 and all(row["bonuses"][1]["attr_value"] == 10 for row in data)
+    assert client.get("/market/listings", params={"bonus": "99"}).json() == []
+    assert client.get("/market/listings", params={"bonus": "x"}).status_code == 400
+
+
+def test_item_names_are_localized_at_read_time():
+    engine, client = make_client(listing_count=20)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE items SET vnum = id + 100"))
+        conn.execute(text("INSERT INTO item_names (lang, vnum, name) SELECT 'tr', vnum, 'Kılıç ' || id FROM items"))
+
+    params = {"limit": 1, "sort_by": "price_asc"}
+    assert client.get("/market/listings", params=params).json()[0]["item"]["name"] == "Item0"
+    data = client.get("/market/listings", params=dict(params, lang="tr")).json()
+    assert data[0]["item"]["name"] == "Kılıç 1" and data[0]["item"]["vnum"] == 101
+    assert client.get("/market/listings", params=params).json()[0]["item"]["name"] == "Item0"
+
+    data = client.get("/market/listings", params={"lang": "tr", "item_name": "kilic 3"}).json()
+    assert [row["item"]["name"] for row in data] == ["Kılıç 3"]
+    assert client.get("/market/listings", params={"lang": "xx"}).status_code == 400
+
+    with engine.connect() as conn:
+        cursor = conn.connection.cursor()
+        assert vnum_names.ingest_name(cursor, "tr", "Kılıç 3") == "Item2"
+        assert vnum_names.localized_names(cursor, "tr", [103, 999]) == {103: "Kılıç 3"}
+
+
+def test_cursor_pages_cover_ties_exactly_once():
+    engine, client = make_client(listing_count=100)
+    with engine.begin() as conn:
+        # Only 7 distinct prices and a single seen_at: every page boundary falls inside a tie
+        conn.execute(text("UPDATE listings SET total_price_yang = 1000 + id % 7, seen_at = '2026-10-17 12:00:00'"))
+
+    for sort_by in ("newest", "price_asc", "price_desc", "id"):
+        expected = [row["id"] for row in client.get("/market/listings", params={"limit": 100, "sort_by": sort_by}).json()]
+        seen = []
+        params = {"limit": 9, "sort_by": sort_by}
+        while True:
+            response = client.get("/market/listings", params=params)
+            seen += [row["id"] for row in response.json()]
+            if "X-Next-Cursor" not in response.headers:
+                break
+            params["cursor"] = response.headers["X-Next-Cursor"]
+        assert seen == expected and len(set(seen)) == 100, sort_by
+
+
+def test_invalid_cursors_are_rejected():
+    _, client = make_client(listing_count=20)
+    cursor = client.get("/market/listings", params={"limit": 5, "sort_by": "price_asc"}).headers["X-Next-Cursor"]
+
+    def encode(raw):
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    for bad in ("!!!", "Zm9v", encode(b"\xff\xfe"), encode(b"[1]"), encode(b'["price_asc", 1000, "x"]'), cursor[:-3]):
+        response = client.get("/market/listings", params={"sort_by": "price_asc", "cursor": bad})
+        assert response.status_code == 400, bad
+
+    response = client.get("/market/listings", params={"sort_by": "price_desc", "cursor": cursor})
+    assert response.status_code == 400 and "different sort order" in response.json()["detail"]
+    assert client.get("/market/listings", params={"sort_by": "price_asc", "cursor": cursor}).status_code == 200
+
+
+if __name__ == "__main__":
+    test_listings_page_uses_constant_number_of_queries()
+    test_bonuses_are_rendered_and_filterable()
+    test_item_names_are_localized_at_read_time()
+    test_cursor_pages_cover_ties_exactly_once()
+    test_invalid_cursors_are_rejected()
+    print("OK")
@@ -0,0 +1,117 @@
+"""
+Tests for the columnar market snapshot: round trip through the file format,
+version checks, and that the scheduler's alert prices match the SQL path and
+stay within each watch row's server.
+
+Run with: python -m pytest test_market_snapshot.py
+"""
+import asyncio
+import os
+import sqlite3
+import struct
+
+import pytest
+
+from backend import columnar, market_snapshot, price_stats, scheduler, scraper, telegram_bot
+from backend.normalize import Listing
+
+
+def test_round_trip(tmp_path):
+    listings = [(7, "Alice", 2, 150, False), (7, "Bob", 1, 90, False), (9, "Alice", 5, 1_000_000_000_000, False),
+                (9, "Fake", 1, 1, False), (9, "Bait", 1, 2, True)]
+    path = market_snapshot.write_snapshot("Test Server", listings, {7: "Sword+9", 9: "Kılıç"},
+                                          "2026-01-01T00:00:00", str(tmp_path))
+
+    snapshot = market_snapshot.MarketSnapshot(path)
+    assert snapshot.server == "Test Server" and len(snapshot) == 5
+    assert snapshot.item_id.tolist() == [7, 7, 9, 9, 9]
+    assert snapshot.unit_price.tolist() == [150, 90, 1_000_000_000_000, 1, 2]
+    assert [snapshot.sellers[i] for i in snapshot.seller_id] == ["Alice", "Bob", "Alice", "Fake", "Bait"]
+    assert snapshot.outlier.tolist() == [0, 0, 0, 0, 1]
+    assert snapshot.item_names == {7: "Sword+9", 9: "Kılıç"}
+    for name, _ in market_snapshot.COLUMNS:
+        assert getattr(snapshot, name).ctypes.data % columnar.ALIGNMENT == 0
+
+    assert snapshot.unit_prices([9], {"Fake"}).tolist() == [1_000_000_000_000]
+    assert snapshot.unit_prices([9], {"Fake"}, include_outliers=True).tolist() == [1_000_000_000_000, 2]
+    assert market_snapshot.load_snapshot("Test Server", str(tmp_path)) is \
+        market_snapshot.load_snapshot("Test Server", str(tmp_path))
+
+
+def test_similar_server_names_get_their_own_files(tmp_path):
+    names = ["Kılıç", "Kılıc", "Test Server", "Test_Server", "Test-Server", "Tést Server", "../Alpha"]
+    paths = {market_snapshot.snapshot_path(name, str(tmp_path)) for name in names}
+    assert len(paths) == len(names)
+    assert all(os.path.dirname(path) == str(tmp_path) for path in paths)
+
+    for index, name in enumerate(names):
+        market_snapshot.write_snapshot(name, [(1, "A", 1, index + 1, False)], {1: "Sword"}, "2026-01-01T00:00:00",
+                                       str(tmp_path))
+    for index, name in enumerate(names):
+        snapshot = market_snapshot.load_snapshot(name, str(tmp_path))
+        assert snapshot.server == name and snapshot.unit_price.tolist() == [index + 1]
+
+
+def test_empty_snapshot_and_version_check(tmp_path):
+    path = market_snapshot.write_snapshot("Empty", [], {}, "2026-01-01T00:00:00", str(tmp_path))
+    snapshot = market_snapshot.MarketSnapshot(path)
+    assert len(snapshot.unit_prices()) == 0 and price_stats.summarize(snapshot.unit_prices()) is None
+
+    with open(path, "r+b") as f:
+        f.seek(8)
+        f.write(struct.pack("<I", market_snapshot.FORMAT_VERSION + 1))
+    with pytest.raises(market_snapshot.SnapshotFormatError):
+        market_snapshot.MarketSnapshot(path)
+    assert market_snapshot.load_snapshot("Empty", str(tmp_path)) is None
+
+
+def test_scheduler_prices_use_snapshots(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(market_snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    scraper.init_db()
+
+    def listing(name, seller, price):
+        return Listing(name, seller, 1, 0, price, price, ())
+
+    asyncio.run(scraper.save_to_db_global({"Schwert+9": [listing("Schwert+9", "A", 300), listing("Schwert+9", "B", 100)]}, "One"))
+    asyncio.run(scraper.save_to_db_global({"Schwert+8": [listing("Schwert+8", "C", 200)]}, "Two"))
+
+    watches = [("schwert", "One"), ("schwert", "Two"), ("schwert", "Three")]
+    with scheduler.TickContext(scraper.DB_PATH) as tick:
+        from_snapshots = scheduler.get_prices_for_queries(tick, watches)
+        monkeypatch.setattr(market_snapshot, "load_snapshot", lambda name: None)
+        from_sql = scheduler.get_prices_for_queries(tick, watches)
+    assert from_snapshots == from_sql == {
+        ("schwert", "One"): {"min": 100, "avg_bottom20": 100, "avg": 200},
+        ("schwert", "Two"): {"min": 200, "avg_bottom20": 200, "avg": 200},
+        ("schwert", "Three"): None,
+    }
+
+
+def test_alerts_only_see_their_own_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(scheduler, "DB_PATH", scraper.DB_PATH)
+    monkeypatch.setattr(market_snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    scraper.init_db()
+    scheduler.ensure_tables()
+    sent = []
+    monkeypatch.setattr(telegram_bot, "send_telegram_message_sync", lambda token, chat_id, msg: sent.append(msg))
+
+    def listing(price):
+        return Listing("Schwert+9", "A", 1, 0, price, price, ())
+
+    asyncio.run(scraper.save_to_db_global({"Schwert+9": [listing(100)]}, "One"))
+    asyncio.run(scraper.save_to_db_global({"Schwert+9": [listing(900)]}, "Two"))
+    conn = sqlite3.connect(scraper.DB_PATH)
+    conn.executescript("""
+        INSERT INTO telegram_settings (bot_token, chat_id) VALUES ('token', 'chat');
+        INSERT INTO watchlist (id, query, server_name) VALUES (1, 'schwert', 'One'), (2, 'schwert', 'Two');
+        INSERT INTO price_alerts (watchlist_id, price_threshold, direction) VALUES (1, 500, 'below'), (2, 500, 'below');
+    """)
+    conn.commit()
+
+    with scheduler.TickContext(scraper.DB_PATH) as tick:
+        scheduler.check_all_alerts(tick)
+    assert len(sent) == 1
+    triggered = conn.execute("SELECT watchlist_id FROM price_alerts WHERE last_triggered_at IS NOT NULL").fetchall()
+    assert triggered == [(1,)]
@@ -0,0 +1,102 @@
+"""
+Tests for raw store-dump normalization, inline and in the process pool, and
+for the incremental dump parser.
+
+Run with: python -m pytest test_normalize.py
+"""
+import asyncio
+import json
+
+import pytest
+
+from backend import normalize, scraper
+from backend.vnum_names import NameTable
+
+ITEM_NAMES = NameTable([(11, "Schwert+1"), (12, "Schwert+2")])
+RAW_ITEMS = [
+    {"vnum": 11, "seller": "Alice", "quantity": 2, "yangPrice": 500, "wonPrice": 1, "attrs": [[72, 15], [0, 0]]},
+    {"vnum": 12, "seller": "Bob},{\"vnum\":", "quantity": 1, "yangPrice": 0, "wonPrice": 0},
+    {"vnum": 99, "name": "Mystery", "seller": None, "quantity": 0, "yangPrice": 70},
+] * 50
+
+
+async def byte_chunks(data, size=7):
+    for offset in range(0, len(data), size):
+        yield data[offset:offset + size]
+
+
+async def as_stream(items):
+    for item in items:
+        yield item
+
+
+def test_normalize_item():
+    listing = normalize.normalize_item(RAW_ITEMS[0], ITEM_NAMES)
+    assert listing == ("Schwert+1", "Alice", 2, 1, 500, 100_000_500, ((72, 15),), 11)
+    assert listing.unit_price == 50_000_250
+    assert normalize.normalize_item(RAW_ITEMS[1], ITEM_NAMES) is None
+    assert normalize.normalize_item(RAW_ITEMS[2], ITEM_NAMES)[:3] == ("Mystery", "Unknown", 1)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_dump_pieces_match_inline(monkeypatch, workers):
+    # A cut after every chunk, so some fall inside the seller name containing "},{"
+    monkeypatch.setattr(normalize, "NORMALIZE_PIECE_BYTES", 1)
+    data = json.dumps(RAW_ITEMS, separators=(",", ":")).encode()
+    expected = asyncio.run(normalize.normalize_stream(as_stream(RAW_ITEMS), ITEM_NAMES))
+    try:
+        assert asyncio.run(normalize.normalize_dump(byte_chunks(data), ITEM_NAMES, workers)) == expected
+    finally:
+        normalize.shutdown()
+    assert len(expected) == 100
+
+
+def test_truncated_dump_is_rejected():
+    data = json.dumps(RAW_ITEMS).encode()[:-20]
+    with pytest.raises(ValueError):
+        asyncio.run(normalize.normalize_dump(byte_chunks(data, 4096), ITEM_NAMES, 1))
+
+
+def test_pool_is_reused_for_the_same_names():
+    try:
+        pool = normalize.get_pool(ITEM_NAMES, 2)
+        assert normalize.get_pool(NameTable(ITEM_NAMES.items()), 2) is pool
+        assert normalize.get_pool(NameTable([(11, "Sword+1")]), 2) is not pool
+    finally:
+        normalize.shutdown()
+
+
+def parse_in_pieces(data, cuts):
+    parser = scraper.JSONArrayStream()
+    items = []
+    for start, end in zip([0] + cuts, cuts + [len(data)]):
+        items.extend(parser.feed(data[start:end]))
+    parser.close()
+    return items
+
+
+def test_stream_parser_survives_any_split():
+    raw = [
+        {"seller": "Kılıç \"Usta\" \\ ä\n", "vnum": 11, "yangPrice": -12.5e3, "attrs": [[72, 15]]},
+        {"name": "日本 😀", "ok": True, "none": None, "nested": {"a": [1, 2, {"b": False}]}},
+    ]
+    # Raw UTF-8 characters and the same values as \uXXXX escapes (incl. a surrogate pair)
+    data = b"[%s,%s]" % (json.dumps(raw, ensure_ascii=False).encode()[1:-1], json.dumps(raw).encode()[1:-1])
+    raw = raw * 2
+    # Every single cut position: inside strings, escapes, multi-byte characters and numbers
+    for cut in range(1, len(data)):
+        assert parse_in_pieces(data, [cut]) == raw
+    assert parse_in_pieces(data, list(range(1, len(data)))) == raw
+
+
+def test_stream_parser_rejects_malformed_element():
+    good = json.dumps(RAW_ITEMS[:1]).encode()[1:-1]
+    data = b"[" + good + b',{"vnum": 12, "seller": tru},' + b",".join([good] * 500) + b"]"
+    parser = scraper.JSONArrayStream()
+    with pytest.raises(ValueError, match="Malformed"):
+        for start in range(0, len(data), 64):
+            parser.feed(data[start:start + 64])
+    assert start < 2 * len(good) + 64  # raised right away, not after buffering the rest
+
+    with pytest.raises(ValueError, match="Expected ','"):
+        parse_in_pieces(b"[" + good + b" " + good + b"]", [])
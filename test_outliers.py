@@ -0,0 +1,117 @@
+"""
+Tests for the ingestion-time outlier verdicts and their use by aggregates,
+rankings and alert prices.
+
+Run with: python -m pytest test_outliers.py
+"""
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+from backend import market_snapshot, outliers, scheduler, scraper
+from backend.normalize import Listing
+
+
+def listing(name, seller, price):
+    return Listing(name, seller, 1, 0, price, price, ())
+
+
+def market(bait_price, extra=()):
+    sellers = [listing("Sword", f"Seller{i}", 1000 + i * 10) for i in range(10)]
+    return {"Sword": sellers + [listing("Sword", "Baiter", bait_price)], **dict(extra)}
+
+
+def setup_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(market_snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    scraper.init_db()
+    return sqlite3.connect(scraper.DB_PATH)
+
+
+def test_price_outliers_are_stored_and_skipped(tmp_path, monkeypatch):
+    conn = setup_db(tmp_path, monkeypatch)
+    asyncio.run(scraper.save_to_db_global(market(1), "Alpha"))
+
+    verdicts = dict(conn.execute("SELECT seller_name, outlier_reason FROM listings").fetchall())
+    assert verdicts["Baiter"] == outliers.PRICE
+    assert all(reason is None for seller, reason in verdicts.items() if seller != "Baiter")
+    assert conn.execute("SELECT COUNT(*) FROM listing_snapshots WHERE outlier_reason = 'price'").fetchone()[0] == 1
+
+    assert conn.execute("SELECT min_price, listing_count FROM item_price_aggregates").fetchone() == (1000, 10)
+    assert conn.execute("SELECT min_unit_price FROM server_item_stats").fetchone()[0] == 1000
+    with scheduler.TickContext(scraper.DB_PATH) as tick:
+        assert scheduler.get_prices_for_queries(tick, [("sword", "Alpha")])[("sword", "Alpha")]["min"] == 1000
+
+
+def baiter_verdicts(conn):
+    return dict(conn.execute("""
+        SELECT items.name, outlier_reason FROM listings JOIN items ON items.id = listings.item_id
+        WHERE seller_name = 'Baiter'
+    """).fetchall())
+
+
+def test_repeat_offender_becomes_suspect(tmp_path, monkeypatch):
+    conn = setup_db(tmp_path, monkeypatch)
+    for price in range(1, outliers.SUSPECT_MIN_OUTLIERS + 1):
+        asyncio.run(scraper.save_to_db_global(market(price), "Alpha"))
+
+    # A normally priced listing of the same seller is now excluded as well
+    asyncio.run(scraper.save_to_db_global(market(1, {"Shield": [listing("Shield", "Baiter", 500)]}), "Alpha"))
+    assert baiter_verdicts(conn) == {"Sword": outliers.PRICE, "Shield": outliers.SELLER}
+
+    # The history decays: weeks later the seller is no longer a suspect
+    later = (datetime.now() + timedelta(days=8 * outliers.SELLER_HISTORY_HALF_LIFE_DAYS)).isoformat()
+    assert outliers.suspect_sellers(conn.cursor(), "Alpha") == {"Baiter"}
+    assert outliers.suspect_sellers(conn.cursor(), "Alpha", later) == set()
+
+
+def test_persistent_bait_listing_counts_once(tmp_path, monkeypatch):
+    conn = setup_db(tmp_path, monkeypatch)
+    for _ in range(outliers.SUSPECT_MIN_OUTLIERS + 2):
+        asyncio.run(scraper.save_to_db_global(market(1), "Alpha"))
+
+    assert conn.execute("SELECT listing_count, outlier_count FROM seller_outlier_stats "
+                        "WHERE seller_name = 'Baiter'").fetchone() == (1, 1)
+    asyncio.run(scraper.save_to_db_global(market(1, {"Shield": [listing("Shield", "Baiter", 500)]}), "Alpha"))
+    assert baiter_verdicts(conn) == {"Sword": outliers.PRICE, "Shield": None}
+
+
+def test_undercut_is_kept_for_alerts(tmp_path, monkeypatch):
+    conn = setup_db(tmp_path, monkeypatch)
+    asyncio.run(scraper.save_to_db_global(market(600), "Alpha"))
+
+    assert baiter_verdicts(conn) == {"Sword": None}
+    with scheduler.TickContext(scraper.DB_PATH) as tick:
+        _, prices = scheduler.get_live_prices(tick, "Alpha", set())
+        assert 600 in prices.tolist()
+        assert scheduler.get_prices_for_queries(tick, [("sword", "Alpha")])[("sword", "Alpha")]["min"] == 600
+
+
+def test_fake_sellers_override(tmp_path, monkeypatch):
+    conn = setup_db(tmp_path, monkeypatch)
+    conn.execute("INSERT INTO fake_sellers (seller_name) VALUES ('Seller3')")
+    conn.commit()
+    asyncio.run(scraper.save_to_db_global(market(1005), "Alpha"))
+    reasons = dict(conn.execute("SELECT seller_name, outlier_reason FROM listings").fetchall())
+    assert reasons["Seller3"] == outliers.FAKE and reasons["Baiter"] is None
+
+    outliers.apply_fake_seller(conn.cursor(), "Seller3", False)
+    outliers.apply_fake_seller(conn.cursor(), "Seller4", True)
+    reasons = dict(conn.execute("SELECT seller_name, outlier_reason FROM listings").fetchall())
+    assert reasons["Seller3"] is None and reasons["Seller4"] == outliers.FAKE
+
+
+def test_old_database_gets_verdict_columns(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "DB_PATH", str(tmp_path / "old.db"))
+    conn = sqlite3.connect(scraper.DB_PATH)
+    conn.execute("""
+        CREATE TABLE listings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, server_id INTEGER, item_id INTEGER, seller_name TEXT,
+            quantity INTEGER, price_won INTEGER DEFAULT 0, price_yang INTEGER DEFAULT 0,
+            total_price_yang BIGINT, seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    scraper.init_db()
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(listings)").fetchall()}
+    assert "outlier_reason" in columns
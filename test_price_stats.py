@@ -0,0 +1,65 @@
+"""
+Tests for the vectorized price statistics against straightforward list code.
+
+Run with: python -m pytest test_price_stats.py
+"""
+import math
+
+import numpy as np
+
+from backend import price_stats
+
+
+def reference(prices):
+    prices = sorted(prices)
+    total = len(prices)
+    bottom = max(1, int(total * 0.2))
+    trim = int(total * 0.1)
+
+    def rank(pct):
+        return prices[max(0, math.ceil(pct / 100 * total) - 1)]
+
+    return {
+        "count": total, "min": prices[0], "max": prices[-1],
+        "mean": sum(prices) // total,
+        "bottom_mean": sum(prices[:bottom]) // bottom,
+        "p10": rank(10), "median": rank(50), "p90": rank(90),
+        "trimmed_mean": sum(prices[trim:total - trim]) // (total - 2 * trim),
+    }
+
+
+def test_group_stats_match_reference():
+    rng = np.random.default_rng(7)
+    group_count = 50
+    groups = rng.integers(0, group_count, 5000)
+    groups[groups == 13] = 12  # an empty group
+    prices = rng.integers(1, 2_000_000_000, len(groups))
+
+    rows = price_stats.rows(price_stats.group_stats(prices, groups, group_count))
+    for group in range(group_count):
+        members = prices[groups == group].tolist()
+        assert rows[group] == (reference(members) if members else None)
+
+
+def test_small_groups_and_summarize():
+    assert price_stats.summarize([]) is None
+    assert price_stats.summarize([5]) == reference([5])
+    assert price_stats.summarize([3, 1, 2]) == reference([3, 1, 2])
+
+
+def test_outlier_flags():
+    prices = np.array([100, 102, 98, 101, 99, 1, 100, 5000, 7, 7, 7, 7])
+    groups = np.array([0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1])
+    flags = price_stats.outlier_flags(prices, groups)
+    assert flags.tolist() == [False] * 5 + [True, False, True] + [False] * 4
+
+    # Below the median only prices under low_ratio * median are flagged
+    prices = np.array([100, 102, 98, 101, 99, 60, 100, 5000, 1])
+    flags = price_stats.outlier_flags(prices, np.zeros(len(prices), dtype=np.int64), low_ratio=0.2)
+    assert flags.tolist() == [False] * 7 + [True, True]
+
+
+def test_values_too_wide_for_packed_sort():
+    stats = price_stats.group_stats([2**61 + 5, 2**61, 3], [3, 3, 0], 4)
+    assert stats["min"].tolist() == [3, 0, 0, 2**61]
+    assert stats["max"].tolist() == [3, 0, 0, 2**61 + 5]
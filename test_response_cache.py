@@ -0,0 +1,61 @@
+"""
+Tests for the market response cache: hits within a scrape generation,
+invalidation when the generation changes, ETag / If-None-Match -> 304.
+
+Run with: python -m pytest test_response_cache.py
+"""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend import response_cache
+
+
+def make_client(monkeypatch):
+    state = {"generation": 1, "calls": 0}
+    monkeypatch.setattr(response_cache, "get_scrape_generation", lambda: state["generation"])
+    monkeypatch.setattr(response_cache, "cache", response_cache.LRUCache(2))
+
+    app = FastAPI()
+    app.middleware("http")(response_cache.cache_middleware)
+
+    @app.get("/market/servers")
+    def servers():
+        state["calls"] += 1
+        return [{"name": "Chimera", "calls": state["calls"]}]
+
+    return state, TestClient(app)
+
+
+def test_cached_until_generation_changes(monkeypatch):
+    state, client = make_client(monkeypatch)
+
+    first = client.get("/market/servers")
+    second = client.get("/market/servers")
+    assert first.headers["X-Cache"] == "MISS" and second.headers["X-Cache"] == "HIT"
+    assert second.json() == first.json() and state["calls"] == 1
+    assert second.headers["content-type"] == "application/json"
+
+    state["generation"] = 2
+    third = client.get("/market/servers")
+    assert third.headers["X-Cache"] == "MISS" and third.json()[0]["calls"] == 2
+    assert third.headers["ETag"] != first.headers["ETag"]
+
+
+def test_if_none_match_returns_304(monkeypatch):
+    state, client = make_client(monkeypatch)
+    etag = client.get("/market/servers").headers["ETag"]
+
+    response = client.get("/market/servers", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.content == b""
+
+    state["generation"] = 2
+    assert client.get("/market/servers", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_lru_evicts_oldest_entry():
+    cache = response_cache.LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
@@ -0,0 +1,167 @@
+"""
+Tests for the tiered retention: expired snapshots are deleted in batches and
+old per-scrape price aggregates are rolled up into hourly and daily rows that
+the price history endpoint still weights correctly.
+
+Run with: python -m pytest test_retention.py
+"""
+import sqlite3
+from datetime import datetime, timezone
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import database, market_snapshot, models, price_aggregates, response_cache, retention, scraper
+from backend.routers import market
+
+NOW = datetime(2026, 10, 17, 12, 0)
+
+
+def aggregate(scraped_at, count, avg, bottom, item="Sword"):
+    return ("Alpha", item, scraped_at, count, avg - 50, avg + 50, avg, bottom, avg - 10, avg, avg + 10)
+
+
+def setup_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(market_snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    scraper.init_db()
+    conn = sqlite3.connect(scraper.DB_PATH)
+    conn.executemany(price_aggregates.INSERT_SQL, [
+        aggregate("2026-09-27T05:10:00.000001", 10, 100, 50),   # > 14 days: one row per day
+        aggregate("2026-09-27T18:10:00.000001", 30, 200, 150),
+        aggregate("2026-10-15T10:00:00.000001", 10, 100, 50),   # > 1 day: one row per hour
+        aggregate("2026-10-15T10:10:00.000001", 20, 200, 150),
+        aggregate("2026-10-15T10:20:00.000001", 30, 300, 250),
+        aggregate("2026-10-17T11:00:00.000001", 10, 100, 50),   # recent: untouched
+    ])
+    conn.executemany("""
+        INSERT INTO listing_snapshots (item_name, seller_name, server_name, total_price_yang, unit_price, scraped_at)
+        VALUES ('Sword', ?, 'Alpha', 100, 100, ?)
+    """, [(f"Old{i}", f"2026-10-15T10:{i:02d}:00") for i in range(5)] + [("New", "2026-10-17T11:00:00")])
+    conn.commit()
+    return conn
+
+
+def test_snapshots_expire_and_aggregates_roll_up(tmp_path, monkeypatch):
+    conn = setup_db(tmp_path, monkeypatch)
+    monkeypatch.setattr(retention, "SNAPSHOT_DELETE_BATCH", 2)
+
+    result = retention.apply_retention(conn, NOW)
+    assert result == retention.RetentionResult(snapshots_deleted=5, aggregates_removed=3, complete=True)
+    assert conn.execute("SELECT seller_name FROM listing_snapshots").fetchall() == [("New",)]
+
+    rows = conn.execute("""
+        SELECT scraped_at, listing_count, min_price, avg_price, avg_bottom20_price, scrape_count, bottom_count
+        FROM item_price_aggregates ORDER BY scraped_at
+    """).fetchall()
+    assert rows == [
+        ("2026-09-27T00:00:00", 40, 50, 175, 125, 2, 8),        # (10*100 + 30*200) / 40
+        ("2026-10-15T10:00:00", 60, 50, 233, 183, 3, 12),       # bottom-20%: (2*50 + 4*150 + 6*250) / 12
+        ("2026-10-17T11:00:00.000001", 10, 50, 100, 50, 1, None),
+    ]
+
+    # Nothing left to do; a rebuild only replaces the stretch still covered by snapshots
+    assert retention.apply_retention(conn, NOW) == retention.RetentionResult(0, 0, True)
+    price_aggregates.rebuild_aggregates(conn.cursor())
+    assert [row[0] for row in conn.execute("SELECT scraped_at FROM item_price_aggregates ORDER BY scraped_at")] == [
+        "2026-09-27T00:00:00", "2026-10-15T10:00:00", "2026-10-17T11:00:00",
+    ]
+
+
+def test_retention_resumes_after_time_budget(tmp_path, monkeypatch):
+    conn = setup_db(tmp_path, monkeypatch)
+    assert retention.apply_retention(conn, NOW, max_seconds=0) == retention.RetentionResult(0, 0, False)
+    assert conn.execute("SELECT COUNT(*) FROM listing_snapshots").fetchone()[0] == 6
+
+    assert retention.apply_retention(conn, NOW).complete
+    assert conn.execute("SELECT COUNT(*) FROM item_price_aggregates").fetchone()[0] == 3
+    assert dict(conn.execute("SELECT tier, rolled_until FROM retention_state").fetchall()) == {
+        "hour": "2026-10-15T11:00:00", "day": "2026-09-28T00:00:00",
+    }
+
+
+def price_history_client(cached=False):
+    engine = create_engine(f"sqlite:///{scraper.DB_PATH}")
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    def get_test_db():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app = FastAPI()
+    if cached:
+        app.middleware("http")(response_cache.cache_middleware)
+    app.include_router(market.router)
+    app.dependency_overrides[database.get_db] = get_test_db
+    return TestClient(app)
+
+
+def test_price_history_weights_rolled_up_rows(tmp_path, monkeypatch):
+    conn = setup_db(tmp_path, monkeypatch)
+    retention.apply_retention(conn, NOW)
+
+    points = price_history_client().get("/market/stats/price-history", params={"item_name": "Sword", "bucket": "day"}).json()
+    assert [(p["timestamp"][:10], p["avg_unit_price"], p["min_unit_price"], p["total_listings"]) for p in points] == [
+        ("2026-09-27", 175, 50, 20),   # 40 listings over 2 scrapes
+        ("2026-10-15", 233, 50, 20),   # 60 listings over 3 scrapes
+        ("2026-10-17", 100, 50, 10),
+    ]
+
+
+def test_price_history_accepts_utc_range(tmp_path, monkeypatch):
+    conn = setup_db(tmp_path, monkeypatch)
+    client = price_history_client()
+    conn.executemany("""
+        INSERT INTO price_history (item_name, avg_unit_price, min_unit_price, total_listings, timestamp)
+        VALUES ('Sword', ?, ?, 5, ?)
+    """, [(90, 40, "2026-09-20 10:00:00.000000"), (95, 45, "2026-09-25 10:00:00.000000")])
+    conn.commit()
+
+    def utc(*args):
+        # The same moment as a local wall-clock time, sent with a "Z" suffix
+        return datetime(*args).astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+    response = client.get("/market/stats/price-history", params={
+        "item_name": "Sword", "from": utc(2026, 9, 22), "to": utc(2026, 10, 15, 10, 15),
+    })
+    assert response.status_code == 200
+    assert [p["timestamp"][:16] for p in response.json()] == [
+        "2026-09-25T10:00", "2026-09-27T05:10", "2026-09-27T18:10", "2026-10-15T10:00", "2026-10-15T10:10",
+    ]
+
+
+def test_price_history_per_server(tmp_path, monkeypatch):
+    conn = setup_db(tmp_path, monkeypatch)
+    conn.execute(price_aggregates.INSERT_SQL, ("Beta",) + aggregate("2026-10-17T11:03:00.000001", 10, 900, 800)[1:])
+    conn.commit()
+    client = price_history_client()
+
+    def series(**params):
+        points = client.get("/market/stats/price-history", params={"item_name": "Sword", **params}).json()
+        return [(p["timestamp"][:16], p["avg_unit_price"]) for p in points if p["timestamp"] >= "2026-10-17"]
+
+    assert series(server="Alpha") == [("2026-10-17T11:00", 100)]
+    assert series(server="Beta") == [("2026-10-17T11:03", 900)]
+    assert series() == [("2026-10-17T11:00", 100), ("2026-10-17T11:03", 900)]
+
+
+def test_rollup_invalidates_cached_price_history(tmp_path, monkeypatch):
+    conn = setup_db(tmp_path, monkeypatch)
+    monkeypatch.setattr(response_cache, "cache", response_cache.LRUCache(8))
+    monkeypatch.setattr(response_cache, "get_scrape_generation", lambda: sqlite3.connect(scraper.DB_PATH).execute(
+        "SELECT COALESCE(MAX(generation), 0) FROM scrape_state").fetchone()[0])
+    client = price_history_client(cached=True)
+    params = {"item_name": "Sword", "bucket": "hour"}
+
+    before = client.get("/market/stats/price-history", params=params)
+    retention.apply_retention(conn, NOW)
+    after = client.get("/market/stats/price-history", params=params, headers={"If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200 and after.headers["X-Cache"] == "MISS"
+    assert after.headers["ETag"] != before.headers["ETag"]
+    assert len(after.json()) < len(before.json())
@@ -0,0 +1,94 @@
+"""
+Tests for the per-server item ranking maintained by save_to_db_global, and
+for the rollback of a failed ingest.
+
+Run with: python -m pytest test_top_items.py
+"""
+import asyncio
+import sqlite3
+
+import pytest
+
+from backend import scraper, top_items, market_snapshot
+from backend.normalize import Listing
+
+
+def listing(name, seller, unit_price, quantity=1):
+    total = unit_price * quantity
+    return Listing(name, seller, quantity, 0, total, total, ())
+
+
+def test_rankings_follow_scrapes(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(market_snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    scraper.init_db()
+
+    first = {
+        "Sword": [listing("Sword", "A", 100), listing("Sword", "B", 120), listing("Sword", "C", 130)],
+        "Shield": [listing("Shield", "A", 50)],
+    }
+    second = {
+        "Sword": [listing("Sword", "A", 90), listing("Sword", "B", 120)],
+        "Shield": [listing("Shield", "A", 25), listing("Shield", "Fake", 1)],
+    }
+    asyncio.run(scraper.save_to_db_global(first, "Alpha"))
+    asyncio.run(scraper.save_to_db_global({"Shield": [listing("Shield", "X", 10)] * 1}, "Beta"))
+
+    cursor = sqlite3.connect(scraper.DB_PATH).cursor()
+    assert [row["name"] for row in top_items.top_items(cursor, "volume", "Alpha")] == ["Sword", "Shield"]
+    assert top_items.top_items(cursor, "volume", "Beta")[0]["count"] == 1
+    assert top_items.top_items(cursor, "volume")[0] == {
+        "name": "Sword", "vnum": None, "count": 3, "total_quantity": 3,
+        "min_unit_price": 100, "prev_min_unit_price": None, "price_drop_pct": None,
+    }
+
+    cursor.execute("INSERT INTO fake_sellers (seller_name) VALUES ('Fake')")
+    cursor.connection.commit()
+    asyncio.run(scraper.save_to_db_global(second, "Alpha"))
+
+    drops = top_items.top_items(cursor, "price_drop", "Alpha")
+    assert [(row["name"], row["price_drop_pct"]) for row in drops] == [("Shield", 50.0), ("Sword", 10.0)]
+    assert [row["name"] for row in top_items.top_items(cursor, "cheapest", "Alpha")] == ["Shield", "Sword"]
+    assert top_items.top_items(cursor, "cheapest", "Alpha")[0]["min_unit_price"] == 25
+
+
+def test_failed_ingest_rolls_back_and_releases_the_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(market_snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    scraper.init_db()
+    market = {"Sword": [listing("Sword", "A", 100)]}
+
+    def fail(*args):
+        raise RuntimeError("boom")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(top_items, "write_server_stats", fail)
+        with pytest.raises(RuntimeError):
+            asyncio.run(scraper.save_to_db_global(market, "Alpha"))
+
+    conn = sqlite3.connect(scraper.DB_PATH, timeout=0)
+    assert conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0] == 0
+    conn.execute("BEGIN IMMEDIATE")  # the write lock is free again
+    conn.rollback()
+    asyncio.run(scraper.save_to_db_global(market, "Alpha"))
+    assert conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0] == 1
+
+
+def test_price_drop_over_all_servers_stays_per_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(market_snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    scraper.init_db()
+
+    # Alpha: Sword 100 -> 100, Shield 40 -> 32; Beta: Sword 200 -> 150, Shield 50 -> 50.
+    # Mixing the servers' minimums would hide the Sword drop on Beta.
+    for alpha, beta in (((100, 40), (200, 50)), ((100, 32), (150, 50))):
+        for server, (sword, shield) in (("Alpha", alpha), ("Beta", beta)):
+            asyncio.run(scraper.save_to_db_global({
+                "Sword": [listing("Sword", "A", sword)],
+                "Shield": [listing("Shield", "A", shield)],
+            }, server))
+
+    cursor = sqlite3.connect(scraper.DB_PATH).cursor()
+    drops = top_items.top_items(cursor, "price_drop")
+    assert [(row["name"], row["prev_min_unit_price"], row["min_unit_price"], row["price_drop_pct"])
+            for row in drops] == [("Sword", 200, 150, 25.0), ("Shield", 40, 32, 20.0)]